@@ -0,0 +1,174 @@
+"""
+HTML-to-Markdown extraction benchmark: speed and output size of each ti_extract backend.
+
+Runs every backend over a corpus of pages and reports the time per page, throughput, and the
+tokens of the Markdown the LLM prompts would carry, against the legacy path (html.parser +
+markdownify over all of <main>/<body>). It also counts fenced code blocks and table rows in each
+output, so pruning that drops real content shows up next to the speed numbers.
+
+The default corpus is generated: vendor-blog style pages with the usual weight (inline scripts and
+JSON state, mega-menu navigation, cookie banner, share bar, related posts, comments, newsletter
+form, footer) around a report with code blocks and IOC tables, plus plain pages without <main>,
+<article> or <h1> whose <html>, <body> or content wrapper has a class that looks like boilerplate
+("js menu-closed", "has-sidebar", "with-comments"). Pages saved from a browser
+(File > Save Page As..., HTML only) or with curl can be benchmarked with --pages.
+
+Usage:
+    python benchmarks/bench_extract.py [--pages 12] [--repeat 3]
+    python benchmarks/bench_extract.py --pages-dir saved_pages/ [--backends lxml legacy] [--json results.json]
+    python benchmarks/bench_extract.py --save-corpus corpus/   # write the generated pages
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ti_extract # noqa: E402
+import ti_tokens # noqa: E402
+
+TOKEN_MODEL = "gpt-4o-2024-08-06" # Tokenizer used to size the output (the app's default OpenAI model)
+
+# --- Generated Corpus ---
+
+def _links(rng, count, prefix):
+    return "".join(f'<li class="menu-item"><a href="/{prefix}/{i}">{prefix.title()} item {rng.randint(1, 999)}</a></li>' for i in range(count))
+
+def vendor_page(index, sections=8):
+    """A heavy vendor-blog page around a threat report; `index` varies the content."""
+    rng = random.Random(index)
+    state = json.dumps({"props": {"posts": [{"id": i, "title": f"Post {i}", "excerpt": "x" * 200} for i in range(150)]}})
+    head = ("<head><meta charset='utf-8'><title>Threat report</title>"
+            + "".join(f"<link rel='stylesheet' href='/css/{i}.css'>" for i in range(12))
+            + "<style>" + ".c{color:red}" * 2000 + "</style>"
+            + "<script>window.__STATE__=" + state + "</script>"
+            + "".join(f"<script src='/js/{i}.js'></script>" for i in range(15)) + "</head>")
+    header = ('<header class="site-header"><div class="logo">Vendor</div><nav class="mega-menu"><ul>'
+              + _links(rng, 180, "products") + "</ul></nav>"
+              + '<form role="search"><input type="text" name="q"><button>Search</button></form></header>')
+    cookie = '<div id="cookie-consent" class="cookie-banner"><p>' + "We use cookies to improve your experience. " * 8 + "</p><button>Accept</button></div>"
+    share = '<div class="social-share">' + "".join(f'<a href="#" class="share-{n}">{n}</a>' for n in ("x", "linkedin", "facebook", "email")) + "</div>"
+
+    body = [f"<h1>Campaign report {index}: intrusions against energy and government networks</h1>",
+            '<div class="breadcrumbs"><a href="/">Home</a> / <a href="/blog">Blog</a> / Research</div>', share]
+    for section in range(sections):
+        body.append(f"<h2>Section {section + 1}: observed activity</h2>")
+        for _ in range(rng.randint(3, 6)):
+            body.append(f"<p>The actor used spearphishing (T1566.001) and DLL side-loading (T1574.002) to deploy a loader that "
+                        f"contacted 185.220.{rng.randint(0, 255)}[.]{rng.randint(1, 254)}; later stages dumped LSASS memory "
+                        f"(T1003.001) and exfiltrated data over the command-and-control channel (T1041). "
+                        f"<a href='/kb/{rng.randint(1, 99)}'>Related advisory</a>.</p>")
+        if section % 3 == 0:
+            body.append('<pre class="highlight"><code class="language-powershell">'
+                        + "\n".join(f"$s{i} = [Convert]::FromBase64String('{'A' * rng.randint(20, 60)}')" for i in range(8))
+                        + "</code></pre>")
+        if section % 4 == 1:
+            rows = "".join(f"<tr><td>ioc-{index}-{r}.example[.]net</td><td>Domain</td><td>C2</td></tr>" for r in range(10))
+            body.append(f"<table><thead><tr><th>Indicator</th><th>Type</th><th>Role</th></tr></thead><tbody>{rows}</tbody></table>")
+        if section == sections // 2:
+            body.append('<div class="newsletter-signup"><h3>Get our research</h3><form><input type="email"><button>Subscribe</button></form></div>')
+    related = ('<section class="related-posts"><h2>Related posts</h2>'
+               + "".join(f'<div class="card"><h3>Post {i}</h3><p>{"Excerpt of another post. " * 6}</p></div>' for i in range(12)) + "</section>")
+    comments = ('<section id="comments" class="comments"><h2>Comments</h2>'
+                + "".join(f'<div class="comment"><p>{"Great write-up, thanks for sharing. " * 3}</p></div>' for _ in range(15)) + "</section>")
+    footer = '<footer class="site-footer"><ul>' + _links(rng, 120, "footer") + "</ul><p>Copyright Vendor</p></footer>"
+    article = f'<main><article class="post">{"".join(body)}</article>{related}{comments}</main>'
+    return f"<!DOCTYPE html><html>{head}<body>{cookie}{header}{article}<aside class='sidebar'>{_links(rng, 40, 'tags')}</aside>{footer}</body></html>"
+
+# Plain pages whose structural elements carry marker-like classes: (name, <html> class, <body> class, wrapper class)
+EDGE_LAYOUTS = (
+    ("html-class", "js menu-closed", "", "content"),
+    ("body-class", "", "single-post has-sidebar", "content"),
+    ("wrapper-class", "", "", "post-body with-comments"),
+)
+
+def edge_page(index, html_class, body_class, wrapper_class):
+    """A plain report page with no <main>, <article> or <h1>, classes as given."""
+    rng = random.Random(index)
+    paragraphs = "".join(f"<p>The loader contacted 45.77.{rng.randint(0, 255)}[.]{rng.randint(1, 254)} and persisted through a "
+                         f"scheduled task (T1053.005) before dumping credentials (T1003.001).</p>" for _ in range(12))
+    return (f'<!DOCTYPE html><html class="{html_class}"><head><meta charset="utf-8"><title>Report</title></head>'
+            f'<body class="{body_class}"><div class="{wrapper_class}"><h2>Intrusion report {index}</h2>{paragraphs}</div></body></html>')
+
+def load_corpus(args):
+    """Returns [(name, html bytes)]."""
+    if args.pages_dir:
+        paths = sorted(glob.glob(os.path.join(args.pages_dir, "*.htm*")))
+        if not paths:
+            raise SystemExit(f"No .html/.htm files in {args.pages_dir}")
+        corpus = []
+        for path in paths:
+            with open(path, "rb") as f:
+                corpus.append((os.path.basename(path), f.read()))
+        return corpus
+    corpus = [(f"generated-{index}.html", vendor_page(index, sections=6 + index % 6).encode("utf-8")) for index in range(args.pages)]
+    return corpus + [(f"edge-{name}.html", edge_page(index, *classes).encode("utf-8"))
+                     for index, (name, *classes) in enumerate(EDGE_LAYOUTS)]
+
+# --- Measurement ---
+
+def structure(markdown):
+    """Fenced code blocks and Markdown table rows in an output."""
+    return {"empty": int(not markdown.strip()), "code_blocks": markdown.count("```") // 2, "table_rows": len(re.findall(r"^\|.*\|\s*$", markdown, re.MULTILINE))}
+
+def measure(backend, corpus, repeat):
+    seconds, tokens, empty, code_blocks, table_rows = [], 0, 0, 0, 0
+    for _, html in corpus:
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            markdown = ti_extract.html_to_markdown(html, backend)
+            runs.append(time.perf_counter() - started)
+        seconds.append(min(runs))
+        tokens += ti_tokens.count_tokens(markdown, TOKEN_MODEL)
+        found = structure(markdown)
+        empty += found["empty"]
+        code_blocks += found["code_blocks"]
+        table_rows += found["table_rows"]
+    return {"ms_per_page_median": statistics.median(seconds) * 1000, "ms_per_page_mean": statistics.mean(seconds) * 1000,
+            "total_seconds": sum(seconds), "tokens": tokens, "empty": empty, "code_blocks": code_blocks, "table_rows": table_rows}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=12, help="Generated pages (ignored with --pages-dir).")
+    parser.add_argument("--pages-dir", help="Directory of saved .html pages to use instead of the generated corpus.")
+    parser.add_argument("--backends", nargs="+", default=ti_extract.available_backends(), choices=ti_extract.BACKENDS)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per page (the fastest is kept).")
+    parser.add_argument("--save-corpus", metavar="DIR", help="Write the generated pages to DIR and exit.")
+    parser.add_argument("--json", metavar="FILE", help="Write the results as JSON.")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args)
+    if args.save_corpus:
+        os.makedirs(args.save_corpus, exist_ok=True)
+        for name, html in corpus:
+            with open(os.path.join(args.save_corpus, name), "wb") as f:
+                f.write(html)
+        print(f"Wrote {len(corpus)} pages to {args.save_corpus}")
+        return
+
+    megabytes = sum(len(html) for _, html in corpus) / 2**20
+    print(f"{len(corpus)} pages, {megabytes:.1f} MB of HTML; default backend here: {ti_extract.default_backend()}\n")
+    results = {backend: measure(backend, corpus, args.repeat) for backend in args.backends}
+    baseline = results.get(ti_extract.BACKEND_LEGACY)
+
+    print(f"{'backend':<13}{'ms/page':>9}{'MB/s':>8}{'speedup':>9}{'tokens':>10}{'vs legacy':>11}{'code':>6}{'rows':>6}{'empty':>7}")
+    for backend, result in results.items():
+        speedup = f"{baseline['total_seconds'] / result['total_seconds']:.1f}x" if baseline else "-"
+        token_change = f"{(result['tokens'] / baseline['tokens'] - 1) * 100:+.0f}%" if baseline and baseline["tokens"] else "-"
+        print(f"{backend:<13}{result['ms_per_page_median']:>9.1f}{megabytes / result['total_seconds']:>8.1f}{speedup:>9}"
+              f"{result['tokens']:>10,}{token_change:>11}{result['code_blocks']:>6}{result['table_rows']:>6}{result['empty']:>7}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"pages": len(corpus), "megabytes": megabytes, "results": results}, f, indent=2)
+        print(f"\nResults saved to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Startup-time benchmark for the Streamlit app and the ti_* modules.
+
+Every measurement runs in a fresh interpreter, so nothing is shared between runs:
+- cold: empty bytecode cache (all modules, including site-packages, are compiled again), like the
+  first session after a deploy or container build;
+- warm: bytecode cache already populated, like any later server restart; median of --repeat runs.
+
+"app" is the set of modules timindmapgpt.py imports at the top level (read from its source), i.e.
+what every new Streamlit server pays before the first page renders. For each target the benchmark
+also lists which heavy optional dependencies got loaded, so an eager import sneaking back in is
+visible even when the timing noise hides it.
+
+Usage:
+    python benchmarks/bench_import_time.py [--repeat 5] [--modules ti_ai ti_pdf] [--top 15]
+    python benchmarks/bench_import_time.py --save baseline.json
+    python benchmarks/bench_import_time.py --baseline baseline.json [--tolerance 0.25]   # exit 1 on regression
+"""
+import os
+import ast
+import sys
+import json
+import tempfile
+import argparse
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_SCRIPT = os.path.join(REPO_DIR, "timindmapgpt.py")
+
+DEFAULT_MODULES = ["ti_ai", "ti_pdf", "ti_stix", "ti_ingest", "ti_navigator", "ti_5whats", "ti_llm", "ti_ioc", "ti_batch"]
+# Packages that should only be loaded by the feature that needs them
+HEAVY_PACKAGES = ["langchain", "langchain_community", "langchain_openai", "langchain_mistralai", "faiss",
+                  "reportlab", "stix2", "github", "PyPDF2", "streamlit_markmap"]
+REGRESSION_FLOOR_SECONDS = 0.05 # Differences below this are noise, whatever the relative change
+
+# Runs in the child interpreter: imports the modules, prints the elapsed time and loaded heavy packages
+CHILD_CODE = """
+import sys, time, json, importlib
+sys.path.insert(0, {repo!r})
+started = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module(name)
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "heavy": [p for p in {heavy!r} if p in sys.modules]}}))
+"""
+
+def app_modules():
+    """Top-level imports of timindmapgpt.py (imports inside blocks and functions are lazy by design)."""
+    with open(APP_SCRIPT, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+def run_child(modules, pycache_dir, importtime=False):
+    code = CHILD_CODE.format(repo=REPO_DIR, modules=modules, heavy=HEAVY_PACKAGES)
+    command = [sys.executable, "-X", f"pycache_prefix={pycache_dir}"] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="", PYTHONWARNINGS="ignore")
+    result = subprocess.run(command, capture_output=True, text=True, cwd=REPO_DIR, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {modules} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def measure(modules, repeat):
+    """Returns {"cold", "warm", "heavy"} for importing `modules` in fresh interpreters."""
+    with tempfile.TemporaryDirectory(prefix="ti-pycache-") as pycache_dir:
+        cold, _ = run_child(modules, pycache_dir) # Also populates the bytecode cache for the warm runs
+        warm = [run_child(modules, pycache_dir)[0] for _ in range(repeat)]
+    return {
+        "cold": round(cold["seconds"], 3),
+        "warm": round(statistics.median(run["seconds"] for run in warm), 3),
+        "heavy": warm[-1]["heavy"],
+    }
+
+def top_imports(modules, count):
+    """The `count` slowest imports (cumulative, warm cache) from python -X importtime."""
+    with tempfile.TemporaryDirectory(prefix="ti-pycache-") as pycache_dir:
+        run_child(modules, pycache_dir)
+        _, stderr = run_child(modules, pycache_dir, importtime=True)
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line.split(":", 1)[1].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    return sorted(rows, reverse=True)[:count]
+
+def compare(results, baseline, tolerance):
+    """Returns the targets whose warm import time regressed by more than `tolerance` (relative)."""
+    regressions = []
+    for target, result in results.items():
+        before = baseline.get(target)
+        if not before:
+            continue
+        slower = result["warm"] - before["warm"]
+        if slower > REGRESSION_FLOOR_SECONDS and slower > before["warm"] * tolerance:
+            regressions.append((target, before["warm"], result["warm"]))
+        new_heavy = sorted(set(result["heavy"]) - set(before.get("heavy", [])))
+        if new_heavy:
+            regressions.append((target, f"now loads {', '.join(new_heavy)}", result["warm"]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="Modules to time individually.")
+    parser.add_argument("--repeat", type=int, default=5, help="Warm runs per target (the median is reported).")
+    parser.add_argument("--top", type=int, default=15, help="Show the N slowest imports of the app (0 to skip).")
+    parser.add_argument("--save", metavar="FILE", help="Write the results as JSON (e.g. to use as a baseline).")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare with saved results; exit 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown against the baseline.")
+    args = parser.parse_args()
+
+    targets = {"app": app_modules()}
+    targets.update({name: [name] for name in args.modules})
+    print(f"Python {sys.version.split()[0]}, {args.repeat} warm runs per target\n")
+    print(f"{'target':<14}{'cold (s)':>10}{'warm (s)':>10}  heavy dependencies loaded")
+    results = {}
+    for target, modules in targets.items():
+        results[target] = measure(modules, args.repeat)
+        result = results[target]
+        print(f"{target:<14}{result['cold']:>10.3f}{result['warm']:>10.3f}  {', '.join(result['heavy']) or '-'}", flush=True)
+
+    if args.top:
+        print(f"\nSlowest imports of the app (warm, cumulative):")
+        for cumulative_us, self_us, name in top_imports(targets["app"], args.top):
+            print(f"  {cumulative_us / 1e6:8.3f} s  (self {self_us / 1e6:.3f} s)  {name}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for target, before, after in regressions:
+                print(f"  {target}: {before} -> {after}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
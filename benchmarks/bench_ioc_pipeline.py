@@ -0,0 +1,110 @@
+"""
+Benchmark for the IOC table pipeline (ti_ioc).
+
+Generates an AI-style IOC CSV with N rows (defanged indicators, mixed case, ports and duplicates),
+then times parsing + normalization + VirusTotal links with the columnar pipeline against the
+previous row-by-row implementation (naive comma split and iterrows), and times the local regex
+extraction engine on the same indicators embedded in prose.
+
+Usage:
+    python benchmarks/bench_ioc_pipeline.py [--rows 100000] [--repeat 3] [--skip-legacy]
+"""
+import os
+import sys
+import time
+import random
+import hashlib
+import argparse
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ti_ioc # noqa: E402
+
+HEADER = "Indicator,Type,Description,Virus Total URL"
+
+def random_hex(rng, length):
+    return "".join(rng.choice("0123456789abcdef") for _ in range(length))
+
+def generate_rows(n_rows, seed=42):
+    """Returns (csv_text, prose_text) with roughly 10% duplicate indicators."""
+    rng = random.Random(seed)
+    rows, sentences = [], []
+    for i in range(n_rows):
+        kind = i % 6
+        if kind == 0:
+            indicator, ioc_type = f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}[.]{rng.randint(1, 254)}", "IP"
+        elif kind == 1:
+            indicator, ioc_type = f"Host{rng.randint(0, n_rows)}.Evil-Domain[.]com:443", "Domain"
+        elif kind == 2:
+            indicator, ioc_type = f"hxxps://cdn{rng.randint(0, n_rows)}.example[.]net/p/{random_hex(rng, 8)}.php", "URL"
+        elif kind == 3:
+            indicator, ioc_type = random_hex(rng, 64).upper(), "SHA256"
+        elif kind == 4:
+            indicator, ioc_type = random_hex(rng, 32), "File Hash (MD5)"
+        else:
+            indicator, ioc_type = f"CVE-20{rng.randint(10, 25)}-{rng.randint(1000, 99999)}", "CVE"
+        if rows and rng.random() < 0.1:
+            indicator, ioc_type = rows[rng.randrange(len(rows))][:2]
+        rows.append((indicator, ioc_type, f"Observed in stage {i % 7}"))
+        sentences.append(f"The actor used {indicator} during stage {i % 7}.")
+    csv_text = HEADER + "\n" + "\n".join(f"{indicator},{ioc_type},{description}," for indicator, ioc_type, description in rows)
+    return csv_text, " ".join(sentences)
+
+# --- Previous implementation (row by row), kept here for comparison ---
+
+def legacy_create_dataframe(response_content_str):
+    lines = response_content_str.strip().split("\n")
+    header = [h.strip().replace('"', '') for h in lines[0].split(",")]
+    data_rows = []
+    for line in lines[1:]:
+        if not line.strip(): continue
+        data_rows.append([val.strip().replace('"', '') for val in line.split(",")])
+    standardized = []
+    for row in data_rows:
+        if len(row) < len(header):
+            standardized.append(row + [''] * (len(header) - len(row)))
+        else:
+            standardized.append(row[:len(header)])
+    return pd.DataFrame(standardized, columns=header)
+
+def legacy_update_virus_total_urls(ioc_dataframe):
+    for index, row in ioc_dataframe.iterrows():
+        if row["Type"] == "URL" and pd.notna(row["Indicator"]):
+            sha256 = hashlib.sha256(str(row["Indicator"]).encode()).hexdigest()
+            ioc_dataframe.at[index, "Virus Total URL"] = f"https://www.virustotal.com/gui/url/{sha256}"
+    return ioc_dataframe
+
+# --- Benchmark ---
+
+def best_of(repeat, func, *args):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000, help="Number of IOC rows to generate.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported).")
+    parser.add_argument("--skip-legacy", action="store_true", help="Do not time the previous row-by-row implementation.")
+    args = parser.parse_args()
+
+    csv_text, prose_text = generate_rows(args.rows)
+    print(f"Rows: {args.rows:,}  CSV: {len(csv_text) / 1e6:.1f} MB  Prose: {len(prose_text) / 1e6:.1f} MB")
+
+    if not args.skip_legacy:
+        seconds, legacy = best_of(args.repeat, lambda text: legacy_update_virus_total_urls(legacy_create_dataframe(text)), csv_text)
+        print(f"legacy   parse + iterrows VT links:        {seconds * 1000:9.1f} ms  ({len(legacy):,} rows, no dedupe)")
+
+    seconds, parsed = best_of(args.repeat, ti_ioc.parse_ioc_csv, csv_text)
+    print(f"columnar parse_ioc_csv:                    {seconds * 1000:9.1f} ms")
+    seconds, normalized = best_of(args.repeat, ti_ioc.normalize_ioc_dataframe, parsed)
+    print(f"columnar normalize (refang/type/dedupe/VT): {seconds * 1000:8.1f} ms  ({len(normalized):,} unique rows)")
+
+    seconds, extracted = best_of(args.repeat, ti_ioc.extract_iocs_local, prose_text)
+    print(f"local regex extraction from prose:         {seconds * 1000:9.1f} ms  ({len(extracted):,} unique rows)")
+
+if __name__ == "__main__":
+    main()
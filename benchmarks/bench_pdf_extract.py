@@ -0,0 +1,109 @@
+"""
+PDF ingestion benchmark: the previous extraction loop against ti_pdftext.
+
+Generates a long text-heavy PDF (an annual threat report stand-in, 300 pages by default) with
+reportlab, or uses the PDFs given with --pdf. Each is extracted with:
+- legacy: PyPDF2 page loop in-process with `text += page_text` (the previous extract_text_from_pdf);
+- serial: ti_pdftext in-process (no character budget);
+- parallel: ti_pdftext with --workers processes (no character budget);
+- budget: ti_pdftext with the default ingestion budget (PDF_TEXT_MAX_CHARS), or --max-chars.
+The parallel rows only pay off on machines with several cores; worker start-up is included.
+
+Usage:
+    python benchmarks/bench_pdf_extract.py [--pages 300] [--workers 4] [--max-chars 250000]
+    python benchmarks/bench_pdf_extract.py --pdf reports/annual-2024.pdf [--json results.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ti_pdftext # noqa: E402
+
+WORDS = ("actor loader persistence credential lateral movement exfiltration phishing ministry energy backdoor "
+         "beacon sideloading scheduled task registry run key powershell obfuscation c2 domain infrastructure").split()
+
+def generate_pdf(path, pages, seed=1):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    rng = random.Random(seed)
+    document = canvas.Canvas(path, pagesize=A4)
+    for _ in range(pages):
+        y = 800
+        for _ in range(60):
+            document.drawString(40, y, " ".join(rng.choice(WORDS) for _ in range(14)))
+            y -= 12
+        document.showPage()
+    document.save()
+
+def legacy_extract(data):
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    text = ""
+    for page in reader.pages:
+        page_text = page.extract_text()
+        if page_text:
+            text += page_text + "\n"
+    return text
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+def bench(path, workers, max_chars):
+    with open(path, "rb") as f:
+        data = f.read()
+    rows = {}
+    text, seconds = timed(lambda: legacy_extract(data))
+    rows["legacy"] = {"seconds": seconds, "chars": len(text), "pages": None}
+    for name, options in (("serial", {"max_chars": None, "workers": 1}),
+                          (f"parallel x{workers}", {"max_chars": None, "workers": workers}),
+                          ("budget", {"max_chars": max_chars})):
+        extraction, seconds = timed(lambda: ti_pdftext.extract_pdf_text(data, **options))
+        rows[name] = {"seconds": seconds, "chars": len(extraction.text), "pages": f"{extraction.pages_extracted}/{extraction.pages}",
+                      "workers": extraction.workers}
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", nargs="+", help="PDFs to benchmark instead of the generated document.")
+    parser.add_argument("--pages", type=int, default=300, help="Pages of the generated document.")
+    parser.add_argument("--workers", type=int, default=max(2, ti_pdftext.MAX_WORKERS))
+    parser.add_argument("--max-chars", type=int, default=ti_pdftext.PDF_TEXT_MAX_CHARS, help="Budget of the 'budget' row.")
+    parser.add_argument("--json", metavar="FILE", help="Write the results as JSON.")
+    args = parser.parse_args()
+
+    paths = args.pdf
+    temporary = None
+    if not paths:
+        temporary = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False).name
+        generate_pdf(temporary, args.pages)
+        paths = [temporary]
+    print(f"{os.cpu_count()} CPUs; budget row stops at {args.max_chars:,} characters\n")
+    results = {}
+    try:
+        for path in paths:
+            rows = results[os.path.basename(path)] = bench(path, args.workers, args.max_chars)
+            baseline = rows["legacy"]["seconds"]
+            print(f"{os.path.basename(path)} ({os.path.getsize(path) / 2**20:.1f} MB)")
+            print(f"  {'method':<13}{'seconds':>9}{'speedup':>9}{'chars':>12}{'pages':>10}")
+            for name, row in rows.items():
+                print(f"  {name:<13}{row['seconds']:>9.2f}{baseline / row['seconds']:>8.1f}x{row['chars']:>12,}{row['pages'] or '-':>10}")
+    finally:
+        if temporary:
+            os.remove(temporary)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+End-to-end pipeline benchmark against the local stub LLM server (no API keys, no tokens spent).
+
+Each document goes through the same stages as a report in the app:
+    scrape -> relevance -> Tab 1 components (summary, mindmap, IOCs, TTP table, attack path,
+    timeline, 5 Whats, Navigator layer; run by ti_scheduler) -> STIX bundle -> PDF
+Every document gets its own fixture URL, so prompts differ and the LLM cache never answers.
+
+Reports per-stage and per-component latency percentiles, documents and LLM requests per minute,
+and peak memory (process RSS, plus the Python heap with --tracemalloc).
+
+Usage:
+    python benchmarks/bench_pipeline.py [--documents 10] [--concurrency 2] [--latency 0.4] [--tokens-per-second 80]
+    python benchmarks/bench_pipeline.py --provider MistralAI --no-structured --json results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import resource
+import subprocess
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+# A throwaway LLM cache, so runs neither read nor pollute the app's cache (must be set before ti_cache loads)
+os.environ["TI_MINDMAP_CACHE_DIR"] = tempfile.mkdtemp(prefix="ti-bench-cache-")
+
+import requests # noqa: E402
+import stub_llm_server # noqa: E402
+import ti_batch # noqa: E402
+import ti_events # noqa: E402
+import ti_fetch # noqa: E402
+import ti_ingest # noqa: E402
+import ti_llm # noqa: E402
+import ti_pdf # noqa: E402
+import ti_ratelimit # noqa: E402
+import ti_relevance # noqa: E402
+import ti_scheduler # noqa: E402
+import ti_stix # noqa: E402
+
+COMPONENTS = {"summary", "mindmap", "iocs", "ttps", "attackpath", "timeline", "5whats", "navigator"}
+STAGES = ("scrape", "relevance", "components", "stix", "pdf", "total")
+MODEL_FOR_PROVIDER = {"OpenAI": None, "Azure OpenAI": "stub-deployment", "MistralAI": "mistral-large-latest"}
+
+def percentile(values, fraction):
+    """Linear-interpolated percentile of a non-empty list."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(values):
+    return {"n": len(values), "p50": percentile(values, 0.5), "p90": percentile(values, 0.9), "p99": percentile(values, 0.99),
+            "max": max(values), "mean": sum(values) / len(values)}
+
+# --- Stub Server ---
+
+def start_stub(args):
+    """Starts the stub (in a subprocess unless --in-process); returns (base_url, stop function)."""
+    if args.in_process:
+        config = stub_llm_server.StubConfig(args.latency, args.tokens_per_second, args.jitter, args.fixture_paragraphs, seed=1)
+        server, url = stub_llm_server.start_server(config)
+        return url, server.shutdown
+    command = [sys.executable, os.path.join(BENCH_DIR, "stub_llm_server.py"), "--port", "0", "--latency", str(args.latency),
+               "--tokens-per-second", str(args.tokens_per_second), "--jitter", str(args.jitter),
+               "--fixture-paragraphs", str(args.fixture_paragraphs)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if "listening on" not in line:
+        process.kill()
+        raise RuntimeError(f"Stub server did not start: {line!r}")
+    return line.split("listening on ")[1].split()[0], process.terminate
+
+# --- Pipeline ---
+
+def run_document(index, base_url, client, options):
+    """Runs one document through every stage; returns {"stages": {...}, "components": {...}, "failed": [...], "events": [...]}."""
+    timings, component_timings, failed = {}, {}, []
+    sink = ti_events.CollectingSink()
+    provider, model = options["provider"], options["model"]
+    started = time.perf_counter()
+
+    def timed(stage, func):
+        stage_started = time.perf_counter()
+        try:
+            return func()
+        finally:
+            timings[stage] = time.perf_counter() - stage_started
+
+    with ti_events.use_sink(sink):
+        text = timed("scrape", lambda: ti_ingest.scrape_text(f"{base_url}/fixture/report.html?doc={index}"))
+        if text.startswith(("Failed to scrape", "HTTP Error")):
+            raise RuntimeError(text)
+        timed("relevance", lambda: ti_relevance.check_content_relevance(text, client, provider, model))
+
+        components = ti_batch.build_components(text, COMPONENTS, {}, client, provider, model, options)
+        results = timed("components", lambda: ti_scheduler.run_components(components, max_concurrency=options["component_concurrency"]))
+        for name, component in results.items():
+            if component.status == ti_scheduler.DONE:
+                component_timings[name] = component.elapsed
+            else:
+                failed.append(f"{name}: {component.error}")
+        result = {name: c.result for name, c in results.items() if c.status == ti_scheduler.DONE}
+
+        try:
+            timed("stix", lambda: ti_stix.generate_stix_bundle(text, client, provider, model, ttp_table=result.get("ttptable"),
+                                                               ioc_dataframe=result.get("iocs_df")))
+        except ValueError as e:
+            failed.append(f"stix: {e}")
+        pdf_bytes = timed("pdf", lambda: ti_pdf.create_pdf_bytes(
+            url=f"{base_url}/fixture/report.html?doc={index}", summary_content=result.get("summary", ""),
+            mindmap_mermaid_code=result.get("mindmap_code", ""), iocs_data=result.get("iocs_df"),
+            ttps_overview_data=result.get("ttptable", ""), attack_path_data=result.get("attackpath", ""),
+            mermaid_timeline_code=result.get("mermaid_timeline", ""), five_whats_data=result.get("5whats", "")))
+        if not pdf_bytes:
+            failed.append("pdf: no output")
+    timings["total"] = time.perf_counter() - started
+    return {"stages": timings, "components": component_timings, "failed": failed,
+            "events": [event.to_dict() for event in sink.drain()]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=10, help="Documents to process (after warm-up).")
+    parser.add_argument("--warmup", type=int, default=1, help="Documents processed first and left out of the statistics.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Documents processed in parallel.")
+    parser.add_argument("--component-concurrency", type=int, default=ti_scheduler.DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--provider", choices=tuple(MODEL_FOR_PROVIDER), default="OpenAI")
+    parser.add_argument("--no-structured", action="store_true", help="Free-text outputs instead of JSON-schema outputs.")
+    parser.add_argument("--latency", type=float, default=stub_llm_server.DEFAULT_LATENCY_SECONDS, help="Stub time to first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=stub_llm_server.DEFAULT_TOKENS_PER_SECOND)
+    parser.add_argument("--jitter", type=float, default=stub_llm_server.DEFAULT_JITTER)
+    parser.add_argument("--fixture-paragraphs", type=int, default=20, help="Length of the fixture report.")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="Apply the provider's default rate limits and the per-host scraping politeness delay.")
+    parser.add_argument("--in-process", action="store_true", help="Run the stub in this process (shares the GIL).")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the peak Python heap (slows the run).")
+    parser.add_argument("--json", metavar="FILE", help="Write the results as JSON.")
+    args = parser.parse_args()
+
+    base_url, stop_stub = start_stub(args)
+    try:
+        provider = args.provider
+        endpoint = f"{base_url}/v1" if provider == "OpenAI" else base_url
+        client = ti_llm.get_provider(provider, "stub-key", endpoint=endpoint)
+        ti_pdf.MERMAID_INK_URL = base_url # Diagram images come from the stub as well
+        if not args.keep_rate_limits:
+            ti_ratelimit.set_rate_limits(provider, 1_000_000, 1_000_000_000)
+            ti_fetch.POLITENESS_DELAY_SECONDS = 0 # Every fixture comes from the same host
+        options = {
+            "provider": provider, "model": MODEL_FOR_PROVIDER[provider], "language": ["English"],
+            "structured": not args.no_structured, "ioc_mode": ti_batch.ti_ioc.MODE_MERGED,
+            "long_document_threshold": ti_batch.ti_longdoc.DEFAULT_LONG_DOCUMENT_THRESHOLD,
+            "component_concurrency": args.component_concurrency,
+        }
+        print(f"Stub at {base_url}: latency {args.latency}s, {args.tokens_per_second:g} tokens/s | provider {provider}, "
+              f"{'structured' if options['structured'] else 'free-text'} outputs, {args.concurrency} documents in parallel")
+
+        for index in range(args.warmup):
+            run_document(f"warmup-{index}", base_url, client, options)
+        stats_before = requests.get(f"{base_url}/stats", timeout=10).json()
+        if args.tracemalloc:
+            tracemalloc.start()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency), thread_name_prefix="ti-bench") as executor:
+            runs = list(executor.map(lambda i: run_document(i, base_url, client, options), range(args.documents)))
+        wall = time.perf_counter() - started
+
+        heap_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        stats = {key: value - stats_before[key] for key, value in requests.get(f"{base_url}/stats", timeout=10).json().items()}
+    finally:
+        stop_stub()
+
+    stages = {stage: summarize([run["stages"][stage] for run in runs if stage in run["stages"]]) for stage in STAGES}
+    component_names = sorted({name for run in runs for name in run["components"]})
+    components = {name: summarize([run["components"][name] for run in runs if name in run["components"]]) for name in component_names}
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KiB on Linux
+    failures = [failure for run in runs for failure in run["failed"]]
+    warnings = sorted({event["message"][:120] for run in runs for event in run["events"] if event["level"] in ("warning", "error")})
+
+    print(f"\n{'stage':<24}{'n':>4}{'p50 (s)':>10}{'p90 (s)':>10}{'p99 (s)':>10}{'max (s)':>10}")
+    for name, row in list(stages.items()) + [(f"  {name}", row) for name, row in components.items()]:
+        print(f"{name:<24}{row['n']:>4}{row['p50']:>10.3f}{row['p90']:>10.3f}{row['p99']:>10.3f}{row['max']:>10.3f}")
+    print(f"\nThroughput: {args.documents / wall * 60:.1f} documents/min, {stats['requests'] / wall * 60:.0f} LLM requests/min "
+          f"({stats['requests'] / max(1, args.documents):.1f} per document, {stats['prompt_tokens'] + stats['completion_tokens']:,} tokens)")
+    print(f"Wall time: {wall:.2f}s for {args.documents} documents")
+    print(f"Peak memory: {peak_rss_mb:.0f} MB RSS" + (f", {heap_peak / 2**20:.1f} MB Python heap" if heap_peak is not None else ""))
+    if failures:
+        print(f"\n{len(failures)} failed stages/components:", *sorted(set(failures))[:10], sep="\n  ")
+    if warnings:
+        print("\nDiagnostics reported by the modules:", *warnings[:10], sep="\n  ")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "stages": stages, "components": components, "wall_seconds": wall,
+                       "documents_per_minute": args.documents / wall * 60, "llm": stats, "peak_rss_mb": peak_rss_mb,
+                       "peak_heap_mb": heap_peak / 2**20 if heap_peak is not None else None, "failures": failures}, f, indent=2)
+        print(f"\nResults saved to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+Local stub of the OpenAI / Azure OpenAI / MistralAI chat completions API, for offline benchmarks.
+
+Answers every POST to .../chat/completions (OpenAI /v1, Azure /openai/deployments/<name>, Mistral
+/v1) with a canned response shaped like the real outputs the ti_* modules expect: Mermaid mindmaps,
+IOC CSV, TTP tables, timelines, Navigator layers, STIX object arrays, 5 Whats tables and
+schema-conforming JSON for structured outputs. Streaming (SSE) is supported.
+
+Latency is simulated as a time-to-first-token plus a generation rate, so the benchmarks see
+the same request shape and timing profile as with a real provider, without spending tokens.
+
+It also serves:
+    GET /fixture/report.html?doc=N   a threat report page (N makes each document, and so each prompt, unique)
+    GET /img/<base64>                a small PNG, standing in for mermaid.ink
+    GET /stats                       request and token counters (JSON)
+
+Usage:
+    python benchmarks/stub_llm_server.py [--port 8765] [--latency 0.4] [--tokens-per-second 80]
+"""
+import re
+import sys
+import json
+import time
+import zlib
+import struct
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# --- Constants ---
+DEFAULT_LATENCY_SECONDS = 0.4     # Time to first token
+DEFAULT_TOKENS_PER_SECOND = 80.0  # Generation speed; 0 answers instantly
+DEFAULT_JITTER = 0.2              # +/- fraction applied to the latency
+CHARS_PER_TOKEN = 4               # Used to derive token counts (usage and generation time) from text
+
+# --- Canned Responses ---
+
+MINDMAP = """mindmap
+root(Operation Glass Heron)
+  (Threat actor)
+    (Glass Heron - state aligned espionage group)
+    (Active since 2021)
+  (Targets)
+    (Government and energy sectors)
+    (Central Asia and Eastern Europe)
+  (Initial access)
+    (Spearphishing with ISO attachments)
+    (Exploitation of CVE-2023-23397)
+  (Tooling)
+    (HeronLoader DLL side loading)
+    (Cobalt Strike beacons)
+    (Mimikatz for credential dumping)
+  (Infrastructure)
+    (185.220.101.4)
+    (update-checker.net)
+    (cdn-sync.org)
+  (Impact)
+    (Exfiltration of diplomatic documents)"""
+
+IOC_CSV = """Indicator,Type,Description,Virus Total URL
+185.220.101.4,IPv4,Cobalt Strike command and control server,https://www.virustotal.com/gui/ip-address/185.220.101.4
+update-checker.net,Domain,HeronLoader download domain,https://www.virustotal.com/gui/domain/update-checker.net
+cdn-sync.org,Domain,Exfiltration endpoint,https://www.virustotal.com/gui/domain/cdn-sync.org
+http://update-checker.net/files/invoice.iso,URL,ISO payload delivered by phishing,N/A
+44d88612fea8a8f36de82e1278abb02f,File Hash (MD5),HeronLoader DLL,https://www.virustotal.com/gui/file/44d88612fea8a8f36de82e1278abb02f
+e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855,File Hash (SHA256),Malicious ISO attachment,https://www.virustotal.com/gui/file/e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855
+CVE-2023-23397,CVE,Outlook privilege escalation exploited for initial access,"""
+
+TTPS = [
+    ("Spearphishing Attachment", "T1566.001", "Initial Access", "ISO attachments sent to government staff"),
+    ("Exploitation for Privilege Escalation", "T1068", "Privilege Escalation", "CVE-2023-23397 in Outlook"),
+    ("DLL Side-Loading", "T1574.002", "Defense Evasion", "HeronLoader loaded by a signed binary"),
+    ("PowerShell", "T1059.001", "Execution", "Encoded PowerShell launches the beacon"),
+    ("LSASS Memory", "T1003.001", "Credential Access", "Mimikatz dumps credentials"),
+    ("Exfiltration Over C2 Channel", "T1041", "Exfiltration", "Documents sent to cdn-sync.org"),
+]
+
+TTP_TABLE = "| Technique | Technique ID | Tactic | Comment |\n|---|---|---|---|\n" + "\n".join(
+    f"| {technique} | {technique_id} | {tactic} | {comment} |" for technique, technique_id, tactic, comment in TTPS)
+
+TTP_LIST = "\n".join(f"{tactic}: {technique} ({technique_id})" for technique, technique_id, tactic, _ in TTPS)
+
+TIMELINE = "timeline\n    title Glass Heron intrusion\n" + "\n".join(
+    f"    {tactic} : {technique} - {technique_id}" for technique, technique_id, tactic, _ in TTPS)
+
+FIVE_WHATS = [
+    ("What?", "Espionage campaign by Glass Heron using HeronLoader and Cobalt Strike."),
+    ("When?", "Between March and September 2024."),
+    ("Where?", "Government and energy organisations in Central Asia and Eastern Europe."),
+    ("Who?", "Glass Heron, a state aligned espionage group."),
+    ("How?", "Spearphishing ISO attachments, CVE-2023-23397, DLL side-loading."),
+    ("Why?", "Collection of diplomatic documents."),
+    ("So what?", "Targeted organisations should hunt for the listed indicators."),
+    ("What is next?", "New infrastructure is expected as domains are taken down."),
+    ("References", "NON APPLICABLE"),
+]
+
+FIVE_WHATS_TABLE = "| Question | Summary |\n|---|---|\n" + "\n".join(f"| {q} | {a} |" for q, a in FIVE_WHATS)
+
+SUMMARY = (
+    "# 🛡️ Operation Glass Heron\n\n"
+    "Glass Heron, a state aligned espionage group, targeted government and energy organisations in Central "
+    "Asia and Eastern Europe between March and September 2024. Initial access relied on spearphishing emails "
+    "with ISO attachments and on the exploitation of CVE-2023-23397 in Outlook.\n\n"
+    "The ISO files contained a signed binary that side-loads HeronLoader, which in turn launches Cobalt Strike "
+    "beacons talking to 185.220.101.4. The operators dumped credentials with Mimikatz, moved laterally and "
+    "exfiltrated diplomatic documents to cdn-sync.org.\n\n"
+    "Defenders should block the listed infrastructure, patch Outlook and hunt for DLL side-loading from ISO mounts."
+)
+
+SECTION_NOTES = (
+    "- Actor: Glass Heron (state aligned espionage), active since 2021\n"
+    "- Victims: government and energy, Central Asia and Eastern Europe, March to September 2024\n"
+    "- Access: spearphishing ISO attachments, CVE-2023-23397\n"
+    "- Tools: HeronLoader (DLL side-loading), Cobalt Strike, Mimikatz\n"
+    "- IOCs: 185.220.101.4, update-checker.net, cdn-sync.org, 44d88612fea8a8f36de82e1278abb02f"
+)
+
+NAVIGATOR_LAYER = {
+    "name": "Glass Heron", "versions": {"attack": "14", "navigator": "4.9.1", "layer": "4.5"}, "domain": "enterprise-attack",
+    "description": "Techniques observed in Operation Glass Heron",
+    "techniques": [{"techniqueID": technique_id, "tactic": tactic.lower().replace(" ", "-"), "color": "#e60d0d",
+                    "comment": comment, "enabled": True} for _, technique_id, tactic, comment in TTPS],
+}
+
+STIX_SDOS = [
+    {"type": "threat-actor", "spec_version": "2.1", "id": "threat-actor--", "created": "2024-09-30T00:00:00.000Z",
+     "modified": "2024-09-30T00:00:00.000Z", "name": "Glass Heron", "threat_actor_types": ["nation-state"]},
+    {"type": "malware", "spec_version": "2.1", "id": "malware--", "created": "2024-09-30T00:00:00.000Z",
+     "modified": "2024-09-30T00:00:00.000Z", "name": "HeronLoader", "is_family": "true", "malware_types": ["dropper"]},
+    {"type": "tool", "spec_version": "2.1", "id": "tool--", "created": "2024-09-30T00:00:00.000Z",
+     "modified": "2024-09-30T00:00:00.000Z", "name": "Mimikatz", "tool_types": ["credential-exploitation"]},
+]
+
+STIX_SCOS = [
+    {"type": "ipv4-addr", "spec_version": "2.1", "id": "ipv4-addr--", "value": "185.220.101.4"},
+    {"type": "domain-name", "spec_version": "2.1", "id": "domain-name--", "value": "update-checker.net"},
+    {"type": "domain-name", "spec_version": "2.1", "id": "domain-name--", "value": "cdn-sync.org"},
+]
+
+# Values for the properties of the JSON schemas in ti_schemas (structured outputs)
+SCHEMA_VALUES = {
+    "iocs": [{"indicator": "185.220.101.4", "type": "IPv4", "description": "Cobalt Strike command and control server"},
+             {"indicator": "update-checker.net", "type": "Domain", "description": "HeronLoader download domain"},
+             {"indicator": "44d88612fea8a8f36de82e1278abb02f", "type": "File Hash (MD5)", "description": "HeronLoader DLL"},
+             {"indicator": "CVE-2023-23397", "type": "CVE", "description": "Outlook privilege escalation"}],
+    "ttps": [{"technique": t, "technique_id": i, "tactic": a, "comment": c} for t, i, a, c in TTPS],
+    "answers": [{"question": q, "summary": a} for q, a in FIVE_WHATS],
+    "five_whats": [{"question": q, "summary": a} for q, a in FIVE_WHATS],
+    "summary": SUMMARY,
+    "relevance": {"is_cybersecurity": True, "main_topic": "Espionage campaign by Glass Heron"},
+    "is_cybersecurity": True,
+    "main_topic": "Espionage campaign by Glass Heron",
+}
+
+def _schema_response(schema):
+    return json.dumps({name: SCHEMA_VALUES.get(name, "") for name in (schema or {}).get("properties", {})})
+
+def _prompt_schema(text):
+    """The JSON schema embedded in the prompt by ti_schemas.schema_instructions, or None."""
+    marker = "It must match this JSON schema: "
+    if marker not in text:
+        return None
+    try:
+        return json.JSONDecoder().raw_decode(text[text.index(marker) + len(marker):])[0]
+    except ValueError:
+        return None
+
+def canned_response(body):
+    """Picks the response for a chat completion request from the shape of its prompt."""
+    messages = body.get("messages") or []
+    prompt = "\n".join(str(m.get("content") or "") for m in messages)
+    # Match on the system prompts; prompts with only user messages carry their instructions inline
+    instructions = "\n".join(str(m.get("content") or "") for m in messages if m.get("role") == "system") or prompt
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return _schema_response(response_format.get("json_schema", {}).get("schema"))
+    schema = _prompt_schema(instructions)
+    if schema is not None:
+        return _schema_response(schema)
+
+    rules = (
+        ("Mermaid.js mindmap", MINDMAP),
+        ("markmap", "# Operation Glass Heron\n## Threat actor\n- Glass Heron\n## Tooling\n- HeronLoader\n- Cobalt Strike"),
+        ("Format as CSV: Indicator,Type", IOC_CSV),
+        ("ordered by their perceived execution time", TTP_LIST),
+        ("Markdown table with columns: Technique", TTP_TABLE),
+        ("Start with `timeline`", TIMELINE),
+        ("ATT&CK Navigator", json.dumps(NAVIGATOR_LAYER)),
+        ("STIX 2.1 Domain Objects", json.dumps(STIX_SDOS)),
+        ("STIX 2.1 Cyber-observable Objects", json.dumps(STIX_SCOS)),
+        ("STIX 2.1 Relationship Object", json.dumps([])),
+        ("What? (what happened)", FIVE_WHATS_TABLE),
+        ("primarily related to cybersecurity", "Yes"),
+        ("Write dense notes on this section", SECTION_NOTES),
+        ("tweet", "🛡️ Glass Heron targets government and energy orgs with HeronLoader and CVE-2023-23397. #TIMindmapGPT"),
+    )
+    for marker, response in rules:
+        if marker.lower() in instructions.lower():
+            return response
+    return SUMMARY
+
+# --- PNG (mermaid.ink stand-in) ---
+
+def _png(width=64, height=32):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    raw = b"".join(b"\x00" + b"\xff\xff\xff" * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+PNG_BYTES = _png()
+
+# --- Fixture ---
+
+FIXTURE_HTML = """<!DOCTYPE html>
+<html><head><title>Operation Glass Heron</title></head>
+<body><nav>Home | Research | Blog</nav>
+<main>
+<h1>Operation Glass Heron: espionage against government and energy targets</h1>
+<p>Report reference {doc}. Between March and September 2024 we tracked an espionage campaign by the threat
+actor we call Glass Heron against government and energy organisations in Central Asia and Eastern Europe.</p>
+<h2>Initial access</h2>
+<p>The operators sent spearphishing emails with ISO attachments (T1566.001) hosted at
+hxxp://update-checker[.]net/files/invoice.iso and exploited CVE-2023-23397 in Outlook for privilege
+escalation (T1068).</p>
+<h2>Execution and persistence</h2>
+<p>The ISO contains a signed binary that side-loads HeronLoader (T1574.002), MD5 44d88612fea8a8f36de82e1278abb02f.
+HeronLoader runs encoded PowerShell (T1059.001) that starts a Cobalt Strike beacon contacting 185.220.101[.]4.</p>
+<h2>Credential access and exfiltration</h2>
+<p>Mimikatz was used to dump LSASS memory (T1003.001). Diplomatic documents were exfiltrated over the C2
+channel (T1041) to cdn-sync[.]org. The ISO had SHA256 e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855.</p>
+<h2>Indicators of compromise</h2>
+<ul><li>185.220.101[.]4</li><li>update-checker[.]net</li><li>cdn-sync[.]org</li>
+<li>44d88612fea8a8f36de82e1278abb02f</li><li>CVE-2023-23397</li></ul>
+{padding}
+</main>
+<footer>Copyright Example Research</footer></body></html>"""
+
+FIXTURE_PARAGRAPH = ("<p>Analysts observed further activity consistent with the campaign: the malware enumerated "
+                     "domain controllers, staged archives in the recycle bin and beaconed every 60 seconds with jitter. "
+                     "Threat intelligence sharing partners confirmed overlaps with earlier Glass Heron intrusions.</p>")
+
+def fixture_html(doc, paragraphs=20):
+    return FIXTURE_HTML.format(doc=doc, padding="\n".join([FIXTURE_PARAGRAPH] * paragraphs))
+
+# --- Server ---
+
+class StubConfig:
+    """Timing of the simulated provider."""
+    def __init__(self, latency=DEFAULT_LATENCY_SECONDS, tokens_per_second=DEFAULT_TOKENS_PER_SECOND,
+                 jitter=DEFAULT_JITTER, fixture_paragraphs=20, seed=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+        self.fixture_paragraphs = fixture_paragraphs
+        self.random = random.Random(seed)
+
+    def first_token_delay(self):
+        return max(0.0, self.latency * (1 + self.random.uniform(-self.jitter, self.jitter)))
+
+    def token_delay(self, tokens):
+        return tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+class StubStats:
+    def __init__(self):
+        self.requests = 0
+        self.streamed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, prompt_tokens, completion_tokens, streamed):
+        with self._lock:
+            self.requests += 1
+            self.streamed += int(streamed)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def to_dict(self):
+        with self._lock:
+            return {"requests": self.requests, "streamed": self.streamed,
+                    "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens}
+
+def _tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "ti-stub-llm/1.0"
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output clean
+
+    def _send(self, status, content_type, payload):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/fixture/"):
+            doc = parse_qs(url.query).get("doc", ["0"])[0]
+            self._send(200, "text/html; charset=utf-8", fixture_html(doc, self.server.config.fixture_paragraphs).encode("utf-8"))
+        elif url.path.startswith("/img/"):
+            self._send(200, "image/png", PNG_BYTES)
+        elif url.path == "/stats":
+            self._send(200, "application/json", json.dumps(self.server.stats.to_dict()).encode("utf-8"))
+        else:
+            self._send(404, "application/json", b'{"error": "not found"}')
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, "application/json", b'{"error": {"message": "invalid JSON"}}')
+            return
+        if not urlparse(self.path).path.endswith("/chat/completions"):
+            self._send(404, "application/json", b'{"error": {"message": "not found"}}')
+            return
+
+        config = self.server.config
+        content = canned_response(body)
+        prompt_tokens = sum(_tokens(str(m.get("content") or "")) for m in body.get("messages") or [])
+        completion_tokens = _tokens(content)
+        model = body.get("model") or "stub-model"
+        time.sleep(config.first_token_delay())
+        if body.get("stream"):
+            self._stream(content, model, config)
+        else:
+            time.sleep(config.token_delay(completion_tokens))
+            response = {
+                "id": f"chatcmpl-stub-{self.server.stats.requests}", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+            }
+            self._send(200, "application/json", json.dumps(response).encode("utf-8"))
+        self.server.stats.record(prompt_tokens, completion_tokens, bool(body.get("stream")))
+
+    def _stream(self, content, model, config):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        pieces = re.findall(r".{1,%d}" % CHARS_PER_TOKEN, content, flags=re.S)
+        delay = config.token_delay(1)
+        for piece in pieces:
+            chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if delay:
+                time.sleep(delay)
+        write(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Starts the stub in a background thread; returns (server, base_url). Stop it with server.shutdown()."""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.config = config or StubConfig()
+    server.stats = StubStats()
+    threading.Thread(target=server.serve_forever, name="ti-stub-llm", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="0 picks a free port.")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY_SECONDS, help="Seconds to first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=DEFAULT_TOKENS_PER_SECOND, help="Generation speed (0 = instant).")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_JITTER, help="Relative latency jitter.")
+    parser.add_argument("--fixture-paragraphs", type=int, default=20, help="Filler paragraphs in the fixture report.")
+    args = parser.parse_args()
+    server, url = start_server(StubConfig(args.latency, args.tokens_per_second, args.jitter, args.fixture_paragraphs), args.host, args.port)
+    print(f"Stub LLM server listening on {url} (OpenAI base URL {url}/v1, Azure/Mistral endpoint {url})", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,11 @@
 import os
 import json
 from uuid import uuid4
-from mistralai.models.chat_completion import ChatMessage
+from ti_llm import chat_completion, stream_chat_completion, stream_or_error, structured_completion
+from ti_ai import get_model_name
+from ti_schemas import FIVE_WHATS_SCHEMA, FIVE_WHATS_QUESTIONS, NOT_APPLICABLE, FiveWhatsReport
 from langsmith import traceable
 
-#OPENAI_MODEL = "gpt-4-1106-preview"
-OPENAI_MODEL = "gpt-4o-2024-08-06"
-
 prompt_table = """
 | Question    | Description
 --------------|------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -24,7 +23,13 @@ prompt_table = """
 
 #Function to provide ATT&CK Matrix for Enterprise layer json file
 @traceable
-def ai_fivewhats(input_text, client, service_selection, deployment_name=None):
+def ai_fivewhats(input_text, client, service_selection, deployment_name=None, stream=False, structured=False):
+    """
+    Generates the 5 Whats threat scope table. With stream=True, returns a generator of text chunks.
+
+    With structured=True, returns a ti_schemas.FiveWhatsReport built from FIVE_WHATS_SCHEMA JSON
+    (never streamed, since a partial JSON object cannot be displayed).
+    """
 
     # Define the SYSTEM prompt
     system_prompt_5whats = ("You are an expert in Cyber threat analisys, common structured analisys and threat intelligence. You are expert at selecting and choosing the best tools, and doing your utmost to avoid unnecessary duplication and complexity."
@@ -45,31 +50,30 @@ def ai_fivewhats(input_text, client, service_selection, deployment_name=None):
         return "Invalid input parameters."
     
     try:
-        if service_selection == "OpenAI" or service_selection == "Azure OpenAI":
-            # Determine the model based on the service provider
-            model = OPENAI_MODEL if service_selection == "OpenAI" else deployment_name
-        
-            # Make the API call
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt_5whats},
-                    {"role": "user", "content": input_text},
-                    {"role": "assistant", "content": system_prompt_5whats2},
-                ],
-            )
-        
-            return response.choices[0].message.content
-            
-        elif service_selection == "MistralAI":
-            chat_response = client.chat(
-            model = "mistral-large-latest",
-            messages=[
-                ChatMessage(role="system", content=system_prompt_5whats),
-                ChatMessage(role="user", content=input_text),
-                ],
-            )
-            return chat_response.choices[0].message.content  
+        model = get_model_name(service_selection, deployment_name)
+        # The table instructions go before the article: Mistral rejects a conversation ending with an assistant message
+        messages = [
+            {"role": "system", "content": system_prompt_5whats},
+            {"role": "system", "content": system_prompt_5whats2},
+            {"role": "user", "content": input_text},
+        ]
+
+        if structured:
+            # The Markdown example and table instructions are replaced by the schema
+            messages = [
+                {"role": "system", "content": system_prompt_5whats},
+                {"role": "system", "content": f"Answer every question of the report: {', '.join(FIVE_WHATS_QUESTIONS)}. "
+                                              f"Use {NOT_APPLICABLE} where the text does not answer a question."},
+                {"role": "user", "content": input_text},
+            ]
+            result = structured_completion(client, service_selection, model, messages, FIVE_WHATS_SCHEMA, "five_whats",
+                                           budget_text=input_text, component="5whats")
+            return FiveWhatsReport.from_dict(result)
+        if stream:
+            return stream_or_error(stream_chat_completion(client, service_selection, model, messages,
+                                                          budget_text=input_text, component="5whats"),
+                                   "An error occurred while generating the table summary")
+        return chat_completion(client, service_selection, model, messages, budget_text=input_text, component="5whats")
 
     except Exception as e:
         # Return a more informative error message
@@ -1,16 +1,15 @@
-import streamlit as st
-from langchain.chains.question_answering import load_qa_chain
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.callbacks import get_openai_callback
-from langchain_community.vectorstores import FAISS
-#from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings, OpenAI as langchainOAI, OpenAIEmbeddings
-from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings, OpenAIEmbeddings, ChatOpenAI as langchainChatOpenAI
-from langchain_mistralai.chat_models import ChatMistralAI as langchainMistralChat # Renamed for clarity
-from langchain_mistralai import MistralAIEmbeddings
+# LangChain, FAISS and the embedding SDKs are only needed by the AI Chat tab; they are imported in
+# ai_process_text / ai_get_response so that sessions which never open it do not pay for them.
 import pandas as pd
-from mistralai.models.chat_completion import ChatMessage # For direct Mistral client
 import hashlib
 import os
+import ti_events # Diagnostics go to the host's event sink instead of Streamlit
+import ti_metrics # Latency, token and cost records of the embedding and QA calls
+from ti_secrets import get_secret
+from ti_tokens import count_tokens
+from ti_llm import chat_completion, stream_chat_completion, stream_or_error, structured_completion # Single entry points for (cached) chat completions
+from ti_ioc import parse_ioc_csv, normalize_ioc_dataframe, add_virus_total_urls, ioc_dataframe_from_records # Columnar IOC table handling
+from ti_schemas import IOC_SCHEMA, TTP_SCHEMA, TTPTable, FiveWhatsReport, FUSED_ARTIFACT_PROPERTIES, FIVE_WHATS_QUESTIONS, NOT_APPLICABLE, fused_schema # Typed results for structured output
 
 # --- Constants ---
 OPENAI_DEFAULT_MODEL = "gpt-4o-2024-08-06" # Using the newer model
@@ -18,11 +17,11 @@ MISTRAL_DEFAULT_CHAT_MODEL = "mistral-large-latest" # Default for direct Mistral
 MISTRAL_DEFAULT_EMBED_MODEL = "mistral-embed" # Default for Mistral embeddings
 
 # --- Langsmith Configuration ---
-# Accessing the secrets from the [default] section (ensure these are in st.secrets)
-langchain_tracing_v2 = st.secrets.get("api_keys", {}).get("LANGCHAIN_TRACING_V2", "false") # Default to false if not set
-langchain_endpoint = st.secrets.get("api_keys", {}).get("LANGCHAIN_ENDPOINT", "https://api.smith.langchain.com")
-langchain_api_key = st.secrets.get("api_keys", {}).get("LANGCHAIN_API_KEY", "")
-langchain_project = st.secrets.get("api_keys", {}).get("LANGCHAIN_PROJECT", "Default TI Mindmap")
+# From the app's secrets.toml [api_keys] section, or the environment for headless runs
+langchain_tracing_v2 = get_secret("LANGCHAIN_TRACING_V2", default="false") # Default to false if not set
+langchain_endpoint = get_secret("LANGCHAIN_ENDPOINT", default="https://api.smith.langchain.com")
+langchain_api_key = get_secret("LANGCHAIN_API_KEY", default="")
+langchain_project = get_secret("LANGCHAIN_PROJECT", default="Default TI Mindmap")
 
 # Setting the environment variables
 os.environ["LANGCHAIN_TRACING_V2"] = langchain_tracing_v2
@@ -66,33 +65,18 @@ def ai_summarise_tweet(input_text, client, ai_service_provider, selected_languag
     
     try:
         model_to_use = get_model_name(ai_service_provider, deployment_name)
-        
-        if ai_service_provider in ["OpenAI", "Azure OpenAI"]:
-            response = client.chat.completions.create(
-                model=model_to_use,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": input_text},
-                ],
-                max_tokens=70 # Max tokens for a short tweet
-            )
-            return response.choices[0].message.content
-        elif ai_service_provider == "MistralAI":
-            chat_response = client.chat(
-                model=model_to_use, # Use the determined model
-                messages=[
-                    ChatMessage(role="system", content=system_message),
-                    ChatMessage(role="user", content=input_text),
-                ],
-                max_tokens=70
-            )
-            return chat_response.choices[0].message.content
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": input_text},
+        ]
+        return chat_completion(client, ai_service_provider, model_to_use, messages, max_tokens=70, # Max tokens for a short tweet
+                               budget_text=input_text, component="summary_tweet")
     except Exception as e:
         return f"Error generating tweet summary: {e}"
 
 @traceable
-def ai_summarise(input_text, client, ai_service_provider, selected_language, deployment_name=None):
-    """Summarizes a long text for a Threat Analyst."""
+def ai_summarise(input_text, client, ai_service_provider, selected_language, deployment_name=None, stream=False):
+    """Summarizes a long text for a Threat Analyst. With stream=True, returns a generator of text chunks."""
     if not all([input_text, client, ai_service_provider]):
         return "Error: Invalid input parameters for summary."
         
@@ -105,25 +89,14 @@ def ai_summarise(input_text, client, ai_service_provider, selected_language, dep
     
     try:
         model_to_use = get_model_name(ai_service_provider, deployment_name)
-
-        if ai_service_provider in ["OpenAI", "Azure OpenAI"]:
-            response = client.chat.completions.create(
-                model=model_to_use,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": input_text},
-                ],
-            )
-            return response.choices[0].message.content
-        elif ai_service_provider == "MistralAI":
-            chat_response = client.chat(
-                model=model_to_use,
-                messages=[
-                    ChatMessage(role="system", content=system_message),
-                    ChatMessage(role="user", content=input_text),
-                ],
-            )
-            return chat_response.choices[0].message.content
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": input_text},
+        ]
+        if stream:
+            return stream_or_error(stream_chat_completion(client, ai_service_provider, model_to_use, messages,
+                                                          budget_text=input_text, component="summary"), "Error generating summary")
+        return chat_completion(client, ai_service_provider, model_to_use, messages, budget_text=input_text, component="summary")
     except Exception as e:
         return f"Error generating summary: {e}"
 
@@ -142,27 +115,12 @@ def ai_check_content_relevance(input_text, client, ai_service_provider, deployme
     
     try:
         model_to_use = get_model_name(ai_service_provider, deployment_name)
-
-        if ai_service_provider in ["OpenAI", "Azure OpenAI"]:
-            response = client.chat.completions.create(
-                model=model_to_use,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": input_text}
-                ],
-                max_tokens=50 # Enough for Yes/No and brief reason
-            )
-            return response.choices[0].message.content
-        elif ai_service_provider == "MistralAI":
-            chat_response = client.chat(
-                model=model_to_use,
-                messages=[
-                    ChatMessage(role="system", content=system_message),
-                    ChatMessage(role="user", content=input_text)
-                ],
-                max_tokens=50
-            )
-            return chat_response.choices[0].message.content
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": input_text}
+        ]
+        return chat_completion(client, ai_service_provider, model_to_use, messages, max_tokens=50, # Enough for Yes/No and brief reason
+                               budget_text=input_text, component="relevance")
     except Exception as e:
         return f"Error checking content relevance: {e}"
 
@@ -198,8 +156,8 @@ MERMAID_MINDMAP_ASSISTANT_EXAMPLE = (
 )
 
 @traceable
-def ai_run_models(input_text, client, selected_language, ai_service_provider, deployment_name=None):
-    """Generates a detailed Mermaid.js mindmap."""
+def ai_run_models(input_text, client, selected_language, ai_service_provider, deployment_name=None, stream=False):
+    """Generates a detailed Mermaid.js mindmap. With stream=True, returns a generator of text chunks."""
     if not all([input_text, client, ai_service_provider]):
         return "Error: Invalid input parameters for detailed mindmap."
 
@@ -215,19 +173,16 @@ def ai_run_models(input_text, client, selected_language, ai_service_provider, de
             {"role": "user", "content": input_text}, # Actual user input for generation
         ]
 
-        if ai_service_provider in ["OpenAI", "Azure OpenAI"]:
-            response = client.chat.completions.create(model=model_to_use, messages=messages)
-            return response.choices[0].message.content
-        elif ai_service_provider == "MistralAI":
-            mistral_messages = [ChatMessage(role=m["role"], content=m["content"]) for m in messages]
-            chat_response = client.chat(model=model_to_use, messages=mistral_messages)
-            return chat_response.choices[0].message.content
+        if stream:
+            return stream_or_error(stream_chat_completion(client, ai_service_provider, model_to_use, messages,
+                                                          budget_text=input_text, component="mindmap"), "Error generating detailed mindmap")
+        return chat_completion(client, ai_service_provider, model_to_use, messages, budget_text=input_text, component="mindmap")
     except Exception as e:
         return f"Error generating detailed mindmap: {e}"
 
 @traceable
-def ai_run_models_markmap(input_text, client, selected_language, ai_service_provider, deployment_name=None):
-    """Generates a Markmap.js mindmap."""
+def ai_run_models_markmap(input_text, client, selected_language, ai_service_provider, deployment_name=None, stream=False):
+    """Generates a Markmap.js mindmap. With stream=True, returns a generator of text chunks."""
     if not all([input_text, client, ai_service_provider]):
         return "Error: Invalid input parameters for Markmap."
         
@@ -258,13 +213,10 @@ def ai_run_models_markmap(input_text, client, selected_language, ai_service_prov
             {"role": "assistant", "content": markmap_assistant_example},
             {"role": "user", "content": input_text},
         ]
-        if ai_service_provider in ["OpenAI", "Azure OpenAI"]:
-            response = client.chat.completions.create(model=model_to_use, messages=messages)
-            return response.choices[0].message.content
-        elif ai_service_provider == "MistralAI":
-            mistral_messages = [ChatMessage(role=m["role"], content=m["content"]) for m in messages]
-            chat_response = client.chat(model=model_to_use, messages=mistral_messages)
-            return chat_response.choices[0].message.content
+        if stream:
+            return stream_or_error(stream_chat_completion(client, ai_service_provider, model_to_use, messages,
+                                                          budget_text=input_text, component="markmap"), "Error generating Markmap")
+        return chat_completion(client, ai_service_provider, model_to_use, messages, budget_text=input_text, component="markmap")
     except Exception as e:
         return f"Error generating Markmap: {e}"
 
@@ -292,13 +244,7 @@ def ai_run_models_tweet(input_text, client, selected_language, ai_service_provid
             {"role": "assistant", "content": tweet_mindmap_assistant_example},
             {"role": "user", "content": input_text},
         ]
-        if ai_service_provider in ["OpenAI", "Azure OpenAI"]:
-            response = client.chat.completions.create(model=model_to_use, messages=messages)
-            return response.choices[0].message.content
-        elif ai_service_provider == "MistralAI":
-            mistral_messages = [ChatMessage(role=m["role"], content=m["content"]) for m in messages]
-            chat_response = client.chat(model=model_to_use, messages=mistral_messages)
-            return chat_response.choices[0].message.content
+        return chat_completion(client, ai_service_provider, model_to_use, messages, budget_text=input_text, component="tweet_mindmap")
     except Exception as e:
         return f"Error generating tweet mindmap: {e}"
 
@@ -306,46 +252,11 @@ def ai_run_models_tweet(input_text, client, selected_language, ai_service_provid
 def create_dataframe_from_response(response_content_str):
     """Creates a pandas DataFrame from a CSV-like string response."""
     if not response_content_str or not response_content_str.strip():
-        # st.warning("AI response for IOCs is empty.")
         return pd.DataFrame() # Return empty DataFrame
-
     try:
-        # Split lines and then split by comma, handling potential quotes
-        lines = response_content_str.strip().split("\n")
-        if not lines:
-            return pd.DataFrame()
-
-        header = [h.strip().replace('"', '') for h in lines[0].split(",")]
-        
-        data_rows = []
-        for line in lines[1:]:
-            if not line.strip(): continue
-            # Simple split by comma, assumes commas in descriptions are handled by LLM or not present
-            # A more robust CSV parser might be needed if LLM output is complex
-            row_values = [val.strip().replace('"', '') for val in line.split(",")]
-            data_rows.append(row_values)
-
-        # Ensure all rows have the same number of columns as the header
-        # Pad with empty strings if necessary
-        standardized_data = []
-        for row in data_rows:
-            if len(row) < len(header):
-                standardized_data.append(row + [''] * (len(header) - len(row)))
-            elif len(row) > len(header):
-                 standardized_data.append(row[:len(header)]) # Truncate
-            else:
-                standardized_data.append(row)
-        
-        if not standardized_data and not header: # No data at all
-             return pd.DataFrame()
-        if not standardized_data and header: # Only header, no data
-            return pd.DataFrame(columns=header)
-
-
-        df = pd.DataFrame(standardized_data, columns=header)
-        return df
+        return parse_ioc_csv(response_content_str)
     except Exception as e:
-        st.error(f"Error parsing IOCs into DataFrame: {e}. Raw response: '{response_content_str[:200]}...'")
+        ti_events.error(f"Error parsing IOCs into DataFrame: {e}. Raw response: '{response_content_str[:200]}...'", source="ti_ai")
         return pd.DataFrame() # Return empty DataFrame on error
 
 def calculate_sha256(url_string):
@@ -353,29 +264,23 @@ def calculate_sha256(url_string):
     return hashlib.sha256(url_string.encode()).hexdigest()
 
 def update_virus_total_urls(ioc_dataframe):
-    """Updates VirusTotal URLs for URL type indicators in the DataFrame."""
+    """Updates VirusTotal URLs for all indicator types in the DataFrame (column-wise, see ti_ioc)."""
     if "Type" not in ioc_dataframe.columns or "Indicator" not in ioc_dataframe.columns:
-        # st.warning("IOC DataFrame missing 'Type' or 'Indicator' column for VirusTotal URL update.")
         return ioc_dataframe
-    if "Virus Total URL" not in ioc_dataframe.columns:
-        ioc_dataframe["Virus Total URL"] = "" # Ensure column exists
-
-    for index, row in ioc_dataframe.iterrows():
-        try:
-            if row["Type"] == "URL" and pd.notna(row["Indicator"]):
-                sha256 = calculate_sha256(str(row["Indicator"]))
-                ioc_dataframe.at[index, "Virus Total URL"] = f"https://www.virustotal.com/gui/url/{sha256}"
-            # Other types are assumed to be handled by the LLM prompt correctly
-        except Exception as e:
-            # st.warning(f"Could not update VirusTotal URL for row {index}: {e}")
-            pass # Continue processing other rows
-    return ioc_dataframe
+    return add_virus_total_urls(ioc_dataframe)
 
 @traceable
-def ai_extract_iocs(input_text, client, ai_service_provider, deployment_name=None):
-    """Extracts IOCs from text and returns a pandas DataFrame."""
+def ai_extract_iocs(input_text, client, ai_service_provider, deployment_name=None, structured=False):
+    """
+    Extracts IOCs from text and returns a pandas DataFrame.
+
+    With structured=True the model answers with IOC_SCHEMA JSON, which becomes the DataFrame
+    directly; otherwise it answers with CSV that is parsed.
+    """
     if not all([input_text, client, ai_service_provider]):
         return "Error: Invalid input parameters for IOC extraction."
+    if structured:
+        return _ai_extract_iocs_structured(input_text, client, ai_service_provider, deployment_name)
 
     # Simplified prompt: Python will now construct the SHA256 URL for "URL" types.
     # LLM should focus on extracting Type, Indicator, Description, and basic VT URLs for non-URL types.
@@ -394,42 +299,50 @@ def ai_extract_iocs(input_text, client, ai_service_provider, deployment_name=Non
     
     try:
         model_to_use = get_model_name(ai_service_provider, deployment_name)
-        response_content_str = ""
+        messages = [{"role": "system", "content": prompt},
+                    {"role": "user", "content": input_text}]
+        response_content_str = chat_completion(client, ai_service_provider, model_to_use, messages, budget_text=input_text, component="iocs")
 
-        if ai_service_provider in ["OpenAI", "Azure OpenAI"]:
-            response = client.chat.completions.create(
-                model=model_to_use,
-                messages=[{"role": "system", "content": prompt},
-                          {"role": "user", "content": input_text}]
-            )
-            response_content_str = response.choices[0].message.content
-        elif ai_service_provider == "MistralAI":
-            chat_response = client.chat(
-                model=model_to_use,
-                messages=[
-                    ChatMessage(role="system", content=prompt),
-                    ChatMessage(role="user", content=input_text)
-                ]
-            )
-            response_content_str = chat_response.choices[0].message.content
-        
         if not response_content_str or "no iocs found" in response_content_str.lower() or "no indicators found" in response_content_str.lower() :
             return pd.DataFrame(columns=["Indicator", "Type", "Description", "Virus Total URL"]) # Return empty DF with headers
 
         ioc_dataframe = create_dataframe_from_response(response_content_str)
         
         if not ioc_dataframe.empty:
-            ioc_dataframe = update_virus_total_urls(ioc_dataframe) # Call the helper function
+            ioc_dataframe = normalize_ioc_dataframe(ioc_dataframe) # Refang, canonicalize, dedupe and add VirusTotal links
         return ioc_dataframe
     except Exception as e:
         return f"Error extracting IOCs: {e}"
 
+def _ai_extract_iocs_structured(input_text, client, ai_service_provider, deployment_name=None):
+    prompt = (
+        "Extract the indicators of compromise (IOCs) from the provided text for a threat analyst. "
+        "Refang every indicator (e.g. 'hxxp://example[.]com' becomes 'http://example.com'). "
+        "Only include indicators that appear in the text; return an empty list if there are none."
+    )
+    try:
+        model_to_use = get_model_name(ai_service_provider, deployment_name)
+        messages = [{"role": "system", "content": prompt},
+                    {"role": "user", "content": input_text}]
+        result = structured_completion(client, ai_service_provider, model_to_use, messages, IOC_SCHEMA, "ioc_table",
+                                       budget_text=input_text, component="iocs")
+        return normalize_ioc_dataframe(ioc_dataframe_from_records(result.get("iocs") or []))
+    except Exception as e:
+        return f"Error extracting IOCs: {e}"
+
 
 @traceable
-def ai_ttp(text, client, ai_service_provider, deployment_name=None):
-    """Extracts TTPs and formats them as a Markdown table string."""
+def ai_ttp(text, client, ai_service_provider, deployment_name=None, structured=False):
+    """
+    Extracts TTPs and formats them as a Markdown table string.
+
+    With structured=True, returns a ti_schemas.TTPTable built from TTP_SCHEMA JSON instead; its
+    str() is the same Markdown table.
+    """
     if not all([text, client, ai_service_provider]):
         return "Error: Invalid input parameters for TTP extraction."
+    if structured:
+        return _ai_ttp_structured(text, client, ai_service_provider, deployment_name)
 
     user_prompt_ttp = (
         "Using the ATT&CK Matrix for Enterprise, extract Tactics, Techniques, and Procedures (TTPs) "
@@ -440,18 +353,24 @@ def ai_ttp(text, client, ai_service_provider, deployment_name=None):
     )
     try:
         model_to_use = get_model_name(ai_service_provider, deployment_name)
-        if ai_service_provider in ["OpenAI", "Azure OpenAI"]:
-            response = client.chat.completions.create(
-                model=model_to_use,
-                messages=[{"role": "user", "content": user_prompt_ttp}],
-            )
-            return response.choices[0].message.content
-        elif ai_service_provider == "MistralAI":
-            response = client.chat(
-                model=model_to_use,
-                messages=[ChatMessage(role="user", content=user_prompt_ttp)],
-            )
-            return response.choices[0].message.content
+        messages = [{"role": "user", "content": user_prompt_ttp}]
+        return chat_completion(client, ai_service_provider, model_to_use, messages, budget_text=text, component="ttptable")
+    except Exception as e:
+        return f"Error extracting TTPs table: {e}"
+
+def _ai_ttp_structured(text, client, ai_service_provider, deployment_name=None):
+    system_prompt_ttp = (
+        "Using the ATT&CK Matrix for Enterprise, extract Tactics, Techniques, and Procedures (TTPs) "
+        "from the provided text. For each identified technique, include its name, ID, tactic, and a comment "
+        "with the relevant context derived from the text. Focus on the most important TTPs."
+    )
+    try:
+        model_to_use = get_model_name(ai_service_provider, deployment_name)
+        messages = [{"role": "system", "content": system_prompt_ttp},
+                    {"role": "user", "content": text}]
+        result = structured_completion(client, ai_service_provider, model_to_use, messages, TTP_SCHEMA, "ttp_table",
+                                       budget_text=text, component="ttptable")
+        return TTPTable.from_dict(result)
     except Exception as e:
         return f"Error extracting TTPs table: {e}"
 
@@ -479,13 +398,7 @@ def ai_ttp_list(text, ttptable_str, client, ai_service_provider, deployment_name
             {"role": "system", "content": system_prompt_ttp_list},
             {"role": "user", "content": user_prompt_ttp_list},
         ]
-        if ai_service_provider in ["OpenAI", "Azure OpenAI"]:
-            response = client.chat.completions.create(model=model_to_use, messages=messages)
-            return response.choices[0].message.content
-        elif ai_service_provider == "MistralAI":
-            mistral_messages = [ChatMessage(role=m["role"], content=m["content"]) for m in messages]
-            response = client.chat(model=model_to_use, messages=mistral_messages)
-            return response.choices[0].message.content
+        return chat_completion(client, ai_service_provider, model_to_use, messages, budget_text=text, component="attackpath")
     except Exception as e:
         return f"Error generating TTP execution list: {e}"
 
@@ -527,39 +440,116 @@ def ai_ttp_graph_timeline(text_content, client, ai_service_provider, deployment_
     try:
         model_to_use = get_model_name(ai_service_provider, deployment_name)
         messages = [{"role": "user", "content": user_prompt_ttp_graph_timeline}]
-        if ai_service_provider in ["OpenAI", "Azure OpenAI"]:
-            response = client.chat.completions.create(model=model_to_use, messages=messages)
-            return response.choices[0].message.content
-        elif ai_service_provider == "MistralAI":
-            mistral_messages = [ChatMessage(role="user", content=user_prompt_ttp_graph_timeline)]
-            response = client.chat(model=model_to_use, messages=mistral_messages)
-            return response.choices[0].message.content
+        return chat_completion(client, ai_service_provider, model_to_use, messages, budget_text=text_content, component="timeline")
     except Exception as e:
         return f"Error generating TTP timeline graph: {e}"
 
 
+# --- Fused Extraction ---
+# One call returning several artifacts, so the article's input tokens are processed once instead of
+# once per component. Artifacts are named after the session_state keys they are stored in.
+
+FUSED_ARTIFACTS = tuple(FUSED_ARTIFACT_PROPERTIES) # relevance, summary, iocs_df, ttptable, 5whats
+
+FUSED_ARTIFACT_INSTRUCTIONS = {
+    "relevance": "relevance: whether the text is primarily about cybersecurity, cyber threats, threat intelligence or information security, and its main topic.",
+    "summary": ("summary: a detailed summary in {language} for a Threat Analyst covering the main topic, key findings, IOCs and TTPs. "
+                "Use paragraphs, include a title and a relevant emoji, avoid bullet points. Markdown is allowed."),
+    "iocs_df": "iocs: the indicators of compromise that appear in the text, refanged (e.g. 'hxxp://example[.]com' becomes 'http://example.com'). Empty list if none.",
+    "ttptable": ("ttps: the most important Tactics, Techniques and Procedures from the ATT&CK Matrix for Enterprise, "
+                 "each with its name, ID, tactic and a comment with the relevant context from the text."),
+    "5whats": ("five_whats: the threat scope report, answering each of " + ", ".join(FIVE_WHATS_QUESTIONS)
+               + f" from the text, with {NOT_APPLICABLE} where the text does not answer."),
+}
+
+@traceable
+def ai_fused_extraction(input_text, client, ai_service_provider, selected_language, artifacts, deployment_name=None):
+    """
+    Generates several artifacts (see FUSED_ARTIFACTS) in a single structured-output call.
+
+    Args:
+        input_text (str): The article text.
+        client (LLMProvider): A provider returned by ti_llm.get_provider.
+        ai_service_provider (str): "OpenAI", "Azure OpenAI" or "MistralAI".
+        selected_language (list[str]): Languages for the summary.
+        artifacts (list[str]): Artifacts to generate, e.g. ["summary", "iocs_df", "ttptable"].
+        deployment_name (str, optional): Azure deployment or Mistral model name.
+
+    Returns:
+        dict | str: The artifacts split by dispatch_fused_result, or an error message.
+    """
+    artifacts = [name for name in FUSED_ARTIFACTS if name in artifacts]
+    if not all([input_text, client, ai_service_provider, artifacts]):
+        return "Error: Invalid input parameters for fused extraction."
+
+    language = ", ".join(selected_language) if selected_language else "English"
+    system_message = (
+        "You are a Threat Analyst processing a threat report in a single pass. "
+        "Fill in every field of the JSON object from the text provided by the user:\n"
+        + "\n".join("- " + FUSED_ARTIFACT_INSTRUCTIONS[name].format(language=language) for name in artifacts)
+    )
+    try:
+        model_to_use = get_model_name(ai_service_provider, deployment_name)
+        messages = [{"role": "system", "content": system_message},
+                    {"role": "user", "content": input_text}]
+        result = structured_completion(client, ai_service_provider, model_to_use, messages, fused_schema(artifacts), "fused_report",
+                                       budget_text=input_text, component="fused")
+        return dispatch_fused_result(result, artifacts)
+    except Exception as e:
+        return f"Error generating fused report: {e}"
+
+def dispatch_fused_result(result, artifacts):
+    """
+    Splits a fused extraction into the values the separate components would have produced.
+
+    Returns:
+        dict: session_state key -> value. "summary" is a string, "iocs_df" a normalized DataFrame,
+        "ttptable" a TTPTable, "5whats" a FiveWhatsReport and "relevance" the raw
+        {"is_cybersecurity", "main_topic"} dict. Artifacts missing from the answer are left out.
+    """
+    values = {}
+    for name in artifacts:
+        property_name = FUSED_ARTIFACT_PROPERTIES[name][0]
+        if property_name not in result:
+            continue
+        data = result[property_name]
+        if name == "iocs_df":
+            values[name] = normalize_ioc_dataframe(ioc_dataframe_from_records(data or []))
+        elif name == "ttptable":
+            values[name] = TTPTable.from_dict({"ttps": data})
+        elif name == "5whats":
+            values[name] = FiveWhatsReport.from_dict({"answers": data})
+        else:
+            values[name] = data
+    return values
+
 # --- Langchain QA Functions ---
 @traceable
 def ai_process_text(text, service_selection, azure_api_key, azure_endpoint, azure_embedding_deployment, openai_api_key, mistral_api_key):
     """Processes text and creates a FAISS knowledge base for Langchain QA."""
     if not text or not text.strip():
-        st.warning("Input text for AI processing is empty.")
+        ti_events.warning("Input text for AI processing is empty.", source="ti_ai")
         return None
-    
+
+    from langchain.text_splitter import CharacterTextSplitter
+    from langchain_community.vectorstores import FAISS
     text_splitter = CharacterTextSplitter(separator="\n", chunk_size=1000, chunk_overlap=200, length_function=len)
     chunks = text_splitter.split_text(text)
     if not chunks:
-        st.warning("Text splitting resulted in no chunks.")
+        ti_events.warning("Text splitting resulted in no chunks.", source="ti_ai")
         return None
 
     embeddings_object = None
     try:
         if service_selection == "OpenAI":
             if not openai_api_key: raise ValueError("OpenAI API key not provided.")
+            from langchain_openai import OpenAIEmbeddings
             embeddings_object = OpenAIEmbeddings(openai_api_key=openai_api_key)
+            embedding_model = "text-embedding-ada-002"
         elif service_selection == "Azure OpenAI":
             if not all([azure_api_key, azure_endpoint, azure_embedding_deployment]): 
                 raise ValueError("Azure API key, endpoint, or embedding deployment name not provided.")
+            from langchain_openai import AzureOpenAIEmbeddings
             embeddings_object = AzureOpenAIEmbeddings(
                 deployment=azure_embedding_deployment,
                 model="text-embedding-ada-002", # Often a default, confirm this is your deployed embedding model name
@@ -568,20 +558,26 @@ def ai_process_text(text, service_selection, azure_api_key, azure_endpoint, azur
                 chunk_size=1, # Recommended for AzureOpenAIEmbeddings
                 api_version="2024-02-15-preview" # Or your preferred API version
             )
+            embedding_model = "text-embedding-ada-002"
         elif service_selection == "MistralAI":
             if not mistral_api_key: raise ValueError("MistralAI API key not provided.")
+            from langchain_mistralai import MistralAIEmbeddings
             embeddings_object = MistralAIEmbeddings(mistral_api_key=mistral_api_key, model=MISTRAL_DEFAULT_EMBED_MODEL)
+            embedding_model = MISTRAL_DEFAULT_EMBED_MODEL
         else:
             raise ValueError(f"Invalid AI service selection for embeddings: {service_selection}")
 
         if embeddings_object:
-            knowledge_base = FAISS.from_texts(chunks, embeddings_object)
+            with ti_metrics.track(ti_metrics.KIND_EMBEDDING, "chat_knowledge_base", provider=service_selection,
+                                  model=embedding_model, chunks=len(chunks)) as metric:
+                knowledge_base = FAISS.from_texts(chunks, embeddings_object)
+                metric.set_usage(sum(count_tokens(chunk) for chunk in chunks), 0, estimated=True)
             return knowledge_base
         else:
-            st.error("Failed to initialize embeddings object.")
+            ti_events.error("Failed to initialize embeddings object.", source="ti_ai")
             return None
     except Exception as e:
-        st.error(f"Error processing text for AI Chat: {e}")
+        ti_events.error(f"Error processing text for AI Chat: {e}", source="ti_ai")
         return None
 
 #@traceable
@@ -603,10 +599,12 @@ def ai_get_response(knowledge_base, query, service_selection, azure_api_key, azu
         #    llm = langchainOAI(openai_api_key=openai_api_key, model_name=OPENAI_DEFAULT_MODEL, temperature=0.7)
         if service_selection == "OpenAI":
             if not openai_api_key: raise ValueError("OpenAI API key not provided.")
+            from langchain_openai import ChatOpenAI as langchainChatOpenAI
             llm = langchainChatOpenAI(openai_api_key=openai_api_key, model_name=OPENAI_DEFAULT_MODEL, temperature=0.7)
         elif service_selection == "Azure OpenAI":
             if not all([azure_api_key, azure_endpoint, deployment_name]):
                 raise ValueError("Azure API key, endpoint, or deployment name not provided.")
+            from langchain_openai import AzureChatOpenAI
             llm = AzureChatOpenAI(
                 # model parameter for AzureChatOpenAI is often the deployment name itself, or a specific model if your endpoint supports it.
                 # Using deployment_name here as it refers to the chat model deployment.
@@ -620,16 +618,27 @@ def ai_get_response(knowledge_base, query, service_selection, azure_api_key, azu
         elif service_selection == "MistralAI":
             if not mistral_api_key: raise ValueError("MistralAI API key not provided.")
             # `deployment_name` from timindmapgpt.py for MistralAI is the model name
+            from langchain_mistralai.chat_models import ChatMistralAI as langchainMistralChat # Renamed for clarity
             llm = langchainMistralChat(api_key=mistral_api_key, model=deployment_name if deployment_name else MISTRAL_DEFAULT_CHAT_MODEL, temperature=0.7)
         else:
             raise ValueError(f"Invalid AI service selection for LLM: {service_selection}")
 
         if llm:
+            from langchain.chains.question_answering import load_qa_chain
+            from langchain_community.callbacks import get_openai_callback
             chain = load_qa_chain(llm, chain_type="stuff") # "stuff" is good for smaller contexts
-            with get_openai_callback() as cb: # This callback might primarily track OpenAI/Azure costs
-                response = chain.invoke(input={"question": query, "input_documents": docs})
-                # st.info(f"QA Chain Cost: {cb}") # Optional: display cost if needed
-            return response.get("output_text", "No answer found.")
+            model = OPENAI_DEFAULT_MODEL if service_selection == "OpenAI" else (deployment_name or MISTRAL_DEFAULT_CHAT_MODEL)
+            with ti_metrics.track(ti_metrics.KIND_LLM, "chat_answer", provider=service_selection, model=model) as metric:
+                with get_openai_callback() as cb: # Counts tokens (and cost) of OpenAI/Azure models only
+                    response = chain.invoke(input={"question": query, "input_documents": docs})
+                answer = response.get("output_text", "No answer found.")
+                if cb.total_tokens:
+                    metric.set_usage(cb.prompt_tokens, cb.completion_tokens)
+                    metric.details["callback_cost_usd"] = cb.total_cost
+                else:
+                    prompt = query + "\n".join(doc.page_content for doc in docs)
+                    metric.set_usage(count_tokens(prompt, model), count_tokens(answer, model), estimated=True)
+            return answer
         else:
             return "LLM not initialized."
     except Exception as e:
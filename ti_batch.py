@@ -0,0 +1,469 @@
+"""
+Headless batch runner: generates TI Mindmap reports for many URLs, PDFs and text files without Streamlit.
+
+Each source gets its own folder in the output directory with report.json, iocs.csv,
+stix_bundle.json, navigator_layer.json and report.pdf (depending on --components). Progress is
+checkpointed after every finished component, so an interrupted run picks up where it stopped.
+Sources run on threads by default; with --processes each worker is a separate process (useful when
+PDF rendering and parsing, not the AI provider, are the bottleneck).
+Every source folder also gets metrics.jsonl (latency, tokens and cost of each call, see ti_metrics),
+and the output directory gets metrics.prom with the totals of the batch in the Prometheus text format.
+A source whose text is a near-duplicate of one analyzed before (see ti_dedup) reuses that
+analysis' results instead of regenerating them (--no-dedup turns this off).
+
+Usage:
+    python ti_batch.py https://example.com/report reports/*.pdf notes/ --list feed.txt \\
+        --output batch_output --provider OpenAI --workers 4
+
+API keys are read from OPENAI_API_KEY, AZURE_OPENAI_API_KEY (+ AZURE_OPENAI_ENDPOINT) or
+MISTRAL_API_KEY unless --api-key is given.
+"""
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import datetime
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse
+import pandas as pd
+
+import ti_ai
+import ti_dedup
+import ti_events
+import ti_metrics
+import ti_5whats
+import ti_ioc
+import ti_llm
+import ti_longdoc
+import ti_navigator
+import ti_relevance
+import ti_scheduler
+import ti_stix
+from ti_ingest import scrape_text, extract_text_from_pdf, SCRAPE_ERROR_PREFIXES
+from ti_schemas import TTPTable, FiveWhatsReport
+
+# --- Constants ---
+SOURCE_EXTENSIONS = (".pdf", ".txt", ".md")
+ALL_COMPONENTS = ("summary", "mindmap", "iocs", "ttps", "attackpath", "timeline", "5whats", "navigator", "stix", "pdf")
+DEFAULT_WORKERS = 2           # Sources processed at the same time
+CHECKPOINT_FILE = "checkpoint.json"
+SUMMARY_FILE = "batch_summary.json"
+METRICS_FILE = "metrics.jsonl" # Per source, appended on every run (resumed runs add their calls)
+PROMETHEUS_FILE = "metrics.prom"
+API_KEY_ENVIRONMENT = {"OpenAI": "OPENAI_API_KEY", "Azure OpenAI": "AZURE_OPENAI_API_KEY", "MistralAI": "MISTRAL_API_KEY"}
+
+# Statuses recorded in a source's checkpoint
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_NOT_RELEVANT = "not_relevant"
+FINISHED_STATUSES = (STATUS_DONE, STATUS_NOT_RELEVANT)
+
+# Error strings returned (instead of raised) by the ti_ai / ti_stix / ti_5whats generation functions
+_ERROR_PREFIXES = ("Error", "An error occurred", "Invalid input parameters")
+
+# --- Sources ---
+
+def is_url(source):
+    return source.lower().startswith(("http://", "https://"))
+
+def expand_sources(inputs, list_files=()):
+    """Returns the sources to process: URLs and files as given, directories expanded, list files read."""
+    sources = []
+    for list_file in list_files:
+        with open(list_file, encoding="utf-8") as f:
+            sources += [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    for item in inputs:
+        if not is_url(item) and os.path.isdir(item):
+            for root, _, files in sorted(os.walk(item)):
+                sources += [os.path.join(root, name) for name in sorted(files) if name.lower().endswith(SOURCE_EXTENSIONS)]
+        else:
+            sources.append(item)
+    return list(dict.fromkeys(sources)) # Drop duplicates, keep order
+
+def source_id(source):
+    """A stable, filesystem-safe folder name for a source."""
+    name = urlparse(source).netloc + urlparse(source).path if is_url(source) else os.path.basename(source)
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", name).strip("-")[:60] or "source"
+    return f"{slug}-{hashlib.sha1(source.encode('utf-8')).hexdigest()[:10]}"
+
+def load_source_text(source):
+    """Returns the text of a URL, PDF or text file. Raises ValueError if no text could be extracted."""
+    if is_url(source):
+        text, error = scrape_text(source), None # PDFs served from a URL are recognized by their content (see ti_fetch)
+    elif source.lower().endswith(".pdf"):
+        text, error = extract_text_from_pdf(source)
+    else:
+        with open(source, encoding="utf-8", errors="replace") as f:
+            text, error = f.read(), None
+    if error or not text or not text.strip() or text.startswith(SCRAPE_ERROR_PREFIXES):
+        raise ValueError(error or text or "No text extracted.")
+    return text
+
+# --- Checkpoints ---
+
+def _write_atomic(path, data, binary=False):
+    """Writes a file via a temporary file and a rename, so a crash never leaves a half-written file."""
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb" if binary else "w", **({} if binary else {"encoding": "utf-8"})) as f:
+        f.write(data)
+    os.replace(temporary_path, path)
+
+class Checkpoint:
+    """The saved state of one source: status, finished component results and errors."""
+    def __init__(self, directory, source):
+        self.path = os.path.join(directory, CHECKPOINT_FILE)
+        self.state = {"source": source, "status": STATUS_RUNNING, "results": {}, "errors": {}}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.state.update(json.load(f))
+
+    @property
+    def status(self):
+        return self.state["status"]
+
+    def results(self):
+        return {name: ti_dedup.deserialize_artifact(value) for name, value in self.state["results"].items()}
+
+    def record(self, name, value):
+        self.state["results"][name] = ti_dedup.serialize_artifact(value)
+        self.state["errors"].pop(name, None)
+
+    def record_error(self, name, error):
+        self.state["errors"][name] = str(error)
+
+    def save(self, status=None):
+        if status:
+            self.state["status"] = status
+        self.state["updated_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+        _write_atomic(self.path, json.dumps(self.state, indent=2, ensure_ascii=False, default=str))
+
+# --- Report Generation ---
+
+def _checked(value):
+    """Turns the error strings returned by the generation functions into exceptions (so dependents are skipped)."""
+    if value is None or (isinstance(value, str) and value.strip().startswith(_ERROR_PREFIXES)):
+        raise RuntimeError(value or "No result.")
+    return value
+
+def build_components(text, selected, done, client, provider, deployment_name, options):
+    """
+    Builds the ti_scheduler components for the selected report parts that are not already done.
+
+    Component names are the keys used in the app's session_state (and in the checkpoint).
+    """
+    Component = ti_scheduler.Component
+    language = options["language"]
+    structured = options["structured"]
+    components = []
+
+    def add(name, label, func, depends_on=()):
+        if name not in done:
+            components.append(Component(name, label, lambda r: _checked(func(r)), depends_on=[d for d in depends_on if d not in done]))
+
+    def get(r, name, default=""):
+        return r.get(name, done.get(name, default))
+
+    model = ti_ai.get_model_name(provider, deployment_name)
+    notes = []
+    if ({"summary", "mindmap"} & selected) and ti_longdoc.is_long_document(text, model, options["long_document_threshold"]):
+        add("long_document_notes", "Section notes", lambda r: ti_longdoc.condense_long_document(
+            text, client, provider, deployment_name, options["long_document_threshold"], options["component_concurrency"]))
+        notes = ["long_document_notes"]
+    if "summary" in selected:
+        add("summary", "Summary", lambda r: ti_ai.ai_summarise(get(r, "long_document_notes", text), client, provider, language, deployment_name), notes)
+    if "mindmap" in selected:
+        add("mindmap_code", "MindMap", lambda r: ti_ai.ai_run_models(
+            "Generate a Mermaid MindMap only using the text below:\n" + get(r, "long_document_notes", text), client, language, provider, deployment_name), notes)
+    if "iocs" in selected:
+        add("iocs_df", "IOCs", lambda r: ti_ioc.extract_iocs(text, options["ioc_mode"], client, provider, deployment_name, structured=structured))
+    if {"ttps", "attackpath", "navigator"} & selected:
+        add("ttptable", "TTP table", lambda r: ti_ai.ai_ttp(text, client, provider, deployment_name, structured=structured))
+    if "attackpath" in selected:
+        add("attackpath", "TTPs by execution time", lambda r: ti_ai.ai_ttp_list(text, get(r, "ttptable"), client, provider, deployment_name), ["ttptable"])
+    if "timeline" in selected:
+        add("mermaid_timeline", "TTP timeline", lambda r: ti_ai.ai_ttp_graph_timeline(text, client, provider, deployment_name))
+    if "5whats" in selected:
+        add("5whats", "5 Whats", lambda r: ti_5whats.ai_fivewhats(text, client, provider, deployment_name, structured=structured))
+    if "navigator" in selected:
+        add("mitre_layer_json_str", "Navigator layer", lambda r: ti_navigator.attack_layer(text, get(r, "ttptable"), client, provider, deployment_name), ["ttptable"])
+    if "stix" in selected:
+        typed_inputs = [name for name in ("ttptable", "iocs_df") if name in {c.name for c in components} or name in done]
+        add("stix_bundle", "STIX bundle", lambda r: ti_stix.generate_stix_bundle(
+            text, client, provider, deployment_name, ttp_table=get(r, "ttptable", None), ioc_dataframe=get(r, "iocs_df", None)), typed_inputs)
+    return components
+
+def write_artifacts(directory, source, results, selected, options):
+    """Writes report.json, iocs.csv, stix_bundle.json, navigator_layer.json and report.pdf for a finished source."""
+    iocs = results.get("iocs_df")
+    report = {
+        "source": source,
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "provider": options["provider"],
+        "model": options["model"],
+    }
+    for name, value in results.items():
+        if name in ("stix_bundle", "mitre_layer_json_str"):
+            continue
+        if isinstance(value, pd.DataFrame):
+            report[name] = value.to_dict("records")
+        elif isinstance(value, (TTPTable, FiveWhatsReport)):
+            report[name] = value.to_dict()
+        else:
+            report[name] = value
+    _write_atomic(os.path.join(directory, "report.json"), json.dumps(report, indent=2, ensure_ascii=False, default=str))
+
+    if isinstance(iocs, pd.DataFrame):
+        _write_atomic(os.path.join(directory, "iocs.csv"), iocs.to_csv(index=False))
+    if results.get("stix_bundle"):
+        _write_atomic(os.path.join(directory, "stix_bundle.json"), results["stix_bundle"])
+    if results.get("mitre_layer_json_str"):
+        layer = results["mitre_layer_json_str"]
+        try:
+            layer = json.dumps(json.loads(layer), indent=2)
+            _write_atomic(os.path.join(directory, "navigator_layer.json"), layer)
+        except json.JSONDecodeError:
+            _write_atomic(os.path.join(directory, "navigator_layer.invalid.txt"), layer)
+    if "pdf" in selected:
+        import ti_pdf # reportlab is only loaded when PDFs are requested
+        pdf_bytes = ti_pdf.create_pdf_bytes(
+            url=source,
+            summary_content=results.get("summary", ""),
+            mindmap_mermaid_code=results.get("mindmap_code", ""),
+            iocs_data=iocs if isinstance(iocs, pd.DataFrame) else pd.DataFrame(),
+            ttps_overview_data=results.get("ttptable", ""),
+            attack_path_data=results.get("attackpath", ""),
+            mermaid_timeline_code=results.get("mermaid_timeline", ""),
+            five_whats_data=results.get("5whats", ""),
+            orientation=options["orientation"],
+        )
+        if pdf_bytes:
+            _write_atomic(os.path.join(directory, "report.pdf"), pdf_bytes, binary=True)
+
+def process_source(source, output_dir, client, options):
+    """
+    Generates the report for one source, resuming from its checkpoint.
+
+    Returns:
+        dict: {"source", "id", "status", "seconds", "errors", "events", "metrics", "metric_records"}, where
+        "events" holds the diagnostics (ti_events) emitted while processing the source, "metrics" the
+        ti_metrics totals and "metric_records" every recorded call, as dicts.
+    """
+    sink = ti_events.CollectingSink()
+    with ti_events.use_sink(sink), ti_metrics.collect(source) as run:
+        outcome = _process_source(source, output_dir, client, options)
+    outcome["events"] = [event.to_dict() for event in sink.drain()]
+    if len(run):
+        ti_metrics.write_jsonl(run, os.path.join(output_dir, source_id(source), METRICS_FILE))
+    outcome["metrics"] = run.totals()
+    outcome["metric_records"] = [metric.to_dict() for metric in run.snapshot()]
+    return outcome
+
+def _process_source(source, output_dir, client, options):
+    started = time.monotonic()
+    directory = os.path.join(output_dir, source_id(source))
+    os.makedirs(directory, exist_ok=True)
+    checkpoint = Checkpoint(directory, source)
+    outcome = {"source": source, "id": source_id(source)}
+    if checkpoint.status in FINISHED_STATUSES and not options["force"]:
+        return dict(outcome, status=checkpoint.status, seconds=0.0, errors=checkpoint.state["errors"], resumed=True)
+    if options["force"]:
+        checkpoint.state.update(status=STATUS_RUNNING, results={}, errors={})
+
+    provider, deployment_name = options["provider"], options["model"]
+    selected = set(options["components"])
+    try:
+        text = load_source_text(source)
+    except Exception as e:
+        checkpoint.record_error("source", e)
+        checkpoint.save(STATUS_FAILED)
+        return dict(outcome, status=STATUS_FAILED, seconds=time.monotonic() - started, errors=checkpoint.state["errors"])
+
+    document_id = None
+    if options.get("dedup", True):
+        # A near-duplicate of an analyzed text (e.g. a syndicated copy) starts from that analysis' results
+        document_id, duplicate = ti_dedup.check(text, source)
+        if duplicate is not None and duplicate.has_artifacts and duplicate.source != source and not options["force"]:
+            reused = {name: value for name, value in ti_dedup.get_index().artifacts(duplicate.document_id).items()
+                      if name not in checkpoint.state["results"]}
+            if reused:
+                checkpoint.state["results"].update(reused)
+                checkpoint.state["duplicate_of"] = dict(duplicate.to_dict(), reused=sorted(reused))
+                checkpoint.save()
+                outcome["duplicate_of"] = duplicate.source
+
+    if options["relevance_check"] and "relevance" not in checkpoint.state["results"]:
+        decision = ti_relevance.check_content_relevance(text, client, provider, deployment_name)
+        checkpoint.record("relevance", {"label": decision.label, "source": decision.source, "confidence": decision.confidence})
+        checkpoint.save()
+        if not decision.is_relevant:
+            checkpoint.save(STATUS_NOT_RELEVANT)
+            return dict(outcome, status=STATUS_NOT_RELEVANT, seconds=time.monotonic() - started, errors={})
+
+    done = checkpoint.results()
+    components = build_components(text, selected, done, client, provider, deployment_name, options)
+    saved = set()
+    def save_finished(comps):
+        for component in comps:
+            if component.name in saved or component.status not in (ti_scheduler.DONE, ti_scheduler.FAILED, ti_scheduler.SKIPPED):
+                continue
+            saved.add(component.name)
+            if component.status == ti_scheduler.DONE:
+                checkpoint.record(component.name, component.result)
+            else:
+                checkpoint.record_error(component.name, component.error)
+            checkpoint.save()
+    ti_scheduler.run_components(components, max_concurrency=options["component_concurrency"], on_progress=save_finished)
+
+    if document_id is not None:
+        ti_dedup.get_index().attach_artifacts(document_id, {name: value for name, value in checkpoint.state["results"].items()
+                                                            if name in ti_dedup.ARTIFACT_KEYS})
+    results = checkpoint.results()
+    try:
+        write_artifacts(directory, source, results, selected, options)
+    except Exception as e:
+        checkpoint.record_error("artifacts", e)
+    status = STATUS_FAILED if checkpoint.state["errors"] else STATUS_DONE
+    checkpoint.save(status)
+    return dict(outcome, status=status, seconds=time.monotonic() - started, errors=checkpoint.state["errors"])
+
+# The provider client of a worker process, created once per process by _init_worker
+_worker_client = None
+
+def _init_worker(provider_args):
+    global _worker_client
+    _worker_client = ti_llm.get_provider(**provider_args)
+
+def _process_source_in_worker(source, output_dir, options):
+    return process_source(source, output_dir, _worker_client, options)
+
+def run_batch(sources, output_dir, provider_args, options, on_result=None):
+    """
+    Processes sources with `options["workers"]` in parallel; returns the outcome of each source, in order.
+
+    `provider_args` are the ti_llm.get_provider arguments. Threads share one client (and one rate
+    limiter); with `options["processes"]`, every worker process creates its own.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    outcomes = {}
+    lock = threading.Lock()
+    # Aggregated here from the returned records, as worker processes have their own ti_metrics registry
+    registry = ti_metrics.MetricsRegistry()
+    workers = max(1, options["workers"])
+    if options.get("processes"):
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(provider_args,))
+        submit = lambda source: executor.submit(_process_source_in_worker, source, output_dir, options)
+    else:
+        client = ti_llm.get_provider(**provider_args)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ti-batch")
+        submit = lambda source: executor.submit(process_source, source, output_dir, client, options)
+    with executor:
+        futures = {submit(source): source for source in sources}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e: # Unexpected failure; the checkpoint keeps whatever finished
+                outcome = {"source": source, "id": source_id(source), "status": STATUS_FAILED, "seconds": 0.0, "errors": {"batch": str(e)}}
+            with lock:
+                for record in outcome.pop("metric_records", []):
+                    registry.observe(ti_metrics.CallMetric.from_dict(record))
+                outcomes[source] = outcome
+                if on_result:
+                    on_result(outcome, len(outcomes), len(sources))
+    ordered = [outcomes[source] for source in sources]
+    _write_atomic(os.path.join(output_dir, SUMMARY_FILE), json.dumps(ordered, indent=2, ensure_ascii=False, default=str))
+    _write_atomic(os.path.join(output_dir, PROMETHEUS_FILE), registry.to_prometheus())
+    return ordered
+
+# --- Command Line ---
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="*", help="URLs, PDF / text files, or directories of them.")
+    parser.add_argument("--list", action="append", default=[], metavar="FILE", help="File with one source per line (repeatable).")
+    parser.add_argument("--output", default="batch_output", help="Output directory (default: batch_output).")
+    parser.add_argument("--provider", choices=("OpenAI", "Azure OpenAI", "MistralAI"), default="OpenAI")
+    parser.add_argument("--model", help="Azure deployment name or MistralAI model (OpenAI uses the app's default model).")
+    parser.add_argument("--api-key", help="API key (default: from the provider's environment variable).")
+    parser.add_argument("--endpoint", help="Azure OpenAI endpoint (default: AZURE_OPENAI_ENDPOINT), or a base URL override.")
+    parser.add_argument("--api-version", default=ti_llm.AZURE_OPENAI_API_VERSION, help="Azure OpenAI API version.")
+    parser.add_argument("--components", default=",".join(ALL_COMPONENTS), help=f"Comma-separated subset of: {', '.join(ALL_COMPONENTS)}.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Sources processed in parallel.")
+    parser.add_argument("--processes", action="store_true",
+                        help="Run workers as processes instead of threads (rate limits then apply per process).")
+    parser.add_argument("--component-concurrency", type=int, default=ti_scheduler.DEFAULT_MAX_CONCURRENCY, help="Parallel AI requests per source.")
+    parser.add_argument("--language", action="append", help="Summary / mindmap language (repeatable, default English).")
+    parser.add_argument("--ioc-mode", choices=ti_ioc.EXTRACTION_MODES, default=ti_ioc.MODE_LOCAL)
+    parser.add_argument("--no-structured", action="store_true", help="Use free-text outputs instead of JSON-schema outputs.")
+    parser.add_argument("--no-relevance-check", action="store_true", help="Process sources even if they do not look like security content.")
+    parser.add_argument("--long-document-threshold", type=int, default=ti_longdoc.DEFAULT_LONG_DOCUMENT_THRESHOLD)
+    parser.add_argument("--orientation", choices=("portrait", "landscape"), default="portrait", help="PDF orientation.")
+    parser.add_argument("--force", action="store_true", help="Ignore checkpoints and regenerate every source.")
+    parser.add_argument("--no-dedup", action="store_true", help="Do not reuse the results of near-duplicate texts analyzed before (see ti_dedup).")
+    args = parser.parse_args(argv)
+    if not args.sources and not args.list:
+        parser.error("no sources given")
+    unknown = set(args.components.split(",")) - set(ALL_COMPONENTS)
+    if unknown:
+        parser.error(f"unknown components: {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    api_key = args.api_key or os.environ.get(API_KEY_ENVIRONMENT[args.provider])
+    if not api_key:
+        print(f"No API key: pass --api-key or set {API_KEY_ENVIRONMENT[args.provider]}.", file=sys.stderr)
+        return 2
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    provider_args = {
+        "ai_service_provider": args.provider,
+        "api_key": api_key,
+        "endpoint": args.endpoint or (os.environ.get("AZURE_OPENAI_ENDPOINT") if args.provider == "Azure OpenAI" else None),
+        "api_version": args.api_version if args.provider == "Azure OpenAI" else None,
+    }
+    options = {
+        "provider": args.provider,
+        "model": args.model,
+        "components": [name for name in args.components.split(",") if name],
+        "workers": args.workers,
+        "processes": args.processes,
+        "component_concurrency": args.component_concurrency,
+        "language": args.language or ["English"],
+        "ioc_mode": args.ioc_mode,
+        "structured": not args.no_structured,
+        "relevance_check": not args.no_relevance_check,
+        "long_document_threshold": args.long_document_threshold,
+        "orientation": args.orientation,
+        "force": args.force,
+        "dedup": not args.no_dedup,
+    }
+    sources = expand_sources(args.sources, args.list)
+    print(f"Processing {len(sources)} sources with {args.workers} workers into {args.output}")
+
+    def report(outcome, finished, total):
+        note = " (from checkpoint)" if outcome.get("resumed") else ""
+        if outcome.get("duplicate_of"):
+            note += f" (near-duplicate of {outcome['duplicate_of']}, results reused)"
+        errors = f" - errors: {', '.join(outcome['errors'])}" if outcome.get("errors") else ""
+        print(f"[{finished}/{total}] {outcome['status']:<12} {outcome['source']} ({outcome['seconds']:.1f}s){note}{errors}", flush=True)
+        for event in outcome.get("events", []):
+            if event["level"] in (ti_events.WARNING, ti_events.ERROR):
+                print(f"    {event['level']}: {event['message']}", flush=True)
+
+    outcomes = run_batch(sources, args.output, provider_args, options, on_result=report)
+    failed = sum(outcome["status"] == STATUS_FAILED for outcome in outcomes)
+    print(f"Done: {len(outcomes) - failed} finished, {failed} failed. Summary: {os.path.join(args.output, SUMMARY_FILE)}")
+    totals = [outcome.get("metrics") or {} for outcome in outcomes]
+    print(f"AI calls: {sum(t.get('llm_calls', 0) for t in totals)} ({sum(t.get('cache_hits', 0) for t in totals)} from cache), "
+          f"{sum(t.get('prompt_tokens', 0) + t.get('completion_tokens', 0) for t in totals):,} tokens, "
+          f"~${sum(t.get('cost_usd', 0.0) for t in totals):.4f}. Metrics: {os.path.join(args.output, PROMETHEUS_FILE)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
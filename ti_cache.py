@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# --- Constants ---
+CACHE_DIR = os.environ.get("TI_MINDMAP_CACHE_DIR", "./.cache")
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm_completions.sqlite")
+LLM_CACHE_MAX_BYTES = 256 * 1024 * 1024 # Evict least recently used entries above this size
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 3600   # Completions older than a week are regenerated
+
+class DiskCache:
+    """
+    Persistent key/value cache backed by SQLite, with a TTL and size-based LRU eviction.
+
+    Values are stored as JSON, so anything JSON-serializable can be cached. A single
+    connection is shared between threads and guarded by a lock.
+    """
+    def __init__(self, path, max_bytes=LLM_CACHE_MAX_BYTES, ttl_seconds=LLM_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+            self._conn.commit()
+
+    def get(self, key, default=None):
+        """Returns the cached value for `key`, or `default` on a miss or expired entry."""
+        if not self.enabled:
+            return default
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return default
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        """Stores `value` under `key` and evicts least recently used entries if the cache is too big."""
+        if not self.enabled:
+            return
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode("utf-8"))
+        if self.max_bytes and size > self.max_bytes:
+            return # Would evict everything else; not worth caching
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, size, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Deletes least recently used entries until the total size fits in `max_bytes`. Caller holds the lock."""
+        if not self.max_bytes:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY accessed_at ASC").fetchall():
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def purge_expired(self):
+        """Removes all entries older than the TTL. Returns the number of deleted entries."""
+        if not self.ttl_seconds:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def stats(self):
+        """Returns hit/miss counters and the current size of the cache."""
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+def completion_key(provider, model, messages, **options):
+    """
+    Builds a content-addressed cache key for a chat completion.
+
+    The key covers the provider, the model (or Azure deployment), the full message list and any
+    request options that change the output (e.g. max_tokens).
+    """
+    payload = {
+        "provider": provider,
+        "model": model,
+        "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+        "options": options,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    """Returns the process-wide completion cache, creating it on first use."""
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = DiskCache(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL_SECONDS)
+    return _llm_cache
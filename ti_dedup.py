@@ -0,0 +1,264 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+import ti_ioc
+from ti_cache import CACHE_DIR
+from ti_schemas import TTPTable, FiveWhatsReport
+
+# Near-duplicate detection at ingest. Syndicated copies of a report (vendor blog, news site,
+# aggregator) differ in boilerplate, but share almost all of their word shingles. Every ingested
+# text gets an exact hash of its normalized words and a MinHash signature of its word 3-grams:
+# the share of equal signature values estimates the Jaccard similarity of two texts' shingle sets.
+# Both are stored in a persistent SQLite index. Texts with an estimated similarity of at least
+# MIN_SIMILARITY are near-duplicates.
+# Lookups use LSH: the signature is split into LSH_BANDS bands of rows, and a text is compared only
+# with the documents sharing at least one band with it (one indexed query per band, not a scan).
+# With 32 bands of 4 rows, a document at least 60% similar shares a band with >98% probability.
+# The Tab 1 results of an analysis can be attached to its document, so the app and ti_batch reuse
+# them when a near-duplicate comes in again.
+
+# --- Constants ---
+DEDUP_DB_PATH = os.path.join(CACHE_DIR, "dedup.sqlite")
+SHINGLE_SIZE = 3           # Words per shingle
+MINHASH_PERMUTATIONS = 128 # Signature values; the similarity estimate is within ~0.03 at 0.9
+LSH_BANDS = 32             # Bands of MINHASH_PERMUTATIONS // LSH_BANDS rows
+# Estimated Jaccard similarity of the word 3-grams. Copies with a different header/footer and a few
+# edited words measure 0.85-0.95; unrelated reports on the same subject stay below 0.1.
+MIN_SIMILARITY = float(os.environ.get("TI_DEDUP_MIN_SIMILARITY", 0.8))
+MIN_SHINGLES = 20          # Shorter texts only get the exact hash (their signature is too noisy)
+HASH_CHUNK_SHINGLES = 8192 # Shingles hashed per step when signing (bounds memory for long documents)
+WORD_PATTERN = re.compile(r"\w+")
+DEFANGED_DOT = re.compile(r"\[\.\]|\(\.\)|\{\.\}")
+
+# Session_state keys (and ti_batch component names) whose results can be reused for a duplicate
+ARTIFACT_KEYS = ("summary", "mindmap_code", "summary_tweet", "tweet_mindmap_code", "iocs_df", "ttptable",
+                 "attackpath", "mermaid_timeline", "5whats", "mitre_layer_json_str", "stix_bundle", "long_document_notes")
+
+_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+
+def _hash_parameters(name):
+    """Fixed 64-bit parameters of the MinHash permutations (stored signatures depend on them, so they never change)."""
+    return np.array([int.from_bytes(hashlib.blake2b(f"{name}-{i}".encode(), digest_size=8).digest(), "little")
+                     for i in range(MINHASH_PERMUTATIONS)], dtype=np.uint64)
+
+# Multiply-shift hashing: h_i(x) = (a_i * x + b_i mod 2^64) >> 32, with odd a_i
+_MULTIPLIERS = _hash_parameters("ti-dedup-a") | np.uint64(1)
+_OFFSETS = _hash_parameters("ti-dedup-b")
+
+class Fingerprint:
+    """Exact hash and MinHash signature of a text (`signature` is None for texts shorter than MIN_SHINGLES)."""
+    def __init__(self, content_hash, signature, shingles):
+        self.content_hash = content_hash
+        self.signature = signature # numpy uint32 array of MINHASH_PERMUTATIONS values
+        self.shingles = shingles
+
+    def bands(self):
+        """LSH keys, one per band (signed 64-bit, as SQLite stores integers)."""
+        return [_signed(int.from_bytes(hashlib.blake2b(self.signature[band * _ROWS:(band + 1) * _ROWS].tobytes(), digest_size=8).digest(), "big"))
+                for band in range(LSH_BANDS)]
+
+    def __repr__(self):
+        return f"Fingerprint({self.content_hash[:12]}..., minhash={self.signature is not None}, shingles={self.shingles})"
+
+class DuplicateMatch:
+    """An earlier document matching a fingerprint."""
+    def __init__(self, document_id, source, similarity, exact, created_at, has_artifacts):
+        self.document_id = document_id
+        self.source = source
+        self.similarity = similarity # Estimated Jaccard similarity (1.0 for exact duplicates)
+        self.exact = exact
+        self.created_at = created_at
+        self.has_artifacts = has_artifacts
+
+    def to_dict(self):
+        return {"document_id": self.document_id, "source": self.source, "exact": self.exact,
+                "similarity": round(self.similarity, 3), "created_at": self.created_at, "has_artifacts": self.has_artifacts}
+
+    def __repr__(self):
+        return f"DuplicateMatch({self.source!r}, similarity={self.similarity:.2f}, exact={self.exact})"
+
+# --- Fingerprinting ---
+
+def normalize_words(text):
+    """Lower-case words of a text, with defanged dots ("evil[.]com") restored so both spellings match."""
+    return WORD_PATTERN.findall(DEFANGED_DOT.sub(".", text.lower()))
+
+def fingerprint(text):
+    """Computes the exact hash and MinHash signature of a text."""
+    words = normalize_words(text)
+    content_hash = hashlib.sha256(" ".join(words).encode("utf-8")).hexdigest()
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(0, len(words) - SHINGLE_SIZE + 1))}
+    if len(shingles) < MIN_SHINGLES:
+        return Fingerprint(content_hash, None, len(shingles))
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles)
+    values = np.frombuffer(digests, dtype="<u8")
+    # Vectorized: one row per permutation; uint64 arithmetic wraps, which is the mod 2^64
+    signature = np.full(MINHASH_PERMUTATIONS, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(values), HASH_CHUNK_SHINGLES):
+        chunk = values[start:start + HASH_CHUNK_SHINGLES]
+        hashed = (_MULTIPLIERS[:, None] * chunk[None, :] + _OFFSETS[:, None]) >> np.uint64(32)
+        np.minimum(signature, hashed.min(axis=1), out=signature)
+    return Fingerprint(content_hash, signature.astype(np.uint32), len(shingles))
+
+def estimate_similarity(signature, other):
+    """Estimated Jaccard similarity of the shingle sets behind two MinHash signatures."""
+    return float(np.count_nonzero(signature == other)) / MINHASH_PERMUTATIONS
+
+def _signed(value):
+    """SQLite integers are signed 64-bit."""
+    return value - (1 << 64) if value is not None and value >= 1 << 63 else value
+
+# --- Artifact Serialization ---
+
+def serialize_artifact(value):
+    """JSON-safe form of a component result (DataFrames and ti_schemas objects are tagged)."""
+    if isinstance(value, pd.DataFrame):
+        return {"kind": "dataframe", "records": value.to_dict("records"), "columns": list(value.columns)}
+    if isinstance(value, TTPTable):
+        return {"kind": "ttp_table", "data": value.to_dict()}
+    if isinstance(value, FiveWhatsReport):
+        return {"kind": "five_whats", "data": value.to_dict()}
+    return value
+
+def deserialize_artifact(value):
+    if isinstance(value, dict):
+        if value.get("kind") == "dataframe":
+            return pd.DataFrame(value["records"], columns=value.get("columns", ti_ioc.IOC_COLUMNS))
+        if value.get("kind") == "ttp_table":
+            return TTPTable.from_dict(value["data"])
+        if value.get("kind") == "five_whats":
+            return FiveWhatsReport.from_dict(value["data"])
+    return value
+
+# --- Index ---
+
+class DedupIndex:
+    """
+    Persistent fingerprint index in SQLite: one row per distinct text, with the source it was first
+    seen as and, once analyzed, its serialized artifacts, plus one LSH row per band. A single
+    connection is shared between threads and guarded by a lock.
+    """
+    def __init__(self, path=DEDUP_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " id INTEGER PRIMARY KEY, content_hash TEXT NOT NULL UNIQUE, minhash BLOB,"
+                " source TEXT, shingles INTEGER NOT NULL, created_at REAL NOT NULL, artifacts TEXT, artifacts_at REAL)"
+            )
+            # Indexes written before MinHash have no signature column; their documents still match exactly
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+            if "minhash" not in columns:
+                self._conn.execute("ALTER TABLE documents ADD COLUMN minhash BLOB")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS lsh_bands (band INTEGER NOT NULL, key INTEGER NOT NULL, document_id INTEGER NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_lsh_bands ON lsh_bands(band, key)")
+            self._conn.commit()
+
+    def lookup(self, fp, min_similarity=MIN_SIMILARITY, exclude=None):
+        """
+        Finds the closest earlier document: an exact duplicate, or the LSH candidate with the highest
+        estimated similarity (at least `min_similarity`). Ties go to the document with artifacts.
+
+        Returns:
+            DuplicateMatch | None
+        """
+        columns = "id, source, created_at, artifacts IS NOT NULL"
+        with self._lock:
+            row = self._conn.execute(f"SELECT {columns} FROM documents WHERE content_hash = ?", (fp.content_hash,)).fetchone()
+            if row is not None and row[0] != exclude:
+                return DuplicateMatch(row[0], row[1], 1.0, True, row[2], bool(row[3]))
+            if fp.signature is None:
+                return None
+            candidate_ids = set()
+            for band, key in enumerate(fp.bands()):
+                candidate_ids.update(document_id for (document_id,) in self._conn.execute(
+                    "SELECT document_id FROM lsh_bands WHERE band = ? AND key = ?", (band, key)))
+            candidate_ids.discard(exclude)
+            if not candidate_ids:
+                return None
+            candidates = self._conn.execute(f"SELECT {columns}, minhash FROM documents WHERE id IN ({', '.join('?' * len(candidate_ids))})",
+                                            list(candidate_ids)).fetchall()
+        best = None
+        for document_id, source, created_at, has_artifacts, minhash in candidates:
+            similarity = estimate_similarity(fp.signature, np.frombuffer(minhash, dtype=np.uint32))
+            if similarity >= min_similarity and (best is None or (similarity, has_artifacts) > (best.similarity, best.has_artifacts)):
+                best = DuplicateMatch(document_id, source, similarity, False, created_at, bool(has_artifacts))
+        return best
+
+    def register(self, fp, source):
+        """Adds a text to the index; returns its document id (the existing one for an exact duplicate)."""
+        minhash = fp.signature.tobytes() if fp.signature is not None else None
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO documents (content_hash, minhash, source, shingles, created_at) VALUES (?, ?, ?, ?, ?)",
+                (fp.content_hash, minhash, source, fp.shingles, time.time()))
+            document_id = self._conn.execute("SELECT id FROM documents WHERE content_hash = ?", (fp.content_hash,)).fetchone()[0]
+            if inserted.rowcount and minhash is not None:
+                self._conn.executemany("INSERT INTO lsh_bands (band, key, document_id) VALUES (?, ?, ?)",
+                                       [(band, key, document_id) for band, key in enumerate(fp.bands())])
+            self._conn.commit()
+            return document_id
+
+    def attach_artifacts(self, document_id, artifacts):
+        """Stores the serialized results of a document's analysis (see serialize_artifact), merged into earlier ones."""
+        with self._lock:
+            row = self._conn.execute("SELECT artifacts FROM documents WHERE id = ?", (document_id,)).fetchone()
+            if row is None:
+                return
+            merged = dict(json.loads(row[0]) if row[0] else {}, **artifacts)
+            self._conn.execute("UPDATE documents SET artifacts = ?, artifacts_at = ? WHERE id = ?",
+                               (json.dumps(merged, ensure_ascii=False, default=str), time.time(), document_id))
+            self._conn.commit()
+
+    def artifacts(self, document_id):
+        """The serialized artifacts of a document, or {} if it was not analyzed."""
+        with self._lock:
+            row = self._conn.execute("SELECT artifacts FROM documents WHERE id = ?", (document_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def stats(self):
+        with self._lock:
+            documents, analyzed = self._conn.execute("SELECT COUNT(*), COUNT(artifacts) FROM documents").fetchone()
+        return {"documents": documents, "analyzed": analyzed}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    """Returns the process-wide dedup index, creating it on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = DedupIndex(DEDUP_DB_PATH)
+    return _index
+
+def check(text, source, index=None):
+    """
+    Fingerprints an ingested text, looks up its closest earlier document and registers it.
+
+    Returns:
+        tuple: (document id of `text`, DuplicateMatch of an earlier document or None). An exact
+        duplicate shares the earlier document's id.
+    """
+    index = index or get_index()
+    fp = fingerprint(text)
+    match = index.lookup(fp)
+    document_id = match.document_id if match is not None and match.exact else index.register(fp, source)
+    return document_id, match
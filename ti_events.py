@@ -0,0 +1,126 @@
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Diagnostics from the library modules (ti_ai, ti_pdf, ti_stix, ...). They report problems through
+# emit() instead of calling Streamlit, so they import and run anywhere: the Streamlit app, ti_batch,
+# thread pools and process pools. The host decides where events go by installing a sink.
+
+# --- Constants ---
+DEBUG = "debug"
+INFO = "info"
+SUCCESS = "success"
+WARNING = "warning"
+ERROR = "error"
+LEVELS = (DEBUG, INFO, SUCCESS, WARNING, ERROR)
+_LOGGING_LEVELS = {DEBUG: logging.DEBUG, INFO: logging.INFO, SUCCESS: logging.INFO, WARNING: logging.WARNING, ERROR: logging.ERROR}
+LOGGER_NAME = "ti_mindmap"
+
+class Event:
+    """One diagnostic message: level, text, the module that sent it and optional structured details."""
+    def __init__(self, level, message, source=None, details=None, timestamp=None):
+        self.level = level
+        self.message = message
+        self.source = source
+        self.details = details or {}
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def to_dict(self):
+        return {"level": self.level, "message": self.message, "source": self.source, "details": self.details, "timestamp": self.timestamp}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["level"], data["message"], data.get("source"), data.get("details"), data.get("timestamp"))
+
+    def __repr__(self):
+        return f"Event({self.level!r}, {self.message!r}, source={self.source!r})"
+
+# --- Sinks ---
+
+class EventSink:
+    """Receives events. Subclasses implement `handle`; it may be called from any thread."""
+    def handle(self, event):
+        raise NotImplementedError
+
+class LoggingSink(EventSink):
+    """Forwards events to the standard `logging` module (the default sink)."""
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger(LOGGER_NAME)
+
+    def handle(self, event):
+        self.logger.log(_LOGGING_LEVELS.get(event.level, logging.INFO), "%s%s", f"[{event.source}] " if event.source else "", event.message)
+
+class CollectingSink(EventSink):
+    """
+    Keeps events in memory, e.g. to show them after a batch of background work or to send them back
+    from a worker process (Event.to_dict is picklable and JSON-serializable).
+    """
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def handle(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def drain(self):
+        """Returns the collected events and clears the list."""
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+_default_sink = LoggingSink()
+_current_sink = contextvars.ContextVar("ti_events_sink", default=None)
+
+def set_default_sink(sink):
+    """Sets the process-wide sink used when no sink is active in the current context."""
+    global _default_sink
+    _default_sink = sink if sink is not None else LoggingSink()
+
+def set_sink(sink):
+    """Sets the sink for the current context (thread or task); returns a token for reset_sink."""
+    return _current_sink.set(sink)
+
+def reset_sink(token):
+    _current_sink.reset(token)
+
+def get_sink():
+    return _current_sink.get() or _default_sink
+
+@contextmanager
+def use_sink(sink):
+    """Routes events emitted inside the `with` block (in this context) to `sink`."""
+    token = set_sink(sink)
+    try:
+        yield sink
+    finally:
+        reset_sink(token)
+
+def submit_in_context(executor, func, *args, **kwargs):
+    """executor.submit that runs `func` in a copy of the caller's context, so the caller's sink receives its events."""
+    return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+# --- Emitting ---
+
+def emit(level, message, source=None, **details):
+    """Sends an event to the active sink. A failing sink never breaks the caller."""
+    event = Event(level, message, source, details)
+    try:
+        get_sink().handle(event)
+    except Exception:
+        logging.getLogger(LOGGER_NAME).exception("Event sink failed for %r", event)
+    return event
+
+def info(message, source=None, **details):
+    return emit(INFO, message, source, **details)
+
+def success(message, source=None, **details):
+    return emit(SUCCESS, message, source, **details)
+
+def warning(message, source=None, **details):
+    return emit(WARNING, message, source, **details)
+
+def error(message, source=None, **details):
+    return emit(ERROR, message, source, **details)
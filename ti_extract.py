@@ -0,0 +1,243 @@
+import os
+import re
+from bs4 import BeautifulSoup
+from markdownify import MarkdownConverter, markdownify as md_markdownify
+
+# HTML-to-Markdown extraction for scraped pages. Boilerplate (navigation, headers, footers, cookie
+# banners, share widgets, scripts) is removed before conversion, so it costs neither CPU in
+# markdownify nor LLM tokens later; code blocks and tables are kept. Backends:
+#   lxml        - lxml.html (C) parser for pruning, then markdownify on the pruned content only
+#   selectolax  - same with the lexbor (C) parser
+#   html.parser - same pruning on the pure-Python parser (no optional dependency)
+#   legacy      - the original path: html.parser + markdownify over all of <main> or <body>, no pruning
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    SELECTOLAX_AVAILABLE = False
+
+try:
+    from lxml import etree, html as lxml_html
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+# --- Constants ---
+BACKEND_SELECTOLAX = "selectolax"
+BACKEND_LXML = "lxml"
+BACKEND_HTML_PARSER = "html.parser"
+BACKEND_LEGACY = "legacy"
+BACKENDS = (BACKEND_LXML, BACKEND_SELECTOLAX, BACKEND_HTML_PARSER, BACKEND_LEGACY)
+EXTRACTION_BACKEND = os.environ.get("TI_EXTRACT_BACKEND", "auto") # "auto" picks the fastest available backend
+
+# Removed with their content. <header> is only removed when it does not hold the page title.
+BOILERPLATE_TAGS = ("script", "style", "noscript", "template", "iframe", "svg", "canvas", "form", "button",
+                    "input", "select", "textarea", "nav", "aside", "footer", "dialog", "link", "meta")
+BOILERPLATE_ROLES = ("navigation", "banner", "contentinfo", "complementary", "search", "dialog", "alert")
+# Matched against class and id attributes
+BOILERPLATE_PATTERN = re.compile(
+    r"(^|[\s_-])(cookie|consent|gdpr|newsletter|subscribe|signup|share|sharing|social|related|recommended|"
+    r"sidebar|breadcrumbs?|comments?|promo|advert|ads|popup|modal|menu|skip-link|author-bio|pagination)($|[\s_-])",
+    re.IGNORECASE,
+)
+# Elements holding any of these are never removed, whatever their class says
+PROTECTED_TAGS = ("main", "article", "h1", "pre", "table")
+# Never removed themselves: page themes put marker-like classes on them ("js menu-closed", "has-sidebar")
+STRUCTURAL_TAGS = ("html", "body", "main", "article")
+# Pruned output with less text than this fraction of the unpruned content falls back to the legacy path
+MIN_PRUNED_RATIO = 0.2
+MAIN_CONTENT_SELECTORS = ("main", "[role=main]", "article")
+EXCESS_BLANK_LINES = re.compile(r"\n{3,}")
+META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+def available_backends():
+    """The backends usable in this environment, fastest first."""
+    backends = []
+    if LXML_AVAILABLE:
+        backends.append(BACKEND_LXML)
+    if SELECTOLAX_AVAILABLE:
+        backends.append(BACKEND_SELECTOLAX)
+    return backends + [BACKEND_HTML_PARSER, BACKEND_LEGACY]
+
+def default_backend():
+    if EXTRACTION_BACKEND in available_backends():
+        return EXTRACTION_BACKEND
+    return available_backends()[0]
+
+# --- Markdown Conversion ---
+
+def _code_language(element):
+    """Language of a <pre> block, from its class or its <code> child's (e.g. "language-python")."""
+    for node in (element, element.find("code")):
+        for css_class in (node.get("class") or []) if node is not None else []:
+            if css_class.startswith(("language-", "lang-")):
+                return css_class.split("-", 1)[1]
+    classes = element.get("class") or []
+    return classes[0] if classes else None
+
+_converter = MarkdownConverter(heading_style="atx", bullets="-", code_language_callback=_code_language)
+
+def _to_markdown(element):
+    text = _converter.convert_soup(element)
+    return EXCESS_BLANK_LINES.sub("\n\n", text).strip()
+
+def _is_boilerplate_marker(role, hidden, css_class, element_id):
+    if role in BOILERPLATE_ROLES or hidden:
+        return True
+    marker = f"{css_class or ''} {element_id or ''}"
+    return bool(marker.strip()) and BOILERPLATE_PATTERN.search(marker) is not None
+
+def _text_size(text):
+    """Non-whitespace characters of a text (indentation in the markup does not count)."""
+    return len("".join(text.split()))
+
+def _soup_for_markdown(markup):
+    """Parses the pruned main content for markdownify (a much smaller document than the page)."""
+    return BeautifulSoup(markup, "lxml" if LXML_AVAILABLE else "html.parser")
+
+# --- BeautifulSoup Backend ---
+
+def _is_boilerplate_tag(tag):
+    if tag.name in BOILERPLATE_TAGS:
+        return True
+    if tag.name in STRUCTURAL_TAGS:
+        return False
+    if tag.name == "header" and tag.find("h1") is None:
+        return True
+    attrs = tag.attrs or {}
+    return _is_boilerplate_marker(attrs.get("role"), "hidden" in attrs, " ".join(attrs.get("class") or []), attrs.get("id"))
+
+def _prune_soup(soup):
+    for tag in soup.find_all(_is_boilerplate_tag):
+        if tag.decomposed:
+            continue # Inside an element removed before
+        if tag.name not in BOILERPLATE_TAGS and tag.find(PROTECTED_TAGS) is not None:
+            continue
+        tag.decompose()
+
+def _main_soup_element(soup):
+    for selector in MAIN_CONTENT_SELECTORS[:2]:
+        element = soup.select_one(selector)
+        if element is not None:
+            return element
+    articles = soup.find_all("article")
+    if articles:
+        return max(articles, key=lambda article: len(article.get_text()))
+    return soup.body or soup
+
+def _extract_with_soup(html, parser):
+    soup = BeautifulSoup(html, parser)
+    scope = soup.find("main") or soup.body or soup
+    page_size = _text_size(scope.get_text(" "))
+    _prune_soup(soup)
+    return _to_markdown(_main_soup_element(soup)), page_size
+
+def _extract_legacy(html):
+    soup = BeautifulSoup(html, "html.parser")
+    main_content = soup.find('main') or soup.body
+    if not main_content:
+        return ""
+    return md_markdownify(str(main_content), heading_style='atx', bullets='-',
+                          code_language_callback=lambda el: el.get('class', [None])[0])
+
+# --- lxml Backend ---
+
+def _extract_with_lxml(html):
+    root = lxml_html.document_fromstring(_decode(html))
+    etree.strip_elements(root, etree.Comment, *BOILERPLATE_TAGS, with_tail=False)
+    scope = (root.xpath("//main") or [root.find("body")])[0]
+    page_size = _text_size(scope.text_content()) if scope is not None else 0
+    for element in root.xpath("//header[not(.//h1)]"):
+        element.drop_tree()
+    protected = "|".join(f".//{tag}" for tag in PROTECTED_TAGS)
+    structural = " or ".join(f"self::{tag}" for tag in STRUCTURAL_TAGS)
+    for element in root.xpath(f"//*[(@role or @hidden or @class or @id) and not({structural})]"):
+        get = element.get
+        if _is_boilerplate_marker(get("role"), get("hidden") is not None, get("class"), get("id")) and not element.xpath(protected):
+            element.drop_tree() # Keeps the element's tail text
+
+    candidates = root.xpath("//main") or root.xpath("//*[@role='main']")
+    if candidates:
+        main = candidates[0]
+    else:
+        articles = root.xpath("//article")
+        main = max(articles, key=lambda article: len(article.text_content())) if articles else root.find("body")
+    if main is None:
+        return "", page_size
+    return _to_markdown(_soup_for_markdown(lxml_html.tostring(main, encoding="unicode"))), page_size
+
+# --- Selectolax Backend ---
+
+def _decode(html):
+    """Decodes page bytes with the <meta> charset (UTF-8 when absent), as lexbor expects text."""
+    if isinstance(html, str):
+        return html
+    match = META_CHARSET.search(html[:4096])
+    try:
+        return html.decode(match.group(1).decode("ascii") if match else "utf-8", errors="replace")
+    except LookupError: # Unknown charset name
+        return html.decode("utf-8", errors="replace")
+
+def _extract_with_selectolax(html):
+    tree = SelectolaxParser(_decode(html))
+    tree.strip_tags(list(BOILERPLATE_TAGS))
+    scope = tree.css_first("main") or tree.body
+    page_size = _text_size(scope.text(separator=" ")) if scope is not None else 0
+    for node in tree.css("header"):
+        if node.css_first("h1") is None:
+            node.decompose()
+    for node in tree.css("[role], [hidden], [class], [id]"):
+        if node.tag in STRUCTURAL_TAGS:
+            continue
+        attrs = node.attributes
+        if _is_boilerplate_marker(attrs.get("role"), "hidden" in attrs, attrs.get("class"), attrs.get("id")):
+            if node.css_first(", ".join(PROTECTED_TAGS)) is None:
+                node.decompose()
+
+    main = None
+    for selector in MAIN_CONTENT_SELECTORS[:2]:
+        main = tree.css_first(selector)
+        if main is not None:
+            break
+    if main is None:
+        articles = tree.css("article")
+        main = max(articles, key=lambda article: len(article.text())) if articles else (tree.body or tree.root)
+    if main is None:
+        return "", page_size
+    # Only the pruned main content is handed to BeautifulSoup/markdownify
+    return _to_markdown(_soup_for_markdown(main.html)), page_size
+
+# --- Entry Point ---
+
+def html_to_markdown(html, backend=None):
+    """
+    Converts the main content of an HTML page to Markdown.
+
+    Args:
+        html (str | bytes): The page; bytes are decoded by the parser (meta charset, BOM).
+        backend (str, optional): One of BACKENDS; default EXTRACTION_BACKEND, or the fastest installed.
+
+    Returns:
+        str: The Markdown text, or "" if the page has no content. When pruning leaves (almost)
+        nothing of the page's text, e.g. because the content wrapper's class looks like
+        boilerplate, the legacy (unpruned) output is returned instead.
+    """
+    backend = backend or default_backend()
+    if backend == BACKEND_SELECTOLAX:
+        if not SELECTOLAX_AVAILABLE:
+            raise ValueError("The selectolax backend needs the selectolax package.")
+        markdown, page_size = _extract_with_selectolax(html)
+    elif backend == BACKEND_LXML:
+        if not LXML_AVAILABLE:
+            raise ValueError("The lxml backend needs the lxml package.")
+        markdown, page_size = _extract_with_lxml(html)
+    elif backend == BACKEND_HTML_PARSER:
+        markdown, page_size = _extract_with_soup(html, "html.parser")
+    elif backend == BACKEND_LEGACY:
+        return _extract_legacy(html)
+    else:
+        raise ValueError(f"Unknown extraction backend: {backend}")
+    if _text_size(markdown) < page_size * MIN_PRUNED_RATIO:
+        return _extract_legacy(html)
+    return markdown
@@ -0,0 +1,410 @@
+"""
+Feed crawler: polls RSS/Atom feeds of OSINT blogs, fetches new articles concurrently and queues their
+Markdown for analysis.
+
+Each cycle fetches the feeds, keeps the items not seen before (state in feeds.sqlite in the cache
+directory), and scrapes them with scrape_text under a global concurrency cap, a per-host cap and
+a global requests-per-minute budget. The requests themselves go through ti_fetch, so the pooled
+sessions, per-host politeness delay and HTTP cache apply as well. Articles that are
+near-duplicates of one seen before (syndicated copies, see ti_dedup) are recorded but not queued;
+the others wait in the queue until analyzed: in the app (input source "Feed Queue"), or exported as .md files for ti_batch.
+
+Usage:
+    python ti_feeds.py https://example.com/feed.xml --list feeds.txt            # one cycle
+    python ti_feeds.py --list feeds.txt --interval 1800                          # poll every 30 minutes
+    python ti_feeds.py --export queue_md/ && python ti_batch.py queue_md/        # analyze the queue
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import datetime
+import hashlib
+import logging
+import sqlite3
+import threading
+import contextvars
+import functools
+import email.utils
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, urljoin
+import ti_dedup
+import ti_events
+import ti_fetch
+from ti_cache import CACHE_DIR
+from ti_ingest import scrape_text, SCRAPE_ERROR_PREFIXES
+from ti_ratelimit import TokenBucket
+
+# --- Constants ---
+FEEDS_DB_PATH = os.path.join(CACHE_DIR, "feeds.sqlite")
+DEFAULT_MAX_CONCURRENCY = 16        # Fetches in flight across all hosts
+DEFAULT_PER_HOST_CONCURRENCY = 2    # Fetches in flight per host (ti_fetch also spaces them by its politeness delay)
+DEFAULT_REQUESTS_PER_MINUTE = 120   # Global fetch budget
+DEFAULT_MAX_ITEMS_PER_FEED = 20     # Newest items considered per feed and cycle (bounds the first run)
+DEFAULT_POLL_INTERVAL_SECONDS = 1800
+MAX_FETCH_ATTEMPTS = 3              # An article failing this many cycles is given up
+TRACKING_PARAMETERS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "ref")
+
+# Item states in the store
+STATUS_QUEUED = "queued"       # Scraped; waiting for analysis
+STATUS_FAILED = "failed"       # Scrape failed; retried next cycle until MAX_FETCH_ATTEMPTS
+STATUS_ANALYZED = "analyzed"   # Taken from the queue (analyzed in the app or exported)
+STATUS_DUPLICATE = "duplicate" # Near-duplicate of an article seen before (see ti_dedup); not queued
+
+class FeedItem:
+    """An article link discovered in a feed."""
+    def __init__(self, url, title=None, published=None, feed_url=None):
+        self.url = url
+        self.title = title
+        self.published = published # ISO 8601 string or None
+        self.feed_url = feed_url
+
+    def __repr__(self):
+        return f"FeedItem({self.url!r}, title={self.title!r})"
+
+# --- Feed Parsing ---
+
+def normalize_url(url):
+    """Canonical form used for the seen-URL state: no fragment, no tracking parameters, lower-case host."""
+    parts = urlsplit(url.strip())
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if not name.lower().startswith(TRACKING_PARAMETERS)]
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", urlencode(query), ""))
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+def _parse_date(text):
+    if not text:
+        return None
+    text = text.strip()
+    try:
+        return email.utils.parsedate_to_datetime(text).isoformat() # RSS (RFC 822)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.datetime.fromisoformat(text.replace("Z", "+00:00")).isoformat() # Atom / Dublin Core (ISO 8601)
+    except ValueError:
+        return None
+
+def _item_link(element):
+    """The article URL of an RSS item or Atom entry."""
+    guid = None
+    for child in element:
+        name = _local_name(child.tag)
+        if name == "link":
+            href = child.get("href")
+            if href is not None: # Atom: prefer rel="alternate" (the default)
+                if child.get("rel", "alternate") == "alternate":
+                    return href.strip()
+            elif child.text and child.text.strip():
+                return child.text.strip()
+        elif name == "guid" and child.get("isPermaLink", "true").lower() == "true" and (child.text or "").startswith("http"):
+            guid = child.text.strip()
+    return guid or element.get("{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about")
+
+def parse_feed(content, feed_url=None):
+    """
+    Parses an RSS 2.0, RSS 1.0 (RDF) or Atom feed.
+
+    Returns:
+        list[FeedItem]: The items, newest first when the feed has dates.
+
+    Raises:
+        ValueError: If the content is not a feed.
+    """
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError as e:
+        raise ValueError(f"Not a valid RSS/Atom feed: {e}") from e
+    if _local_name(root.tag) not in ("rss", "RDF", "feed"):
+        raise ValueError(f"Not an RSS/Atom feed (root element <{_local_name(root.tag)}>)")
+
+    items = []
+    for element in root.iter():
+        if _local_name(element.tag) not in ("item", "entry"):
+            continue
+        link = _item_link(element)
+        if not link:
+            continue
+        fields = {_local_name(child.tag): (child.text or "").strip() for child in element}
+        published = fields.get("pubDate") or fields.get("published") or fields.get("updated") or fields.get("date")
+        items.append(FeedItem(urljoin(feed_url or "", link), fields.get("title") or None, _parse_date(published), feed_url))
+    if any(item.published for item in items):
+        items.sort(key=lambda item: item.published or "", reverse=True)
+    return items
+
+# --- Seen-URL State and Queue ---
+
+class FeedStore:
+    """
+    Persistent state of the crawler in SQLite: every discovered article URL with its status, and the
+    scraped Markdown of queued articles. A single connection is shared between threads and guarded
+    by a lock.
+    """
+    def __init__(self, path=FEEDS_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                " url TEXT PRIMARY KEY, feed_url TEXT, title TEXT, published TEXT, status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0, error TEXT, markdown TEXT,"
+                " discovered_at REAL NOT NULL, fetched_at REAL, analyzed_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_items_status ON items(status, published)")
+            self._conn.commit()
+
+    def unseen(self, items):
+        """The items still to fetch: never seen, or failed fewer than MAX_FETCH_ATTEMPTS times."""
+        with self._lock:
+            known = {url: (status, attempts) for url, status, attempts in self._conn.execute(
+                "SELECT url, status, attempts FROM items WHERE url IN (%s)" % ",".join("?" * len(items)),
+                [item.url for item in items]).fetchall()} if items else {}
+        return [item for item in items
+                if item.url not in known or (known[item.url][0] == STATUS_FAILED and known[item.url][1] < MAX_FETCH_ATTEMPTS)]
+
+    def record_queued(self, item, markdown):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO items (url, feed_url, title, published, status, attempts, markdown, discovered_at, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?) ON CONFLICT(url) DO UPDATE SET status = excluded.status,"
+                " attempts = attempts + 1, error = NULL, markdown = excluded.markdown, fetched_at = excluded.fetched_at",
+                (item.url, item.feed_url, item.title, item.published, STATUS_QUEUED, markdown, now, now))
+            self._conn.commit()
+
+    def record_failed(self, item, error):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO items (url, feed_url, title, published, status, attempts, error, discovered_at, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?) ON CONFLICT(url) DO UPDATE SET status = excluded.status,"
+                " attempts = attempts + 1, error = excluded.error, fetched_at = excluded.fetched_at",
+                (item.url, item.feed_url, item.title, item.published, STATUS_FAILED, str(error)[:500], now, now))
+            self._conn.commit()
+
+    def record_duplicate(self, item, duplicate):
+        now = time.time()
+        note = f"Duplicate of {duplicate.source} ({duplicate.similarity:.0%} similar)"
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO items (url, feed_url, title, published, status, attempts, error, discovered_at, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?) ON CONFLICT(url) DO UPDATE SET status = excluded.status,"
+                " attempts = attempts + 1, error = excluded.error, fetched_at = excluded.fetched_at",
+                (item.url, item.feed_url, item.title, item.published, STATUS_DUPLICATE, note, now, now))
+            self._conn.commit()
+
+    def queued(self, limit=None):
+        """Queued articles, newest first, as dicts with url, feed_url, title, published and markdown."""
+        query = ("SELECT url, feed_url, title, published, markdown FROM items WHERE status = ?"
+                 " ORDER BY COALESCE(published, '') DESC, fetched_at DESC")
+        params = [STATUS_QUEUED]
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(zip(("url", "feed_url", "title", "published", "markdown"), row)) for row in rows]
+
+    def mark_analyzed(self, url):
+        """Takes an article off the queue (its Markdown is dropped; the URL stays seen)."""
+        with self._lock:
+            self._conn.execute("UPDATE items SET status = ?, markdown = NULL, analyzed_at = ? WHERE url = ?",
+                               (STATUS_ANALYZED, time.time(), url))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in (STATUS_QUEUED, STATUS_FAILED, STATUS_DUPLICATE, STATUS_ANALYZED)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# --- Crawler ---
+
+class FeedCrawler:
+    """
+    Runs crawl cycles on an asyncio event loop. The blocking fetch and extraction code (ti_fetch,
+    scrape_text) runs on a thread pool, in the caller's context, so events and metrics reach the
+    caller's sink and run; the loop only schedules and enforces the limits.
+    """
+    def __init__(self, store, max_concurrency=DEFAULT_MAX_CONCURRENCY, per_host_concurrency=DEFAULT_PER_HOST_CONCURRENCY,
+                 requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, max_items_per_feed=DEFAULT_MAX_ITEMS_PER_FEED):
+        self.store = store
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_host_concurrency = max(1, per_host_concurrency)
+        self.max_items_per_feed = max_items_per_feed
+        self._budget = TokenBucket(requests_per_minute, capacity=max(1, min(requests_per_minute, self.max_concurrency)))
+        self._executor = None
+        self._global = None
+        self._hosts = {}
+
+    async def _limited(self, url, func, *args):
+        """Runs func(*args) on the thread pool once the global, per-host and per-minute limits allow it."""
+        host = urlsplit(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host_concurrency)
+        async with self._global, self._hosts[host]:
+            wait = self._budget.reserve(1) # The loop is single-threaded, so the bucket needs no lock here
+            if wait:
+                await asyncio.sleep(wait)
+            call = functools.partial(contextvars.copy_context().run, func, *args)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    async def _discover(self, feed_url):
+        """Fetches and parses one feed; returns (unseen items, items in the feed), or ([], None) if it failed."""
+        try:
+            response = await self._limited(feed_url, ti_fetch.fetch, feed_url, None, ti_fetch.DEFAULT_TIMEOUT, True, None, "feed")
+            items = parse_feed(response.content, response.url)
+        except Exception as e:
+            ti_events.warning(f"Feed {feed_url} could not be read: {e}", source="ti_feeds", feed=feed_url)
+            return [], None
+        for item in items:
+            item.url = normalize_url(item.url)
+            item.feed_url = feed_url
+        items = list({item.url: item for item in items}.values())[:self.max_items_per_feed]
+        return self.store.unseen(items), len(items)
+
+    async def _scrape(self, item):
+        text = await self._limited(item.url, scrape_text, item.url)
+        if not text or not text.strip() or text.startswith(SCRAPE_ERROR_PREFIXES):
+            self.store.record_failed(item, text or "No text extracted.")
+            return STATUS_FAILED
+        # Syndicated copies of an article seen before are not queued again (fingerprinting is CPU work, so off the loop)
+        _, duplicate = await asyncio.get_running_loop().run_in_executor(self._executor, ti_dedup.check, text, item.url)
+        if duplicate is not None and duplicate.source != item.url:
+            self.store.record_duplicate(item, duplicate)
+            return STATUS_DUPLICATE
+        self.store.record_queued(item, text)
+        return STATUS_QUEUED
+
+    async def crawl(self, feed_urls):
+        """
+        Runs one cycle over `feed_urls`.
+
+        Returns:
+            dict: {"feeds", "feeds_failed", "items", "new", "fetched", "duplicates", "failed", "seconds"}, where
+            "fetched" counts the scraped articles, queued or found to be duplicates.
+        """
+        started = time.monotonic()
+        self._global = asyncio.Semaphore(self.max_concurrency)
+        self._hosts = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ti-feeds") as self._executor:
+            discovered = await asyncio.gather(*(self._discover(url) for url in feed_urls))
+            new_items = list({item.url: item for items, _ in discovered for item in items}.values())
+            results = await asyncio.gather(*(self._scrape(item) for item in new_items), return_exceptions=True)
+        for item, result in zip(new_items, results):
+            if isinstance(result, Exception):
+                self.store.record_failed(item, result)
+        fetched = sum(result in (STATUS_QUEUED, STATUS_DUPLICATE) for result in results)
+        duplicates = sum(result == STATUS_DUPLICATE for result in results)
+        report = {
+            "feeds": len(feed_urls),
+            "feeds_failed": sum(total is None for _, total in discovered),
+            "items": sum(total or 0 for _, total in discovered),
+            "new": len(new_items),
+            "fetched": fetched,
+            "duplicates": duplicates,
+            "failed": len(new_items) - fetched,
+            "seconds": round(time.monotonic() - started, 2),
+        }
+        ti_events.info(f"Feed cycle: {report['new']} new articles in {report['feeds']} feeds, {fetched - duplicates} queued, "
+                       f"{duplicates} duplicates, "
+                       f"{report['failed']} failed ({report['seconds']}s)", source="ti_feeds", **report)
+        return report
+
+def crawl(feed_urls, store=None, **options):
+    """Runs one crawl cycle (see FeedCrawler) from synchronous code; returns the cycle report."""
+    store = store or FeedStore()
+    return asyncio.run(FeedCrawler(store, **options).crawl(feed_urls))
+
+async def poll(feed_urls, store, interval=DEFAULT_POLL_INTERVAL_SECONDS, cycles=None, on_cycle=None, **options):
+    """Runs a crawl cycle every `interval` seconds (forever, or `cycles` times)."""
+    crawler = FeedCrawler(store, **options)
+    cycle = 0
+    while cycles is None or cycle < cycles:
+        started = time.monotonic()
+        report = await crawler.crawl(feed_urls)
+        cycle += 1
+        if on_cycle:
+            on_cycle(report)
+        if cycles is None or cycle < cycles:
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+# --- Export ---
+
+def export_queue(store, directory, limit=None):
+    """
+    Writes queued articles as .md files (source URL on the first line) for ti_batch, and takes them
+    off the queue. Returns the written paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for entry in store.queued(limit):
+        slug = hashlib.sha1(entry["url"].encode("utf-8")).hexdigest()[:12]
+        path = os.path.join(directory, f"{urlsplit(entry['url']).netloc.replace(':', '_')}-{slug}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Source: {entry['url']}\n\n{entry['markdown']}\n")
+        store.mark_analyzed(entry["url"])
+        paths.append(path)
+    return paths
+
+# --- Command Line ---
+
+def read_feed_list(inputs, list_files=()):
+    feeds = list(inputs)
+    for list_file in list_files:
+        with open(list_file, encoding="utf-8") as f:
+            feeds += [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    return list(dict.fromkeys(feeds))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("feeds", nargs="*", help="RSS/Atom feed URLs.")
+    parser.add_argument("--list", action="append", default=[], metavar="FILE", help="File with one feed URL per line (repeatable).")
+    parser.add_argument("--interval", type=int, help="Poll every N seconds instead of running one cycle.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY, help="Fetches in flight across all hosts.")
+    parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST_CONCURRENCY, help="Fetches in flight per host.")
+    parser.add_argument("--requests-per-minute", type=int, default=DEFAULT_REQUESTS_PER_MINUTE)
+    parser.add_argument("--max-items", type=int, default=DEFAULT_MAX_ITEMS_PER_FEED, help="Newest items considered per feed.")
+    parser.add_argument("--db", default=FEEDS_DB_PATH, help=f"State database (default: {FEEDS_DB_PATH}).")
+    parser.add_argument("--export", metavar="DIR", help="Write the queued articles as .md files for ti_batch (after crawling, if feeds are given).")
+    args = parser.parse_args(argv)
+    feeds = read_feed_list(args.feeds, args.list)
+    if not feeds and not args.export:
+        parser.error("no feeds given")
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    store = FeedStore(args.db)
+    options = {"max_concurrency": args.concurrency, "per_host_concurrency": args.per_host,
+               "requests_per_minute": args.requests_per_minute, "max_items_per_feed": args.max_items}
+    try:
+        if feeds and args.interval:
+            asyncio.run(poll(feeds, store, args.interval, **options))
+        elif feeds:
+            report = crawl(feeds, store, **options)
+            print(f"{report['new']} new articles in {report['feeds']} feeds ({report['feeds_failed']} unreadable): "
+                  f"{report['fetched'] - report['duplicates']} queued, {report['duplicates']} duplicates, {report['failed']} failed, "
+                  f"{report['seconds']}s")
+        if args.export:
+            paths = export_queue(store, args.export)
+            print(f"Exported {len(paths)} articles to {args.export}")
+        print("Queue:", ", ".join(f"{count} {status}" for status, count in store.stats().items()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+import os
+import re
+import time
+import base64
+import atexit
+import threading
+import email.utils
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+import ti_metrics
+from ti_cache import CACHE_DIR, DiskCache
+
+# Shared HTTP fetching for source ingestion: one pooled requests.Session per host, a per-host
+# politeness delay instead of a fixed sleep, and an on-disk HTTP cache that revalidates with
+# ETag / Last-Modified, so re-analyzing a URL costs a 304 (or nothing) instead of a full download.
+# Bodies are streamed under a byte cap: the content type is sniffed from the first chunk, text
+# (HTML, XML, plain) is cut off at MAX_TEXT_BYTES, and anything else (PDF) above MAX_DOWNLOAD_BYTES
+# is refused, so a huge or hostile URL cannot exhaust the worker's memory.
+
+# --- Constants ---
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9,it;q=0.8",
+    "Accept-Encoding": "gzip, deflate, br",
+    "DNT": "1",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+    "Sec-Fetch-Dest": "document",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-Site": "none",
+    "Sec-Fetch-User": "?1",
+}
+DEFAULT_TIMEOUT = 20
+POOL_MAXSIZE = 8 # Connections kept per host
+
+POLITENESS_DELAY_SECONDS = 1.0 # Minimum spacing between requests to the same host (not applied to a host's first request)
+MAX_RETRY_AFTER_SECONDS = 60.0 # Longer Retry-After values on 429/503 are capped when holding a host back
+
+MAX_TEXT_BYTES = int(os.environ.get("TI_FETCH_MAX_TEXT_BYTES", 5 * 1024 * 1024))  # HTML/text beyond this is truncated
+MAX_DOWNLOAD_BYTES = int(os.environ.get("TI_FETCH_MAX_BYTES", 50 * 1024 * 1024)) # Larger PDF/binary bodies are refused
+CHUNK_SIZE = 64 * 1024
+
+# Content kinds (see sniff_content_kind)
+CONTENT_HTML = "html"
+CONTENT_PDF = "pdf"
+CONTENT_TEXT = "text"     # XML feeds, plain text, JSON
+CONTENT_BINARY = "binary"
+TEXT_CONTENT_KINDS = (CONTENT_HTML, CONTENT_TEXT)
+
+HTTP_CACHE_PATH = os.path.join(CACHE_DIR, "http_fetch.sqlite")
+HTTP_CACHE_MAX_BYTES = 256 * 1024 * 1024
+HTTP_CACHE_TTL_SECONDS = 30 * 24 * 3600 # Entries older than this are dropped even if they could be revalidated
+HEURISTIC_FRESH_SECONDS = 600 # Responses without max-age or validators are reused for this long
+CACHED_HEADERS = ("content-type", "etag", "last-modified", "cache-control", "date", "expires", "content-language")
+
+class ResponseTooLarge(requests.exceptions.RequestException):
+    """A non-text body larger than the download cap."""
+
+def sniff_content_kind(content_type, head):
+    """
+    Classifies a body as CONTENT_HTML, CONTENT_PDF, CONTENT_TEXT or CONTENT_BINARY from its
+    Content-Type header and its first bytes (the magic bytes win over a wrong or missing header).
+    """
+    if b"%PDF-" in head[:1024]:
+        return CONTENT_PDF
+    mime = (content_type or "").split(";")[0].strip().lower()
+    if mime == "application/pdf":
+        return CONTENT_PDF
+    if mime in ("text/html", "application/xhtml+xml"):
+        return CONTENT_HTML
+    if mime.startswith("text/") or mime.endswith(("+xml", "/xml", "/json")):
+        return CONTENT_TEXT
+    start = head[:512].lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if start.startswith((b"<!doctype html", b"<html", b"<head", b"<body")):
+        return CONTENT_HTML
+    if start.startswith(b"<?xml"):
+        return CONTENT_TEXT
+    return CONTENT_BINARY
+
+class FetchResult:
+    """
+    A fetched URL: status, headers and body, whether it came from the network or the cache.
+
+    `cache` is "miss" (downloaded), "hit" (served from the cache without a request) or
+    "revalidated" (the server answered 304 Not Modified). `truncated` is set when a text body was
+    cut off at the byte cap.
+    """
+    def __init__(self, url, status_code, headers, content, cache="miss", elapsed=0.0, truncated=False):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.content = content
+        self.cache = cache
+        self.elapsed = elapsed
+        self.truncated = truncated
+
+    @property
+    def content_kind(self):
+        return sniff_content_kind(self.headers.get("content-type"), self.content[:1024])
+
+    @property
+    def from_cache(self):
+        return self.cache != "miss"
+
+    @property
+    def text(self):
+        match = re.search(r"charset=([\w-]+)", self.headers.get("content-type", ""))
+        return self.content.decode(match.group(1) if match else "utf-8", errors="replace")
+
+    def __repr__(self):
+        truncated = ", truncated" if self.truncated else ""
+        return f"FetchResult({self.url!r}, status={self.status_code}, {len(self.content)} bytes{truncated}, cache={self.cache!r})"
+
+# --- Sessions and Politeness ---
+
+class _Host:
+    """Pooled session and politeness state for one scheme://host."""
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(DEFAULT_HEADERS)
+        self.next_request_at = 0.0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, delay):
+        """Claims the host's next request slot; returns the seconds to wait before sending."""
+        with self.lock:
+            now = time.monotonic()
+            wait = max(0.0, self.next_request_at - now)
+            self.next_request_at = now + wait + delay
+            self.requests += 1
+            return wait
+
+    def hold_back(self, seconds):
+        with self.lock:
+            self.next_request_at = max(self.next_request_at, time.monotonic() + seconds)
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+def _host_key(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+def _get_host(url):
+    key = _host_key(url)
+    with _hosts_lock:
+        host = _hosts.get(key)
+        if host is None:
+            host = _hosts[key] = _Host()
+    return host
+
+def get_session(url):
+    """The pooled session used for `url`'s host (for callers that need requests' full API)."""
+    return _get_host(url).session
+
+def close_all_sessions():
+    with _hosts_lock:
+        for host in _hosts.values():
+            host.session.close()
+        _hosts.clear()
+
+atexit.register(close_all_sessions)
+
+# --- HTTP Cache ---
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+def get_http_cache():
+    """Returns the process-wide HTTP response cache, creating it on first use."""
+    global _http_cache
+    if _http_cache is None:
+        with _http_cache_lock:
+            if _http_cache is None:
+                _http_cache = DiskCache(HTTP_CACHE_PATH, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_TTL_SECONDS)
+    return _http_cache
+
+def _cache_control(headers):
+    directives = {}
+    for part in (headers.get("cache-control") or "").lower().split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name] = value.strip('"')
+    return directives
+
+def _freshness_seconds(headers):
+    """How long a stored response may be reused without asking the server."""
+    directives = _cache_control(headers)
+    if "no-cache" in directives:
+        return 0
+    if directives.get("max-age", "").isdigit():
+        return int(directives["max-age"])
+    expires, date = headers.get("expires"), headers.get("date")
+    if expires and date:
+        try:
+            return max(0, int((email.utils.parsedate_to_datetime(expires) - email.utils.parsedate_to_datetime(date)).total_seconds()))
+        except (TypeError, ValueError):
+            return 0
+    if headers.get("etag") or headers.get("last-modified"):
+        return 0 # Cheap to revalidate, so always ask
+    return HEURISTIC_FRESH_SECONDS
+
+def _is_storable(response):
+    return response.status_code == 200 and "no-store" not in _cache_control(response.headers)
+
+def _store(cache, key, response):
+    headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+    cache.set(key, {"url": response.url, "headers": headers, "stored_at": time.time(),
+                    "body": base64.b64encode(response.content).decode("ascii")})
+
+def _from_entry(entry, cache_state, elapsed=0.0):
+    return FetchResult(entry["url"], 200, entry["headers"], base64.b64decode(entry["body"]), cache_state, elapsed)
+
+def _retry_after_seconds(response):
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# --- Fetching ---
+
+def _read_capped(response, max_text_bytes, max_bytes):
+    """
+    Reads a streamed body (decompressed) chunk by chunk. Returns (content, truncated).
+
+    Raises:
+        ResponseTooLarge: If a non-text body exceeds `max_bytes`.
+    """
+    declared = response.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes and sniff_content_kind(response.headers.get("content-type"), b"") not in TEXT_CONTENT_KINDS:
+        raise ResponseTooLarge(f"Response of {int(declared):,} bytes exceeds the {max_bytes:,} byte limit", response=response)
+    chunks, size, limit, kind = [], 0, None, None
+    for chunk in response.iter_content(CHUNK_SIZE):
+        if kind is None:
+            kind = sniff_content_kind(response.headers.get("content-type"), chunk)
+            limit = max_text_bytes if kind in TEXT_CONTENT_KINDS else max_bytes
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            if kind not in TEXT_CONTENT_KINDS:
+                raise ResponseTooLarge(f"Response exceeds the {max_bytes:,} byte limit", response=response)
+            return b"".join(chunks)[:limit], True # Parsers cope with a cut-off document
+    return b"".join(chunks), False
+
+def fetch(url, headers=None, timeout=DEFAULT_TIMEOUT, use_cache=True, politeness_delay=None, name="fetch",
+          max_text_bytes=None, max_bytes=None):
+    """
+    GETs `url` over the host's pooled session, using the HTTP cache.
+
+    A fresh cached copy is returned without a request; a stale one is revalidated with
+    If-None-Match / If-Modified-Since. Requests to the same host are spaced by `politeness_delay`
+    (default POLITENESS_DELAY_SECONDS). The body is streamed: HTML and other text is truncated at
+    `max_text_bytes` (default MAX_TEXT_BYTES), other content is refused above `max_bytes` (default
+    MAX_DOWNLOAD_BYTES). Truncated bodies are not cached.
+    The call is recorded in ti_metrics (kind "scrape") under `name`.
+
+    Returns:
+        FetchResult: The final URL (after redirects), status, headers and body.
+
+    Raises:
+        requests.exceptions.RequestException: On connection errors and timeouts, and
+            requests.exceptions.HTTPError for 4xx/5xx answers (with `.response` set), like requests.get
+            followed by raise_for_status(); ResponseTooLarge for bodies over the download cap.
+    """
+    started = time.perf_counter()
+    host = _get_host(url)
+    cache = get_http_cache() if use_cache else None
+    key = f"GET {url}"
+    with ti_metrics.track(ti_metrics.KIND_SCRAPE, name, host=_host_key(url)) as metric:
+        entry = cache.get(key) if cache else None
+        if entry is not None and time.time() - entry["stored_at"] < _freshness_seconds(entry["headers"]):
+            metric.cached = True
+            metric.details["cache"] = "hit"
+            return _from_entry(entry, "hit", time.perf_counter() - started)
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry["headers"].get("etag"):
+                request_headers["If-None-Match"] = entry["headers"]["etag"]
+            if entry["headers"].get("last-modified"):
+                request_headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+
+        wait = host.reserve(POLITENESS_DELAY_SECONDS if politeness_delay is None else politeness_delay)
+        if wait:
+            ti_metrics.note_queue(wait)
+            time.sleep(wait)
+        with host.session.get(url, headers=request_headers, timeout=timeout, allow_redirects=True, stream=True) as response:
+            if response.status_code == 200:
+                content, truncated = _read_capped(response, max_text_bytes or MAX_TEXT_BYTES, max_bytes or MAX_DOWNLOAD_BYTES)
+            else:
+                content, truncated = b"", False # Error and 304 bodies are not needed
+
+        if response.status_code == 304 and entry is not None:
+            entry["stored_at"] = time.time() # Fresh again for another freshness lifetime
+            for header, value in response.headers.items():
+                if header.lower() in CACHED_HEADERS:
+                    entry["headers"][header.lower()] = value
+            cache.set(key, entry)
+            metric.cached = True
+            metric.details["cache"] = "revalidated"
+            return _from_entry(entry, "revalidated", time.perf_counter() - started)
+
+        if response.status_code in (429, 503):
+            retry_after = _retry_after_seconds(response)
+            if retry_after:
+                host.hold_back(min(retry_after, MAX_RETRY_AFTER_SECONDS))
+        response.raise_for_status()
+        result = FetchResult(response.url, response.status_code, response.headers, content, "miss", time.perf_counter() - started, truncated)
+        if cache is not None and not truncated and _is_storable(response):
+            _store(cache, key, result)
+        metric.details.update(cache="miss", status=response.status_code, bytes=len(content), kind=result.content_kind)
+        if truncated:
+            metric.details["truncated"] = True
+        return result
+
+def get_host_stats():
+    """Requests sent per host through fetch, for diagnostics."""
+    with _hosts_lock:
+        return {key: host.requests for key, host in _hosts.items()}
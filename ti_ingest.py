@@ -0,0 +1,75 @@
+import requests
+import ti_events
+import ti_fetch
+import ti_extract
+import ti_pdftext
+
+# Source ingestion (URL scraping and PDF text extraction), shared by the Streamlit app, ti_batch and ti_feeds.
+
+# scrape_text returns these messages (instead of raising) when a page could not be scraped
+SCRAPE_ERROR_PREFIXES = ("Failed to scrape", "HTTP Error", "Access denied", "Could not extract")
+
+def scrape_text(url):
+    """Scrapes text from a URL and converts to Markdown (a PDF served from the URL is extracted as a PDF)."""
+    try:
+        # Pooled per-host session, per-host politeness delay, HTTP cache and byte caps (see ti_fetch)
+        response = ti_fetch.fetch(url, timeout=20, name="scrape_text")
+        kind = response.content_kind
+        if kind == ti_fetch.CONTENT_PDF:
+            text, error = extract_text_from_pdf(response.content)
+            return f"Failed to scrape the website: {error}" if error else text
+        if kind == ti_fetch.CONTENT_BINARY:
+            content_type = response.headers.get("content-type") or "unknown"
+            return f"Failed to scrape the website: unsupported content type ({content_type}) at {url}"
+        if response.truncated:
+            ti_events.warning(f"The page at {url} is larger than {ti_fetch.MAX_TEXT_BYTES // (1024 * 1024)} MB; "
+                              "only its beginning was analyzed.", source="scrape_text", url=url)
+
+        # Boilerplate-free Markdown of the main content, on the fastest installed parser (see ti_extract);
+        # bytes let the parser honor the page's <meta charset> when the server did not send one
+        html = response.text if "charset=" in response.headers.get("content-type", "") else response.content
+        text = ti_extract.html_to_markdown(html)
+        if text:
+            return text
+        return "Could not extract main content from the page."
+        
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code == 403:
+            return f"Access denied (403): The website blocked the request. Try a different URL or contact the site administrator."
+        return f"HTTP Error {e.response.status_code}: {e}"
+    except requests.exceptions.Timeout:
+        return f"Failed to scrape the website: Request timed out for URL {url}"
+    except requests.exceptions.RequestException as e:
+        return f"Failed to scrape the website: {e}"
+
+def extract_pdf(pdf_source):
+    """
+    Extracts a PDF (its bytes, a file path or a binary file object, e.g. an upload) with ti_pdftext.
+
+    Returns:
+        tuple: (ti_pdftext.PdfExtraction, None), or (None, error message).
+    """
+    try:
+        # Cached by the document's SHA-256; page-parallel for large documents, stopping at ti_pdftext.PDF_TEXT_MAX_CHARS
+        extraction = ti_pdftext.extract_pdf_text(pdf_source)
+    except Exception as e:
+        return None, f"Failed to process PDF: {str(e)}"
+    if extraction.truncated:
+        ti_events.warning(f"Only the first {extraction.pages_extracted} of {extraction.pages} PDF pages were extracted "
+                          f"({len(extraction.text):,} characters, the ingestion limit).", source="extract_text_from_pdf")
+    return extraction, None
+
+def extract_text_from_pdf(pdf_source):
+    """Extracts text from a PDF: its bytes, a file path or a binary file object (e.g. an upload)."""
+    try:
+        extraction, error = extract_pdf(pdf_source)
+        if error:
+            return None, error
+        text = extraction.text
+
+        if not text.strip():
+            return "Could not extract any text from the PDF. The PDF might be image-based (requiring OCR, which is not implemented) or protected.", None
+        # We return raw text. If Markdown conversion is needed, it can be done selectively later.
+        return text, None # Return raw text and no error
+    except Exception as e:
+        return None, f"Failed to process PDF: {str(e)}"
@@ -0,0 +1,340 @@
+import re
+import io
+import csv
+import hashlib
+import ipaddress
+import numpy as np
+import pandas as pd
+from ti_tlds import TLDS
+
+# --- Constants ---
+IOC_COLUMNS = ["Indicator", "Type", "Description", "Virus Total URL"] # Same layout as the AI-extracted table
+DESCRIPTION_CONTEXT_CHARS = 60 # Characters of surrounding text kept on each side as the description
+
+# IOC extraction modes offered in the UI
+MODE_LOCAL = "Local"
+MODE_MERGED = "Local + AI (merged)"
+MODE_AI = "AI only"
+EXTRACTION_MODES = (MODE_LOCAL, MODE_MERGED, MODE_AI)
+
+# File extensions that look like TLDs in "name.ext" tokens; such matches are file names, not domains
+FILE_EXTENSIONS = {
+    "exe", "dll", "sys", "bat", "cmd", "ps1", "psm1", "vbs", "vbe", "js", "jse", "hta", "lnk", "scr", "msi", "jar",
+    "py", "sh", "elf", "bin", "dat", "tmp", "log", "ini", "cfg", "conf", "json", "xml", "yml", "yaml", "csv", "txt",
+    "doc", "docx", "docm", "xls", "xlsx", "xlsm", "ppt", "pptx", "pdf", "rtf", "one", "iso", "img", "vhd", "rar",
+    "7z", "gz", "tar", "tgz", "cab", "png", "jpg", "jpeg", "gif", "bmp", "svg", "ico", "html", "htm", "php", "asp",
+    "aspx", "jsp", "cgi", "css", "db", "sqlite", "lock", "bak", "old", "pem", "crt", "key", "md",
+}
+
+# Words right before a dotted quad that make it a version number, not an address ("version 10.2.3.4")
+_VERSION_MARKER = re.compile(r"(?i)\b(?:versions?|ver|v|release|build|firmware|patch|rev(?:ision)?)\.?\s*:?\s*$")
+VERSION_MARKER_WINDOW = 16 # Characters before an IPv4 match searched for a version marker
+
+# --- Refanging ---
+
+_REFANG_PATTERN = re.compile(
+    r"(?=[\[\(\{hf])(?:" # Cheap first-character gate before trying the alternatives
+    r"\bhxxp(?=s?\b)|\bh\*\*p(?=s?\b)|\bfxp\b|\[:\]//|\[://\]|\[\.\]|\(\.\)|\{\.\}|\[dot\]|\(dot\)|\{dot\}"
+    r"|\[@\]|\[at\]|\(at\)|\{at\}|\[:\])",
+    re.IGNORECASE
+)
+_REFANG_REPLACEMENTS = {"hxxp": "http", "h**p": "http", "fxp": "ftp", "[:]//": "://", "[://]": "://", "[:]": ":"}
+
+def _refang_match(match):
+    token = match.group(0).lower()
+    if token in _REFANG_REPLACEMENTS:
+        return _REFANG_REPLACEMENTS[token]
+    return "@" if "@" in token or "at" in token else "."
+
+def refang(text):
+    """Turns defanged indicators back into their real form (hxxp -> http, [.] -> ., [at] -> @)."""
+    return _REFANG_PATTERN.sub(_refang_match, text)
+
+# --- Patterns ---
+# One alternation scanned in a single pass. At a given position earlier alternatives win, and
+# matches never overlap, so e.g. the domain inside a URL or an email address is not reported again
+# as a bare domain. Every indicator starts at a word boundary and contains a separator (. : / \ @),
+# unless it is a hash or a CVE ID; the gate checks that once per word before trying the alternatives.
+
+_IOC_PATTERNS = (
+    ("URL", r"(?i:(?:https?|ftp)://)[^\s<>\"'`\]\}|]+"), # ")" is kept when it balances a "(" (see _strip_url_tail)
+    ("Email Address", r"[A-Za-z0-9._%+-]+@(?:[A-Za-z0-9-]+\.)+[A-Za-z]{2,24}\b"),
+    ("Registry Key", r"(?:HKEY_LOCAL_MACHINE|HKEY_CURRENT_USER|HKEY_CLASSES_ROOT|HKEY_USERS|HKEY_CURRENT_CONFIG|HKLM|HKCU|HKCR|HKU|HKCC)"
+                     r"(?:\\[^\\\s\"'<>|,;]+)+"),
+    ("File Path", r"(?:[A-Za-z]:|%[A-Za-z_]+%|\\\\[A-Za-z0-9._$-]+)(?:\\[^\\\s\"'<>|,;*?]+)+"),
+    ("File Path", r"(?<![\w/])/(?:tmp|etc|var|usr|home|opt|bin|sbin|dev|root|lib|Library|Users|System|Applications|private)(?:/[^\s\"'<>|,;]+)+"),
+    ("File Hash (SHA256)", r"[A-Fa-f0-9]{64}\b"),
+    ("File Hash (SHA1)", r"[A-Fa-f0-9]{40}\b"),
+    ("File Hash (MD5)", r"[A-Fa-f0-9]{32}\b"),
+    ("CVE", r"(?i:CVE-\d{4}-\d{4,7})\b"),
+    ("IPv4", r"(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?![\d.]*\d)"),
+    ("IPv6", r"(?<![0-9A-Za-z:])(?:[0-9A-Fa-f]{0,4}:){2,7}[0-9A-Fa-f]{0,4}(?![0-9A-Za-z:])"),
+    ("Domain", r"(?<![A-Za-z0-9\-_./@\\])(?:[A-Za-z0-9](?:[A-Za-z0-9\-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,24}(?![A-Za-z0-9\-_@\\]|\.[A-Za-z0-9])"),
+)
+_IOC_GROUP_TYPES = {f"ioc{i}": ioc_type for i, (ioc_type, _) in enumerate(_IOC_PATTERNS)}
+_IOC_SCANNER = re.compile(
+    r"(?<![A-Za-z0-9_])(?=[^\s.:\\/@]*[.:\\/@]|[A-Fa-f0-9]{32}|(?i:CVE-))(?:" + "|".join(f"(?P<ioc{i}>{pattern})" for i, (_, pattern) in enumerate(_IOC_PATTERNS)) + ")"
+)
+
+_TRAILING_PUNCTUATION = ".,;:!?)]}>'\""
+
+# --- Extraction ---
+
+def _strip_url_tail(value):
+    """Strips trailing punctuation, keeping a closing parenthesis that balances one in the URL ("/path(1)")."""
+    while value and value[-1] in _TRAILING_PUNCTUATION:
+        if value[-1] == ")" and value.count("(") >= value.count(")"):
+            break
+        value = value[:-1]
+    return value
+
+def _is_ipv6_indicator(value):
+    """
+    True for IPv6 addresses worth reporting. ipaddress accepts "a::b" or "1:2::3", so at least
+    three groups, one with three or more hex digits, are also required.
+    """
+    groups = [group for group in value.split(":") if group]
+    if len(groups) < 3 or max(len(group) for group in groups) < 3:
+        return False
+    try:
+        ipaddress.IPv6Address(value)
+    except ValueError:
+        return False
+    return True
+
+def _has_known_tld(domain):
+    return domain.rsplit(".", 1)[-1].lower() in TLDS
+
+def _clean(ioc_type, value):
+    """Normalizes a raw match; returns None if it is not a valid indicator of that type."""
+    if ioc_type == "URL":
+        value = _strip_url_tail(value)
+        return value if len(value) > 3 else None
+    if ioc_type in ("File Path", "Registry Key"):
+        value = value.rstrip(_TRAILING_PUNCTUATION)
+        return value if len(value) > 3 else None
+    if ioc_type == "IPv4":
+        try:
+            return str(ipaddress.IPv4Address(value))
+        except ValueError:
+            return None
+    if ioc_type == "IPv6":
+        return str(ipaddress.IPv6Address(value)) if _is_ipv6_indicator(value) else None
+    if ioc_type == "Domain":
+        value = value.lower().rstrip(".")
+        if value.rsplit(".", 1)[-1] in FILE_EXTENSIONS or not _has_known_tld(value): # "John.Smith", "report.pdf"
+            return None
+        return value
+    if ioc_type.startswith("File Hash"):
+        if len(set(value.lower())) < 4: # e.g. 000...0 or ffff...f placeholders
+            return None
+        return value.lower()
+    if ioc_type == "CVE":
+        return value.upper()
+    if ioc_type == "Email Address":
+        return value.lower() if _has_known_tld(value) else None
+    return value
+
+def _dedupe_key(ioc_type, indicator):
+    if ioc_type in ("URL", "File Path", "Registry Key"):
+        return indicator.lower()
+    return indicator
+
+def _context(text, start, end):
+    left = max(0, start - DESCRIPTION_CONTEXT_CHARS)
+    right = min(len(text), end + DESCRIPTION_CONTEXT_CHARS)
+    snippet = " ".join(text[left:right].split())
+    return ("..." if left > 0 else "") + snippet + ("..." if right < len(text) else "")
+
+def virus_total_url(indicator, ioc_type):
+    """Returns the VirusTotal GUI link for an indicator, or "" for types VirusTotal does not index."""
+    if ioc_type.startswith("File Hash"):
+        return f"https://www.virustotal.com/gui/file/{indicator}"
+    if ioc_type in ("IPv4", "IPv6"):
+        return f"https://www.virustotal.com/gui/ip-address/{indicator}"
+    if ioc_type == "Domain":
+        return f"https://www.virustotal.com/gui/domain/{indicator}"
+    if ioc_type == "URL":
+        return f"https://www.virustotal.com/gui/url/{hashlib.sha256(indicator.encode()).hexdigest()}"
+    return ""
+
+# --- Columnar Pipeline ---
+# Normalization, classification, dedupe and VirusTotal links for whole IOC tables (AI output or bulk
+# imports) with vectorized pandas string operations instead of per-row Python loops.
+
+_IPV4_FULL = r"(?:(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)\.){3}(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)"
+_TLD_ALTERNATION = "|".join(sorted(TLDS, key=len, reverse=True)) # Longest first, as the patterns are full matches
+_DOMAIN_FULL = r"(?:[a-z0-9](?:[a-z0-9\-]{0,61}[a-z0-9])?\.)+(?:" + _TLD_ALTERNATION + ")"
+_PORT_SUFFIX = r":\d{1,5}$"
+
+# Full-match patterns used to (re)classify a canonical indicator, in priority order
+_TYPE_PATTERNS = (
+    ("URL", r"(?i:(?:https?|ftp)://)\S+"),
+    ("Email Address", r"[a-z0-9._%+-]+@" + _DOMAIN_FULL),
+    ("File Hash (SHA256)", r"[a-f0-9]{64}"),
+    ("File Hash (SHA1)", r"[a-f0-9]{40}"),
+    ("File Hash (MD5)", r"[a-f0-9]{32}"),
+    ("CVE", r"CVE-\d{4}-\d{4,7}"),
+    ("IPv4", _IPV4_FULL),
+    ("IPv6", r"(?=.*:.*:)[0-9a-f:]{2,39}"),
+    ("Registry Key", r"(?i:HKEY_[A-Z_]+|HKLM|HKCU|HKCR|HKU|HKCC)\\.+"),
+    ("File Path", r"(?:[A-Za-z]:|%[A-Za-z_]+%|\\\\[^\\]+)\\.+|/[^\s]+/[^\s]*"),
+    ("Domain", _DOMAIN_FULL),
+)
+
+def refang_series(values):
+    """Vectorized refang() for a pandas Series of strings."""
+    return values.str.replace(_REFANG_PATTERN, _refang_match, regex=True)
+
+_TYPE_CLASSIFIER = "^(?:" + "|".join(f"(?P<t{i}>{pattern})" for i, (_, pattern) in enumerate(_TYPE_PATTERNS)) + ")$"
+_TYPE_NAMES = np.array([ioc_type for ioc_type, _ in _TYPE_PATTERNS], dtype=object)
+
+def classify_ioc_types(indicators, fallback=None):
+    """
+    Classifies canonical indicators by pattern, in one regex pass over the column. Rows matching no
+    pattern keep their `fallback` type (e.g. the type the AI reported), or "Unknown".
+    """
+    if indicators.empty:
+        return pd.Series([], index=indicators.index, dtype=object)
+    matched = indicators.str.extract(_TYPE_CLASSIFIER).notna().to_numpy()
+    recognized = matched.any(axis=1)
+    types = _TYPE_NAMES[matched.argmax(axis=1)]
+    default = fallback.to_numpy(dtype=object) if fallback is not None else np.full(len(indicators), "Unknown", dtype=object)
+    return pd.Series(np.where(recognized, types, default), index=indicators.index, dtype=object)
+
+def add_virus_total_urls(ioc_dataframe):
+    """Fills the Virus Total URL column from Type and Indicator (vectorized virus_total_url)."""
+    types = ioc_dataframe["Type"].astype(str)
+    indicators = ioc_dataframe["Indicator"].astype(str)
+    links = pd.Series("", index=ioc_dataframe.index, dtype=object)
+    is_hash = types.str.startswith("File Hash").to_numpy()
+    is_ip = types.isin(["IPv4", "IPv6"]).to_numpy()
+    is_domain = (types == "Domain").to_numpy()
+    is_url = (types == "URL").to_numpy()
+    links[is_hash] = "https://www.virustotal.com/gui/file/" + indicators[is_hash]
+    links[is_ip] = "https://www.virustotal.com/gui/ip-address/" + indicators[is_ip]
+    links[is_domain] = "https://www.virustotal.com/gui/domain/" + indicators[is_domain]
+    if is_url.any(): # VirusTotal URL IDs are SHA256 digests; hashing has no vectorized form
+        links[is_url] = ["https://www.virustotal.com/gui/url/" + hashlib.sha256(url.encode()).hexdigest()
+                         for url in indicators[is_url]]
+    ioc_dataframe["Virus Total URL"] = links
+    return ioc_dataframe
+
+def normalize_ioc_dataframe(ioc_dataframe):
+    """
+    Canonicalizes, classifies, deduplicates and links an IOC table in one columnar pass.
+
+    Indicators are refanged and stripped; hashes, domains and emails are lower-cased; ports are
+    removed from IPv4 addresses and domains; types are re-derived from the indicator when it has a
+    recognizable form. Rows are deduplicated on (Type, Indicator), keeping the first description.
+
+    Returns:
+        pd.DataFrame: Columns Indicator, Type, Description and Virus Total URL.
+    """
+    if ioc_dataframe is None or ioc_dataframe.empty or "Indicator" not in ioc_dataframe.columns:
+        return pd.DataFrame(columns=IOC_COLUMNS)
+    df = ioc_dataframe.reindex(columns=IOC_COLUMNS).fillna("").astype(str)
+
+    indicators = refang_series(df["Indicator"].str.strip().str.strip("\"'`<>")).str.rstrip(".,;")
+    lowered = indicators.str.lower()
+    # URLs, paths and registry keys keep their case; everything else is case-insensitive
+    keeps_case = lowered.str.match(r"(?:https?|ftp)://|[a-z]:\\|%|\\\\|/|hk").to_numpy(dtype=bool)
+    canonical = pd.Series(np.where(keeps_case, indicators, lowered), index=df.index, dtype=object)
+    without_port = canonical.str.replace(_PORT_SUFFIX, "", regex=True)
+    is_host = without_port.str.fullmatch(f"{_IPV4_FULL}|{_DOMAIN_FULL}").fillna(False).to_numpy(dtype=bool)
+    canonical = pd.Series(np.where(is_host, without_port, canonical), index=df.index, dtype=object)
+    is_cve = canonical.str.startswith("cve-").to_numpy(dtype=bool)
+    canonical = pd.Series(np.where(is_cve, canonical.str.upper(), canonical), index=df.index, dtype=object)
+
+    df["Indicator"] = canonical
+    df["Type"] = classify_ioc_types(canonical, fallback=df["Type"].str.strip())
+    df = df[df["Indicator"] != ""]
+    df = df.drop_duplicates(subset=["Type", "Indicator"], keep="first").reset_index(drop=True)
+    return add_virus_total_urls(df)
+
+def parse_ioc_csv(response_content_str):
+    """
+    Parses CSV text (as produced by the AI) into a DataFrame with the header's columns.
+
+    Uses the csv module, so quoted fields may contain commas. Markdown code fences are ignored;
+    short rows are padded and long rows truncated to the header width.
+    """
+    lines = [line for line in (response_content_str or "").strip().splitlines()
+             if line.strip() and not line.strip().startswith("```")]
+    if not lines:
+        return pd.DataFrame()
+    rows = list(csv.reader(io.StringIO("\n".join(lines)), skipinitialspace=True))
+    header = [column.strip() for column in rows[0]]
+    width = len(header)
+    body = [(row + [""] * width)[:width] for row in rows[1:]]
+    return pd.DataFrame(body, columns=header).apply(lambda column: column.str.strip())
+
+def ioc_dataframe_from_records(records):
+    """Builds an IOC table from structured-output records ({"indicator", "type", "description"} dicts)."""
+    rows = [[str(record.get("indicator") or ""), str(record.get("type") or ""), str(record.get("description") or ""), ""]
+            for record in records or []]
+    return pd.DataFrame(rows, columns=IOC_COLUMNS)
+
+def extract_iocs_local(input_text):
+    """
+    Extracts IOCs from text with regular expressions, without any AI call.
+
+    Handles IPv4/IPv6, domains, URLs, MD5/SHA1/SHA256, CVE IDs, email addresses, registry keys and
+    file paths, including defanged forms (hxxp, [.], [at]). Indicators are refanged and deduplicated
+    in order of first appearance.
+
+    Returns:
+        pd.DataFrame: Columns Indicator, Type, Description (surrounding text) and Virus Total URL.
+    """
+    if not input_text:
+        return pd.DataFrame(columns=IOC_COLUMNS)
+    text = refang(input_text)
+    found = {}
+    for match in _IOC_SCANNER.finditer(text):
+        ioc_type = _IOC_GROUP_TYPES[match.lastgroup]
+        indicator = _clean(ioc_type, match.group(0))
+        if not indicator:
+            continue
+        if ioc_type == "IPv4" and _VERSION_MARKER.search(text, max(0, match.start() - VERSION_MARKER_WINDOW), match.start()):
+            continue
+        key = _dedupe_key(ioc_type, indicator)
+        if key not in found:
+            found[key] = [indicator, ioc_type, _context(text, match.start(), match.end()), ""]
+    rows = list(found.values()) # Already in order of first appearance
+    return add_virus_total_urls(pd.DataFrame(rows, columns=IOC_COLUMNS))
+
+def merge_ioc_tables(ai_dataframe, local_dataframe):
+    """
+    Merges AI-extracted and locally extracted IOC tables.
+
+    AI rows come first and keep their Type and Description; local rows add every indicator the AI
+    missed. Indicators are compared after refanging, case-insensitively.
+    """
+    if not isinstance(ai_dataframe, pd.DataFrame) or ai_dataframe.empty or "Indicator" not in ai_dataframe.columns:
+        return local_dataframe
+    ai_dataframe = ai_dataframe.reindex(columns=IOC_COLUMNS, fill_value="")
+    seen = refang_series(ai_dataframe["Indicator"].astype(str).str.strip()).str.lower()
+    missing = local_dataframe[~local_dataframe["Indicator"].str.lower().isin(seen)]
+    return pd.concat([ai_dataframe, missing], ignore_index=True)
+
+def extract_iocs(input_text, mode, client=None, ai_service_provider=None, deployment_name=None, structured=False, ai_result=None):
+    """
+    Builds the IOC table with the selected extraction mode (see EXTRACTION_MODES).
+
+    "Local" never calls the AI service; "Local + AI (merged)" adds what the AI found on top of the
+    local table, falling back to the local table if the AI call fails; "AI only" is the original
+    ai_extract_iocs behaviour. `structured` is passed on to ai_extract_iocs. `ai_result` is an AI
+    table produced elsewhere (e.g. by a fused extraction); ai_extract_iocs is then not called.
+    """
+    if mode == MODE_LOCAL:
+        return extract_iocs_local(input_text)
+
+    if ai_result is None:
+        from ti_ai import ai_extract_iocs # ti_ai imports this module for its IOC table handling
+        ai_result = ai_extract_iocs(input_text, client, ai_service_provider, deployment_name, structured=structured)
+    if mode == MODE_AI:
+        return ai_result
+    local_result = extract_iocs_local(input_text)
+    if not isinstance(ai_result, pd.DataFrame): # Error message from the AI call
+        return local_result
+    return merge_ioc_tables(ai_result, local_result)
@@ -0,0 +1,589 @@
+import json
+import asyncio
+import contextvars
+import hashlib
+import threading
+import atexit
+import httpx
+import ti_metrics
+from ti_cache import get_llm_cache, completion_key
+from ti_tokens import fit_messages, count_message_tokens, count_tokens
+from ti_schemas import schema_instructions
+from ti_ratelimit import call_with_rate_limit, acall_with_rate_limit, stream_with_rate_limit
+
+# --- Constants ---
+MISTRAL_API_ENDPOINT = "https://api.mistral.ai"
+AZURE_OPENAI_API_VERSION = "2023-05-15"
+AZURE_JSON_SCHEMA_API_VERSION = "2024-08-01" # First Azure API version with response_format json_schema
+AZURE_JSON_MODE_API_VERSION = "2023-12-01"   # First Azure API version with response_format json_object
+
+# Connection pool tuning: Tab 1 runs up to ~10 components at once, so keep enough warm connections
+# around that parallel components never wait on a TLS handshake.
+POOL_MAX_CONNECTIONS = 20
+POOL_MAX_KEEPALIVE_CONNECTIONS = 10
+POOL_KEEPALIVE_EXPIRY_SECONDS = 120
+REQUEST_TIMEOUT = httpx.Timeout(180.0, connect=10.0) # Long completions can take minutes
+SDK_MAX_RETRIES = 0 # Retries are done by ti_ratelimit, which also honors Retry-After across callers
+
+try:
+    import h2 # noqa: F401 - only needed to enable HTTP/2 in httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+def _pool_limits():
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+# --- Providers ---
+
+class Completion:
+    """Result of a chat completion: the text plus token usage when the provider reports it."""
+    def __init__(self, content, model=None, prompt_tokens=None, completion_tokens=None):
+        self.content = content
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    def __repr__(self):
+        return f"Completion(model={self.model!r}, prompt_tokens={self.prompt_tokens}, completion_tokens={self.completion_tokens})"
+
+class LLMProvider:
+    """
+    Base class for a long-lived, connection-pooled chat completion client.
+
+    Subclasses implement `complete`/`acomplete` and `stream`/`astream`; all take messages as
+    {"role": ..., "content": ...} dicts, so callers never deal with SDK-specific message types.
+    Async calls use a pool created inside the running event loop (see _async_pool).
+    """
+    name = None
+    context_window = None # Context window set by the user for the deployment (see ti_tokens.context_limit)
+
+    def __init__(self):
+        self._async_pools = {} # Event loop -> (httpx.AsyncClient, SDK client or None)
+        self._async_pools_lock = threading.Lock()
+
+    def complete(self, messages, model=None, **options):
+        raise NotImplementedError
+
+    async def acomplete(self, messages, model=None, **options):
+        raise NotImplementedError
+
+    def stream(self, messages, model=None, **options):
+        """Yields the completion text in chunks as the provider produces them."""
+        raise NotImplementedError
+
+    async def astream(self, messages, model=None, **options):
+        raise NotImplementedError
+        yield # pragma: no cover - makes this an async generator
+
+    def response_format(self, schema_name, schema):
+        """The `response_format` option that makes the provider return JSON for `schema`, or None if unsupported."""
+        return None
+
+    def _create_async_pool(self):
+        """Returns (httpx.AsyncClient, SDK client or None) for the running event loop."""
+        raise NotImplementedError
+
+    def _async_pool(self):
+        """
+        The async clients of the running event loop, created on first use in that loop. httpx
+        connections belong to the loop that opened them, so each loop (e.g. each asyncio.run) gets
+        its own pool; pools of loops that have been closed are dropped.
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_pools_lock:
+            pool = self._async_pools.get(loop)
+            if pool is None:
+                for stale in [other for other in self._async_pools if other.is_closed()]:
+                    del self._async_pools[stale]
+                pool = self._async_pools[loop] = self._create_async_pool()
+            return pool
+
+    def _close_pools(self):
+        """Closes the sync pool and every async pool whose event loop can still run its aclose()."""
+        self._http_client.close()
+        with self._async_pools_lock:
+            pools, self._async_pools = self._async_pools, {}
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for loop, (http_client, _) in pools.items():
+            if loop.is_closed():
+                continue # Its connections cannot be closed from another loop; they go with the client
+            try:
+                if loop is running:
+                    loop.create_task(http_client.aclose())
+                elif loop.is_running():
+                    asyncio.run_coroutine_threadsafe(http_client.aclose(), loop)
+                else:
+                    loop.run_until_complete(http_client.aclose())
+            except Exception:
+                pass
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return f"{type(self).__name__}(http2={HTTP2_AVAILABLE})"
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions over pooled, keep-alive httpx clients."""
+    name = "OpenAI"
+
+    def __init__(self, api_key, base_url=None, default_model=None):
+        import openai
+        super().__init__()
+        self.default_model = default_model
+        self._api_key = api_key
+        self._base_url = base_url
+        self._http_client = httpx.Client(http2=HTTP2_AVAILABLE, limits=_pool_limits(), timeout=REQUEST_TIMEOUT)
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url, http_client=self._http_client, max_retries=SDK_MAX_RETRIES)
+
+    def _create_async_pool(self):
+        import openai
+        http_client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=_pool_limits(), timeout=REQUEST_TIMEOUT)
+        return http_client, openai.AsyncOpenAI(api_key=self._api_key, base_url=self._base_url, http_client=http_client, max_retries=SDK_MAX_RETRIES)
+
+    @property
+    def async_client(self):
+        """The async SDK client of the running event loop."""
+        return self._async_pool()[1]
+
+    @staticmethod
+    def _to_completion(response):
+        usage = getattr(response, "usage", None)
+        return Completion(
+            response.choices[0].message.content,
+            model=getattr(response, "model", None),
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+        )
+
+    def complete(self, messages, model=None, **options):
+        response = self.client.chat.completions.create(model=model or self.default_model, messages=messages, **options)
+        return self._to_completion(response)
+
+    async def acomplete(self, messages, model=None, **options):
+        response = await self.async_client.chat.completions.create(model=model or self.default_model, messages=messages, **options)
+        return self._to_completion(response)
+
+    def response_format(self, schema_name, schema):
+        return {"type": "json_schema", "json_schema": {"name": schema_name, "strict": True, "schema": schema}}
+
+    def stream(self, messages, model=None, **options):
+        response = self.client.chat.completions.create(model=model or self.default_model, messages=messages, stream=True, **options)
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def astream(self, messages, model=None, **options):
+        response = await self.async_client.chat.completions.create(model=model or self.default_model, messages=messages, stream=True, **options)
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def close(self):
+        self._close_pools()
+
+class AzureOpenAIProvider(OpenAIProvider):
+    """Azure OpenAI chat completions; `model` is the deployment name."""
+    name = "Azure OpenAI"
+
+    def __init__(self, api_key, azure_endpoint, api_version=AZURE_OPENAI_API_VERSION, default_model=None):
+        import openai
+        LLMProvider.__init__(self)
+        self.default_model = default_model
+        self.api_version = api_version
+        self._api_key = api_key
+        self._azure_endpoint = azure_endpoint
+        self._http_client = httpx.Client(http2=HTTP2_AVAILABLE, limits=_pool_limits(), timeout=REQUEST_TIMEOUT)
+        self.client = openai.AzureOpenAI(api_key=api_key, azure_endpoint=azure_endpoint, api_version=api_version, http_client=self._http_client, max_retries=SDK_MAX_RETRIES)
+
+    def _create_async_pool(self):
+        import openai
+        http_client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=_pool_limits(), timeout=REQUEST_TIMEOUT)
+        return http_client, openai.AsyncAzureOpenAI(api_key=self._api_key, azure_endpoint=self._azure_endpoint, api_version=self.api_version,
+                                                    http_client=http_client, max_retries=SDK_MAX_RETRIES)
+
+    def response_format(self, schema_name, schema):
+        # API versions are ISO dates (optionally "-preview"), so they compare correctly as strings
+        if self.api_version >= AZURE_JSON_SCHEMA_API_VERSION:
+            return super().response_format(schema_name, schema)
+        if self.api_version >= AZURE_JSON_MODE_API_VERSION:
+            return {"type": "json_object"}
+        return None
+
+class MistralProvider(LLMProvider):
+    """MistralAI chat completions, calling the REST API directly over pooled httpx clients."""
+    name = "MistralAI"
+
+    def __init__(self, api_key, endpoint=MISTRAL_API_ENDPOINT, default_model=None):
+        super().__init__()
+        self.default_model = default_model
+        self._headers = {"Authorization": f"Bearer {api_key}", "Accept": "application/json"}
+        self._base_url = (endpoint or MISTRAL_API_ENDPOINT).rstrip("/")
+        self._http_client = httpx.Client(base_url=self._base_url, headers=self._headers, http2=HTTP2_AVAILABLE,
+                                         limits=_pool_limits(), timeout=REQUEST_TIMEOUT, follow_redirects=True)
+
+    def _create_async_pool(self):
+        return httpx.AsyncClient(base_url=self._base_url, headers=self._headers, http2=HTTP2_AVAILABLE,
+                                 limits=_pool_limits(), timeout=REQUEST_TIMEOUT, follow_redirects=True), None
+
+    def _payload(self, messages, model, options):
+        payload = {"model": model or self.default_model, "messages": messages}
+        payload.update(options)
+        return payload
+
+    @staticmethod
+    def _to_completion(data):
+        usage = data.get("usage") or {}
+        return Completion(
+            data["choices"][0]["message"]["content"],
+            model=data.get("model"),
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
+
+    def complete(self, messages, model=None, **options):
+        response = self._http_client.post("/v1/chat/completions", json=self._payload(messages, model, options))
+        response.raise_for_status()
+        return self._to_completion(response.json())
+
+    async def acomplete(self, messages, model=None, **options):
+        response = await self._async_pool()[0].post("/v1/chat/completions", json=self._payload(messages, model, options))
+        response.raise_for_status()
+        return self._to_completion(response.json())
+
+    def response_format(self, schema_name, schema):
+        return {"type": "json_object"} # Mistral JSON mode; the schema itself is described in the prompt
+
+    @staticmethod
+    def _delta_from_sse_line(line):
+        """Extracts the content delta from one server-sent event line, or None."""
+        if not line or not line.startswith("data:"):
+            return None
+        data = line[len("data:"):].strip()
+        if not data or data == "[DONE]":
+            return None
+        choices = json.loads(data).get("choices") or []
+        if not choices:
+            return None
+        return (choices[0].get("delta") or {}).get("content")
+
+    def stream(self, messages, model=None, **options):
+        payload = self._payload(messages, model, dict(options, stream=True))
+        with self._http_client.stream("POST", "/v1/chat/completions", json=payload, headers={"Accept": "text/event-stream"}) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                delta = self._delta_from_sse_line(line)
+                if delta:
+                    yield delta
+
+    async def astream(self, messages, model=None, **options):
+        payload = self._payload(messages, model, dict(options, stream=True))
+        async with self._async_pool()[0].stream("POST", "/v1/chat/completions", json=payload, headers={"Accept": "text/event-stream"}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                delta = self._delta_from_sse_line(line)
+                if delta:
+                    yield delta
+
+    def close(self):
+        self._close_pools()
+
+# --- Provider Registry ---
+# Providers are created once per (service, credentials, endpoint) and reused for the lifetime of the
+# process, so Streamlit reruns and parallel components share the same warm connection pools.
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+def get_provider(ai_service_provider, api_key, endpoint=None, api_version=None, default_model=None, context_window=None):
+    """
+    Returns the shared provider for the given service and credentials, creating it on first use.
+
+    Args:
+        ai_service_provider (str): "OpenAI", "Azure OpenAI" or "MistralAI".
+        api_key (str): API key for the service.
+        endpoint (str, optional): Azure endpoint, or a base URL override for OpenAI/MistralAI.
+        api_version (str, optional): Azure OpenAI API version.
+        default_model (str, optional): Model used when a call does not name one.
+        context_window (int, optional): Context window of the deployment, when its name does not
+            reveal the model; requests are trimmed to it instead of the window looked up by name.
+    """
+    key_digest = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+    registry_key = (ai_service_provider, key_digest, endpoint, api_version, default_model, context_window)
+    with _providers_lock:
+        provider = _providers.get(registry_key)
+        if provider is None:
+            if ai_service_provider == "OpenAI":
+                provider = OpenAIProvider(api_key, base_url=endpoint, default_model=default_model)
+            elif ai_service_provider == "Azure OpenAI":
+                if not endpoint:
+                    raise ValueError("An endpoint is required for Azure OpenAI.")
+                provider = AzureOpenAIProvider(api_key, endpoint, api_version=api_version or AZURE_OPENAI_API_VERSION, default_model=default_model)
+            elif ai_service_provider == "MistralAI":
+                provider = MistralProvider(api_key, endpoint=endpoint or MISTRAL_API_ENDPOINT, default_model=default_model)
+            else:
+                raise ValueError(f"Unsupported AI service provider: {ai_service_provider}")
+            provider.context_window = context_window
+            _providers[registry_key] = provider
+    return provider
+
+def close_all_providers():
+    """Closes the connection pools of every provider created by get_provider."""
+    with _providers_lock:
+        for provider in _providers.values():
+            try:
+                provider.close()
+            except Exception:
+                pass
+        _providers.clear()
+
+atexit.register(close_all_providers)
+
+# --- Chat Completion Entry Points ---
+
+# Whether completions are read from and written to the LLM cache when a caller passes no use_cache.
+# A context variable, so each Streamlit session (script run thread) and the component threads it
+# starts keep their own setting; the cache itself is shared by the whole process.
+_cache_enabled = contextvars.ContextVar("ti_llm_cache_enabled", default=True)
+
+def set_cache_enabled(enabled):
+    """Sets the default use_cache of the completions made in the current context (thread or task); returns a token for reset_cache_enabled."""
+    return _cache_enabled.set(bool(enabled))
+
+def reset_cache_enabled(token):
+    _cache_enabled.reset(token)
+
+def _use_cache(use_cache):
+    return _cache_enabled.get() if use_cache is None else use_cache
+
+def _fit_to_context(client, model, messages, budget_text, component, options):
+    """Trims `budget_text` inside the messages so the request fits the model's (or the provider's) context window."""
+    if budget_text is None and component is None:
+        return messages
+    fitted, _ = fit_messages(messages, model, budget_text, max_output_tokens=options.get("max_tokens"), component=component,
+                             context_window=getattr(client, "context_window", None))
+    return fitted
+
+def _track_llm(ai_service_provider, model, component, call):
+    """Records one entry-point call (cache hits included) in ti_metrics, named after the component."""
+    return ti_metrics.track(ti_metrics.KIND_LLM, component or call, provider=ai_service_provider, model=model)
+
+def _record_usage(metric, completion, messages, model):
+    """Adds a Completion's token usage to `metric`, counting locally when the provider reported none."""
+    metric.model = completion.model or metric.model
+    prompt_tokens, completion_tokens = completion.prompt_tokens, completion.completion_tokens
+    if prompt_tokens is None or completion_tokens is None:
+        prompt_tokens, completion_tokens = count_message_tokens(messages, model), count_tokens(completion.content or "", model)
+        metric.tokens_estimated = True
+    metric.prompt_tokens = (metric.prompt_tokens or 0) + prompt_tokens
+    metric.completion_tokens = (metric.completion_tokens or 0) + completion_tokens
+
+def chat_completion(client, ai_service_provider, model, messages, use_cache=None, budget_text=None, component=None, **options):
+    """
+    Sends a chat completion request and returns the message content.
+
+    All generation functions in ti_ai, ti_stix, ti_navigator and ti_5whats go through here, so
+    identical requests (same provider, model and messages) are served from the on-disk cache, and
+    requests to the provider are paced and retried by ti_ratelimit.
+
+    Args:
+        client (LLMProvider): A provider returned by get_provider.
+        ai_service_provider (str): "OpenAI", "Azure OpenAI" or "MistralAI".
+        model (str): Model name, or deployment name for Azure OpenAI.
+        messages (list[dict]): Messages as {"role": ..., "content": ...} dicts.
+        use_cache (bool, optional): Set to False to always call the provider. Defaults to the
+            current context's setting (see set_cache_enabled).
+        budget_text (str, optional): The source text embedded in the messages. It is trimmed (by tokens,
+            for the model's tokenizer) if the request would not fit the model's context window.
+        component (str, optional): Name under which the token budget of this call is recorded (see ti_tokens).
+        **options: Extra request options such as max_tokens.
+
+    Returns:
+        str: The content of the first choice.
+    """
+    messages = _fit_to_context(client, model, messages, budget_text, component, options)
+    use_cache = _use_cache(use_cache)
+    cache = get_llm_cache()
+    key = completion_key(ai_service_provider, model, messages, **options)
+    with _track_llm(ai_service_provider, model, component, "chat_completion") as metric:
+        if use_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                metric.cached = True
+                return cached
+
+        completion = call_with_rate_limit(ai_service_provider, model, messages, options.get("max_tokens"),
+                                          lambda: client.complete(messages, model=model, **options))
+        _record_usage(metric, completion, messages, model)
+        content = completion.content
+
+    if use_cache and content:
+        cache.set(key, content)
+    return content
+
+async def achat_completion(client, ai_service_provider, model, messages, use_cache=None, budget_text=None, component=None, **options):
+    """Async variant of chat_completion, for callers running their own event loop."""
+    messages = _fit_to_context(client, model, messages, budget_text, component, options)
+    use_cache = _use_cache(use_cache)
+    cache = get_llm_cache()
+    key = completion_key(ai_service_provider, model, messages, **options)
+    with _track_llm(ai_service_provider, model, component, "achat_completion") as metric:
+        if use_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                metric.cached = True
+                return cached
+
+        completion = await acall_with_rate_limit(ai_service_provider, model, messages, options.get("max_tokens"),
+                                                 lambda: client.acomplete(messages, model=model, **options))
+        _record_usage(metric, completion, messages, model)
+        content = completion.content
+
+    if use_cache and content:
+        cache.set(key, content)
+    return content
+
+def stream_chat_completion(client, ai_service_provider, model, messages, use_cache=None, budget_text=None, component=None, **options):
+    """
+    Streaming variant of chat_completion: yields the completion text in chunks as it arrives.
+
+    A cached completion is yielded in one piece. A completion streamed to the end is stored in the
+    same cache entry a non-streaming call would use.
+    """
+    messages = _fit_to_context(client, model, messages, budget_text, component, options)
+    use_cache = _use_cache(use_cache)
+    cache = get_llm_cache()
+    key = completion_key(ai_service_provider, model, messages, **options)
+    with _track_llm(ai_service_provider, model, component, "stream_chat_completion") as metric:
+        if use_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                metric.cached = True
+                yield cached
+                return
+
+        parts = []
+        for token in stream_with_rate_limit(ai_service_provider, model, messages, options.get("max_tokens"),
+                                            lambda: client.stream(messages, model=model, **options)):
+            metric.mark_first_chunk()
+            parts.append(token)
+            yield token
+
+        content = "".join(parts)
+        # Streams report no usage, so the tokens are counted locally
+        metric.set_usage(count_message_tokens(messages, model), count_tokens(content, model), estimated=True)
+    if use_cache and content:
+        cache.set(key, content)
+
+def _parse_json_object(content):
+    """Parses the JSON object in a completion, tolerating code fences or text around it."""
+    text = (content or "").strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            raise
+        return json.loads(text[start:end + 1])
+
+def _is_bad_request(error):
+    """True for HTTP 400 errors from the OpenAI SDK or httpx (e.g. an unsupported response_format)."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 400
+
+def structured_completion(client, ai_service_provider, model, messages, schema, schema_name,
+                          use_cache=None, budget_text=None, component=None, **options):
+    """
+    Sends a chat completion that must answer with a JSON object matching `schema`, and returns it parsed.
+
+    Uses the provider's native structured output (OpenAI JSON schema, Azure JSON schema or JSON mode
+    depending on the API version, Mistral JSON mode); the schema is also described in the prompt so
+    providers without native support answer in the same shape. If the provider rejects the
+    `response_format` option, the request is retried without it. Only completions that parse are
+    cached; an unparseable answer is asked for again once before giving up.
+
+    Args:
+        client (LLMProvider): A provider returned by get_provider.
+        ai_service_provider (str): "OpenAI", "Azure OpenAI" or "MistralAI".
+        model (str): Model name, or deployment name for Azure OpenAI.
+        messages (list[dict]): Messages as {"role": ..., "content": ...} dicts.
+        schema (dict): JSON schema of the answer (see ti_schemas).
+        schema_name (str): Name of the schema, as OpenAI requires one.
+        use_cache, budget_text, component, **options: As for chat_completion.
+
+    Returns:
+        dict: The parsed JSON object.
+
+    Raises:
+        ValueError: If the model did not return valid JSON twice in a row.
+    """
+    messages = list(messages) + [{"role": "system", "content": schema_instructions(schema)}]
+    messages = _fit_to_context(client, model, messages, budget_text, component, options)
+    response_format = client.response_format(schema_name, schema)
+    if response_format:
+        options = dict(options, response_format=response_format)
+
+    use_cache = _use_cache(use_cache)
+    cache = get_llm_cache()
+    key = completion_key(ai_service_provider, model, messages, **options)
+    with _track_llm(ai_service_provider, model, component, schema_name) as metric:
+        if use_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                try:
+                    result = _parse_json_object(cached)
+                    metric.cached = True
+                    return result
+                except json.JSONDecodeError:
+                    pass # Written by an older version; ask again
+
+        def send(request_messages, request_options):
+            completion = call_with_rate_limit(ai_service_provider, model, request_messages, request_options.get("max_tokens"),
+                                              lambda: client.complete(request_messages, model=model, **request_options))
+            _record_usage(metric, completion, request_messages, model)
+            return completion.content
+
+        try:
+            content = send(messages, options)
+        except Exception as e:
+            if "response_format" not in options or not _is_bad_request(e):
+                raise
+            options = {name: value for name, value in options.items() if name != "response_format"}
+            metric.details["response_format_fallback"] = True
+            content = send(messages, options)
+
+        try:
+            result = _parse_json_object(content)
+        except json.JSONDecodeError:
+            retry_messages = messages + [
+                {"role": "assistant", "content": content or ""},
+                {"role": "user", "content": "That was not a valid JSON object. Answer again with only the JSON object."},
+            ]
+            metric.details["invalid_json_retry"] = True
+            content = send(retry_messages, options)
+            try:
+                result = _parse_json_object(content)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"The model did not return valid JSON for {schema_name}: {e}") from e
+
+    if use_cache:
+        cache.set(key, content)
+    return result
+
+def stream_or_error(tokens, error_prefix):
+    """
+    Yields from a token stream; if it fails, yields a final "<error_prefix>: <error>" message,
+    mirroring the error strings the non-streaming generation functions return.
+    """
+    try:
+        yield from tokens
+    except Exception as e:
+        yield f"{error_prefix}: {e}"
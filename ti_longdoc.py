@@ -0,0 +1,148 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from langsmith import traceable
+from ti_llm import chat_completion
+from ti_ai import get_model_name
+from ti_events import submit_in_context
+import ti_tokens
+import ti_pdftext
+
+# --- Constants ---
+DEFAULT_LONG_DOCUMENT_THRESHOLD = 30000 # Input tokens above which summary and mindmap use map-reduce
+DEFAULT_SECTION_TOKENS = 6000           # Target size of one section sent to the map step
+SECTION_NOTES_MAX_TOKENS = 900          # Completion budget for the notes of one section
+MAX_REDUCE_LEVELS = 3                   # Safety stop when notes have to be condensed repeatedly
+
+SECTION_NOTES_SYSTEM_PROMPT = (
+    "You are a Threat Analyst reading one section ({index} of {total}) of a long threat intelligence report. "
+    "Write dense notes on this section only, in English. Keep every concrete detail an analyst needs later: "
+    "threat actors, malware and tool names, victims and sectors, dates, CVEs, indicators of compromise, "
+    "MITRE ATT&CK techniques and the sequence of the attack. Do not add an introduction or a conclusion. "
+    "If the section has no threat intelligence content (e.g. table of contents, legal notice), answer 'No relevant content.'"
+)
+REDUCED_INPUT_HEADER = (
+    "The text below is a set of section-by-section notes covering a complete long threat report "
+    "({total} sections, in reading order). Treat it as one report.\n\n"
+)
+
+# --- Sectioning ---
+
+_BLOCK_SPLIT = re.compile(r"\n\s*\n|\n(?=#{1,6} )") # Blank lines and Markdown headings
+
+def split_into_sections(text, model=None, max_section_tokens=DEFAULT_SECTION_TOKENS):
+    """
+    Splits text into consecutive sections of at most `max_section_tokens` tokens.
+
+    Paragraphs (and Markdown headings) are kept together when possible; a paragraph larger than a
+    section is cut by tokens. No text is dropped.
+    """
+    sections, current, current_tokens = [], [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            sections.append("\n\n".join(current))
+        current, current_tokens = [], 0
+
+    for block in _BLOCK_SPLIT.split(text or ""):
+        block = block.strip()
+        if not block:
+            continue
+        block_tokens = ti_tokens.count_tokens(block, model)
+        if block_tokens > max_section_tokens:
+            flush()
+            while block:
+                head = ti_tokens.truncate_to_tokens(block, max_section_tokens, model)
+                if not head:
+                    head = block[:1] # Guarantees progress with a pathological tokenizer fallback
+                sections.append(head)
+                block = block[len(head):].strip()
+            continue
+        if current_tokens + block_tokens > max_section_tokens:
+            flush()
+        current.append(block)
+        current_tokens += block_tokens
+    flush()
+    return sections
+
+def is_long_document(text, model=None, threshold_tokens=DEFAULT_LONG_DOCUMENT_THRESHOLD, context_window=None):
+    """True if the text should go through map-reduce: above the threshold or beyond the model's (or `context_window`'s) context window."""
+    tokens = ti_tokens.count_tokens(text, model)
+    fits_context = tokens + ti_tokens.DEFAULT_OUTPUT_RESERVE < ti_tokens.context_limit(model, context_window)
+    return tokens > threshold_tokens or not fits_context
+
+# --- Map-Reduce ---
+
+@traceable
+def ai_section_notes(section, index, total, client, ai_service_provider, deployment_name=None):
+    """Map step: condenses one section of a long report into analyst notes."""
+    model_to_use = get_model_name(ai_service_provider, deployment_name)
+    messages = [
+        {"role": "system", "content": SECTION_NOTES_SYSTEM_PROMPT.format(index=index, total=total)},
+        {"role": "user", "content": section},
+    ]
+    return chat_completion(client, ai_service_provider, model_to_use, messages, max_tokens=SECTION_NOTES_MAX_TOKENS,
+                           budget_text=section, component="long_document_sections")
+
+def section_pages(text, sections, page_offsets):
+    """Page range (first, last) of each section of `text`, from the page start offsets of a PDF text."""
+    ranges, cursor = [], 0
+    for section in sections:
+        start = text.find(section.split("\n\n", 1)[0][:200], cursor) # The first paragraph is verbatim in the text
+        if start < 0:
+            start = cursor
+        end = start + len(section)
+        ranges.append((ti_pdftext.page_at(page_offsets, start), ti_pdftext.page_at(page_offsets, max(start, end - 1))))
+        cursor = start + 1
+    return ranges
+
+def _section_heading(index, pages):
+    if not pages:
+        return f"## Section {index}"
+    first, last = pages
+    return f"## Section {index} (page {first})" if first == last else f"## Section {index} (pages {first}-{last})"
+
+def condense_long_document(text, client, ai_service_provider, deployment_name=None,
+                           threshold_tokens=DEFAULT_LONG_DOCUMENT_THRESHOLD, max_concurrency=4, page_offsets=None):
+    """
+    Reduces a long document to section notes that fit in one prompt.
+
+    Sections are summarized in parallel (up to `max_concurrency` requests at once). If the joined
+    notes are still above the threshold, they are sectioned and condensed again.
+
+    Args:
+        text (str): The full document text.
+        client (LLMProvider): A provider returned by ti_llm.get_provider.
+        ai_service_provider (str): "OpenAI", "Azure OpenAI" or "MistralAI".
+        deployment_name (str, optional): Azure deployment or Mistral model name.
+        threshold_tokens (int): Size the joined notes must fit under.
+        max_concurrency (int): Maximum parallel section requests.
+        page_offsets (list[int], optional): Page start offsets of a PDF text (see ti_pdftext); the
+            notes of each section are then headed with its pages, so they can be cited.
+
+    Returns:
+        str: The joined notes, prefixed with a header telling the model they cover the whole report.
+    """
+    model = get_model_name(ai_service_provider, deployment_name)
+    section_tokens = min(DEFAULT_SECTION_TOKENS, ti_tokens.context_limit(model, getattr(client, "context_window", None)) // 2)
+    notes = text
+    total = 0
+    for _ in range(MAX_REDUCE_LEVELS):
+        sections = split_into_sections(notes, model, section_tokens)
+        total = len(sections)
+        pages = section_pages(text, sections, page_offsets) if page_offsets and notes is text else [None] * total
+        def run(indexed_section):
+            index, section = indexed_section
+            return ai_section_notes(section, index, total, client, ai_service_provider, deployment_name)
+        with ThreadPoolExecutor(max_workers=max(1, int(max_concurrency or 1)), thread_name_prefix="ti-section") as executor:
+            # Submitted in the caller's context, so section calls land in the caller's metrics run and event sink
+            futures = [submit_in_context(executor, run, indexed) for indexed in enumerate(sections, start=1)]
+            results = [future.result() for future in futures]
+        notes = "\n\n".join(
+            f"{_section_heading(index, pages[index - 1])}\n{result.strip()}"
+            for index, result in enumerate(results, start=1)
+            if result and result.strip() != "No relevant content."
+        )
+        if ti_tokens.count_tokens(notes, model) <= threshold_tokens:
+            break
+    return REDUCED_INPUT_HEADER.format(total=total) + notes
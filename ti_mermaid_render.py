@@ -0,0 +1,393 @@
+import re
+from reportlab.graphics.shapes import Drawing, Group, Rect, Ellipse, Line, Path, PolyLine, String
+from reportlab.lib.colors import HexColor, white
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+# In-process renderer for the Mermaid subset this project generates: `mindmap` (indented nodes,
+# `()` / `[]` / `(())` shapes) and `timeline` (title, sections, periods and events). Diagrams are
+# laid out here and drawn as reportlab vector graphics, so the PDF export needs no round trip to
+# mermaid.ink, works offline, and embeds crisp diagrams instead of bitmaps. Anything else (other
+# diagram types, text the PDF base fonts cannot show) raises MermaidRenderError, and the caller
+# can fall back to mermaid.ink.
+
+try:
+    from reportlab.graphics import renderPM
+    RENDER_PM_AVAILABLE = True
+except ImportError:
+    RENDER_PM_AVAILABLE = False
+
+# --- Constants ---
+FONT = "Helvetica"
+BOLD_FONT = "Helvetica-Bold"
+FONT_SIZE = 9
+ROOT_FONT_SIZE = 12
+TITLE_FONT_SIZE = 14
+LINE_HEIGHT = 1.25             # Times the font size
+MAX_NODE_TEXT_WIDTH = 150      # Mindmap node labels wrap beyond this width (points)
+NODE_PADDING = (8, 5)          # Horizontal, vertical padding inside a node
+LEVEL_GAP = 36                 # Horizontal space between mindmap levels
+SIBLING_GAP = 8                # Vertical space between sibling subtrees
+MARGIN = 16
+TIMELINE_COLUMN_WIDTH = 120
+TIMELINE_COLUMN_GAP = 14
+TIMELINE_MAX_COLUMNS = 6       # Periods per row; longer timelines wrap onto further rows
+TIMELINE_EVENT_GAP = 6
+TIMELINE_ROW_GAP = 24
+
+# Branch colors (fill, stroke), in the order of the first-level branches
+PALETTE = [
+    ("#cfe2ff", "#3d6db5"), ("#d1f2d9", "#2e8b57"), ("#ffe5c2", "#d2801f"), ("#f8d0d8", "#c0395a"),
+    ("#e2d6f7", "#6f4bb3"), ("#cdeff2", "#1f8a99"), ("#fff2b3", "#b38f00"), ("#e0e0e0", "#5f6b7a"),
+]
+ROOT_FILL = HexColor("#1f3a5f")
+TEXT_COLOR = HexColor("#1b1b1b")
+LINE_COLOR = HexColor("#8a94a6")
+
+DIRECTIVE_PATTERN = re.compile(r"%%\{.*?\}%%", re.DOTALL) # Init directives, e.g. the theme added by the app
+NODE_PATTERN = re.compile(r"^(?P<id>[^()\[\]{}\s]*)\s*(?P<open>\(\(|\)\)|\{\{|\(|\)|\[)(?P<text>.*?)(?P<close>\)\)|\(\(|\}\}|\)|\(|\])$")
+KEYWORD_PATTERN = re.compile(r"^(title|section)(?:\s*:\s*|\s+)(.*)$") # `title X` or `title: X` (what ti_ai asks for)
+SHAPES = {"((": "circle", "[": "square", "(": "rounded", "))": "rounded", ")": "rounded", "{{": "rounded"}
+
+class MermaidRenderError(ValueError):
+    """The diagram is outside the subset this renderer supports."""
+
+class MindmapNode:
+    def __init__(self, text, shape="rounded", depth=0):
+        self.text = text
+        self.shape = shape
+        self.depth = depth
+        self.children = []
+        # Layout (top-down coordinates, set by _layout_mindmap)
+        self.lines, self.width, self.height, self.subtree_height = [], 0.0, 0.0, 0.0
+        self.x, self.y, self.side, self.color = 0.0, 0.0, 1, 0
+
+    def __repr__(self):
+        return f"MindmapNode({self.text!r}, {len(self.children)} children)"
+
+class Timeline:
+    def __init__(self, title=None):
+        self.title = title
+        self.sections = [] # [(section name or None, [(period, [events])])]
+
+    def periods(self):
+        return [(index, period, events) for index, (_, periods) in enumerate(self.sections) for period, events in periods]
+
+# --- Parsing ---
+
+def _clean_lines(code):
+    code = DIRECTIVE_PATTERN.sub("", code or "")
+    lines = []
+    for line in code.replace("\t", "    ").splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("%%") or stripped.startswith("```") or stripped.lower() == "mermaid":
+            continue
+        lines.append(line.rstrip())
+    return lines
+
+def diagram_type(code):
+    """The Mermaid diagram type ("mindmap", "timeline", "flowchart", ...), or None for empty code."""
+    lines = _clean_lines(code)
+    return lines[0].split()[0].lower() if lines else None
+
+def _check_text(text):
+    try:
+        text.encode("cp1252") # What the standard PDF fonts can show
+    except UnicodeEncodeError:
+        raise MermaidRenderError("the diagram text has characters the built-in PDF fonts cannot show")
+    return text
+
+def _node_label(text):
+    text = re.sub(r":::\S+\s*$", "", text).strip() # CSS class suffix
+    match = NODE_PATTERN.match(text)
+    if match is None:
+        return text.strip('"').strip("`").strip() or text, "rounded"
+    label = match.group("text").strip().strip('"').strip("`").strip()
+    return label or match.group("id"), SHAPES.get(match.group("open"), "rounded")
+
+def parse_mindmap(code):
+    """Parses a Mermaid mindmap into a tree of MindmapNode (the root is returned)."""
+    lines = _clean_lines(code)
+    if not lines or lines[0].strip().lower() != "mindmap":
+        raise MermaidRenderError("not a Mermaid mindmap")
+    root, stack = None, [] # stack: [(indent, node)]
+    for line in lines[1:]:
+        stripped = line.strip()
+        if stripped.startswith("::icon("):
+            continue
+        indent = len(line) - len(line.lstrip(" "))
+        text, shape = _node_label(stripped)
+        _check_text(text)
+        if root is None:
+            root = MindmapNode(text, shape, 0)
+            stack = [(indent, root)]
+            continue
+        while len(stack) > 1 and stack[-1][0] >= indent:
+            stack.pop()
+        parent = stack[-1][1]
+        node = MindmapNode(text, shape, parent.depth + 1)
+        parent.children.append(node)
+        stack.append((indent, node))
+    if root is None:
+        raise MermaidRenderError("the mindmap has no nodes")
+    return root
+
+def parse_timeline(code):
+    """Parses a Mermaid timeline (`period : event : event`, events on `: event` continuation lines too)."""
+    lines = _clean_lines(code)
+    if not lines or lines[0].strip().lower() != "timeline":
+        raise MermaidRenderError("not a Mermaid timeline")
+    timeline = Timeline()
+    current = None # Periods list of the current section
+    for line in lines[1:]:
+        stripped = _check_text(line.strip())
+        keyword = KEYWORD_PATTERN.match(stripped)
+        if keyword and keyword.group(1) == "title":
+            timeline.title = keyword.group(2).strip()
+            continue
+        if keyword and keyword.group(1) == "section":
+            timeline.sections.append((keyword.group(2).strip(), []))
+            current = timeline.sections[-1][1]
+            continue
+        if current is None:
+            timeline.sections.append((None, []))
+            current = timeline.sections[-1][1]
+        parts = [part.strip() for part in stripped.split(":")]
+        if stripped.startswith(":") and current:
+            current[-1][1].extend(part for part in parts[1:] if part)
+        elif parts[0]:
+            current.append((parts[0], [part for part in parts[1:] if part]))
+    if not any(periods for _, periods in timeline.sections):
+        raise MermaidRenderError("the timeline has no periods")
+    return timeline
+
+# --- Drawing Helpers ---
+
+def _wrap(text, font, size, max_width):
+    return simpleSplit(text, font, size, max_width) or [""]
+
+def _text_block(lines, center_x, top_y, font, size, color):
+    """Centered lines of text, the first baseline just below `top_y` (drawing coordinates, y up)."""
+    group = Group()
+    for index, line in enumerate(lines):
+        baseline = top_y - size - index * size * LINE_HEIGHT + size * 0.2
+        group.add(String(center_x, baseline, line, fontName=font, fontSize=size, fillColor=color, textAnchor="middle"))
+    return group
+
+def _box(x, y, width, height, shape, fill, stroke, stroke_width=1):
+    """Node outline with its bottom-left corner at (x, y)."""
+    if shape == "circle":
+        return Ellipse(x + width / 2, y + height / 2, width / 2 + 4, height / 2 + 2,
+                       fillColor=fill, strokeColor=stroke, strokeWidth=stroke_width)
+    radius = 0 if shape == "square" else min(8, height / 2)
+    return Rect(x, y, width, height, rx=radius, ry=radius, fillColor=fill, strokeColor=stroke, strokeWidth=stroke_width)
+
+def _curve(x1, y1, x2, y2, color, width):
+    path = Path(strokeColor=color, strokeWidth=width, fillColor=None)
+    middle = (x1 + x2) / 2
+    path.moveTo(x1, y1)
+    path.curveTo(middle, y1, middle, y2, x2, y2)
+    return path
+
+# --- Mindmap Layout ---
+
+def _measure(node):
+    font, size = (BOLD_FONT, ROOT_FONT_SIZE) if node.depth == 0 else (FONT, FONT_SIZE)
+    node.lines = _wrap(node.text, font, size, MAX_NODE_TEXT_WIDTH + (30 if node.depth == 0 else 0))
+    node.width = max(stringWidth(line, font, size) for line in node.lines) + 2 * NODE_PADDING[0]
+    node.height = len(node.lines) * size * LINE_HEIGHT + 2 * NODE_PADDING[1]
+    for child in node.children:
+        _measure(child)
+    block = sum(child.subtree_height for child in node.children) + SIBLING_GAP * max(0, len(node.children) - 1)
+    node.subtree_height = max(node.height, block)
+
+def _column_offsets(nodes, depth_widths, depth=1):
+    for node in nodes:
+        depth_widths[depth] = max(depth_widths.get(depth, 0), node.width)
+        _column_offsets(node.children, depth_widths, depth + 1)
+
+def _place(node, top, side, columns, color):
+    """Places a subtree whose block starts at `top` (y grows downwards); x is the node's inner edge."""
+    node.side, node.color = side, color
+    node.y = top + node.subtree_height / 2
+    node.x = side * columns[node.depth]
+    block = sum(child.subtree_height for child in node.children) + SIBLING_GAP * max(0, len(node.children) - 1)
+    child_top = top + (node.subtree_height - block) / 2
+    for child in node.children:
+        _place(child, child_top, side, columns, color)
+        child_top += child.subtree_height + SIBLING_GAP
+
+def _layout_mindmap(root):
+    """Splits the first-level branches between the right and left sides (balanced by height) and places every node."""
+    _measure(root)
+    sides = {1: [], -1: []}
+    heights = {1: 0.0, -1: 0.0}
+    for branch in root.children:
+        side = 1 if heights[1] <= heights[-1] else -1
+        sides[side].append(branch)
+        heights[side] += branch.subtree_height + SIBLING_GAP
+    color_index = 0
+    for side, branches in sides.items():
+        widths = {}
+        _column_offsets(branches, widths)
+        columns = {0: 0.0, 1: root.width / 2 + LEVEL_GAP}
+        for depth in range(2, max(widths, default=1) + 1):
+            columns[depth] = columns[depth - 1] + widths[depth - 1] + LEVEL_GAP
+        top = -(heights[side] - SIBLING_GAP) / 2
+        for branch in branches:
+            _place(branch, top, side, columns, color_index)
+            top += branch.subtree_height + SIBLING_GAP
+            color_index += 1
+    root.x, root.y = 0.0, 0.0
+
+def _walk(node):
+    yield node
+    for child in node.children:
+        yield from _walk(child)
+
+def _left(node):
+    return node.x - node.width / 2 if node.depth == 0 else (node.x if node.side > 0 else node.x - node.width)
+
+def draw_mindmap(root):
+    """Lays out and draws a parsed mindmap."""
+    _layout_mindmap(root)
+    nodes = list(_walk(root))
+    min_x = min(_left(node) for node in nodes) - MARGIN
+    max_x = max(_left(node) + node.width for node in nodes) + MARGIN
+    min_y = min(node.y - node.height / 2 for node in nodes) - MARGIN
+    max_y = max(node.y + node.height / 2 for node in nodes) + MARGIN
+    width, height = max_x - min_x, max_y - min_y
+    drawing = Drawing(width, height)
+    to_x = lambda x: x - min_x
+    to_y = lambda y: max_y - y # Top-down layout to reportlab's bottom-up coordinates
+
+    for node in nodes: # Edges first, under the nodes
+        for child in node.children:
+            stroke = HexColor(PALETTE[child.color % len(PALETTE)][1])
+            parent_edge = _left(node) + (node.width if child.side > 0 else 0)
+            child_edge = _left(child) + (0 if child.side > 0 else child.width)
+            drawing.add(_curve(to_x(parent_edge), to_y(node.y), to_x(child_edge), to_y(child.y), stroke, max(0.8, 3 - child.depth * 0.7)))
+    for node in nodes:
+        x, y = to_x(_left(node)), to_y(node.y + node.height / 2)
+        if node.depth == 0:
+            drawing.add(_box(x, y, node.width, node.height, node.shape, ROOT_FILL, ROOT_FILL))
+            drawing.add(_text_block(node.lines, x + node.width / 2, y + node.height - NODE_PADDING[1], BOLD_FONT, ROOT_FONT_SIZE, white))
+            continue
+        fill, stroke = (HexColor(value) for value in PALETTE[node.color % len(PALETTE)])
+        drawing.add(_box(x, y, node.width, node.height, node.shape, fill if node.depth == 1 else white, stroke,
+                         1.4 if node.depth == 1 else 0.8))
+        drawing.add(_text_block(node.lines, x + node.width / 2, y + node.height - NODE_PADDING[1], FONT, FONT_SIZE, TEXT_COLOR))
+    return drawing
+
+# --- Timeline Layout ---
+
+def draw_timeline(timeline):
+    """Lays out and draws a parsed timeline: periods in columns (wrapping into rows), events below each period."""
+    periods = timeline.periods()
+    named_sections = any(name for name, _ in timeline.sections)
+    inner = TIMELINE_COLUMN_WIDTH - 2 * NODE_PADDING[0]
+    line_height = FONT_SIZE * LINE_HEIGHT
+    columns = min(TIMELINE_MAX_COLUMNS, len(periods))
+    width = columns * TIMELINE_COLUMN_WIDTH + (columns - 1) * TIMELINE_COLUMN_GAP + 2 * MARGIN
+
+    title_lines = _wrap(timeline.title, BOLD_FONT, TITLE_FONT_SIZE, width - 2 * MARGIN) if timeline.title else []
+    elements, y = [], MARGIN # (kind, payload) in top-down coordinates, drawn once the height is known
+    if title_lines:
+        elements.append(("title", (title_lines, y)))
+        y += len(title_lines) * TITLE_FONT_SIZE * LINE_HEIGHT + 10
+
+    for row_start in range(0, len(periods), columns):
+        row = periods[row_start:row_start + columns]
+        if named_sections:
+            y += line_height + 6 # Section labels above the periods
+        period_lines = [_wrap(period, BOLD_FONT, FONT_SIZE, inner) for _, period, _ in row]
+        period_height = max(len(lines) for lines in period_lines) * line_height + 2 * NODE_PADDING[1]
+        event_lines = [[_wrap(event, FONT, FONT_SIZE, inner) for event in events] for _, _, events in row]
+        events_height = max((sum(len(lines) * line_height + 2 * NODE_PADDING[1] + TIMELINE_EVENT_GAP for lines in column)
+                             for column in event_lines), default=0)
+        elements.append(("row", (row_start, row, period_lines, period_height, event_lines, y)))
+        y += period_height + 14 + events_height + TIMELINE_ROW_GAP
+    height = y - TIMELINE_ROW_GAP + MARGIN
+
+    drawing = Drawing(width, height)
+    to_y = lambda top: height - top
+    for kind, payload in elements:
+        if kind == "title":
+            lines, top = payload
+            drawing.add(_text_block(lines, width / 2, to_y(top), BOLD_FONT, TITLE_FONT_SIZE, TEXT_COLOR))
+            continue
+        row_start, row, period_lines, period_height, event_lines, top = payload
+        column_x = [MARGIN + index * (TIMELINE_COLUMN_WIDTH + TIMELINE_COLUMN_GAP) for index in range(len(row))]
+        if named_sections:
+            # One label per run of periods of the same section in this row
+            start = 0
+            for index in range(1, len(row) + 1):
+                if index == len(row) or row[index][0] != row[start][0]:
+                    name = timeline.sections[row[start][0]][0]
+                    if name:
+                        stroke = HexColor(PALETTE[row[start][0] % len(PALETTE)][1])
+                        left, right = column_x[start], column_x[index - 1] + TIMELINE_COLUMN_WIDTH
+                        drawing.add(Line(left, to_y(top - 3), right, to_y(top - 3), strokeColor=stroke, strokeWidth=1.5))
+                        drawing.add(String((left + right) / 2, to_y(top - 3) + 4, simpleSplit(name, BOLD_FONT, FONT_SIZE, right - left)[0],
+                                           fontName=BOLD_FONT, fontSize=FONT_SIZE, fillColor=stroke, textAnchor="middle"))
+                    start = index
+        axis_y = to_y(top + period_height / 2)
+        axis_end = column_x[-1] + TIMELINE_COLUMN_WIDTH + TIMELINE_COLUMN_GAP / 2
+        drawing.add(Line(MARGIN - 6, axis_y, axis_end, axis_y, strokeColor=LINE_COLOR, strokeWidth=1.5))
+        drawing.add(PolyLine([axis_end - 6, axis_y + 4, axis_end, axis_y, axis_end - 6, axis_y - 4], strokeColor=LINE_COLOR, strokeWidth=1.5))
+        for index, (section_index, _, _) in enumerate(row):
+            color_index = section_index if named_sections else row_start + index
+            fill, stroke = (HexColor(value) for value in PALETTE[color_index % len(PALETTE)])
+            x = column_x[index]
+            drawing.add(_box(x, to_y(top + period_height), TIMELINE_COLUMN_WIDTH, period_height, "rounded", fill, stroke, 1.4))
+            drawing.add(_text_block(period_lines[index], x + TIMELINE_COLUMN_WIDTH / 2, to_y(top + NODE_PADDING[1]), BOLD_FONT, FONT_SIZE, TEXT_COLOR))
+            event_top = top + period_height + 14
+            if event_lines[index]:
+                last = event_top + sum(len(lines) * line_height + 2 * NODE_PADDING[1] + TIMELINE_EVENT_GAP for lines in event_lines[index]) - TIMELINE_EVENT_GAP
+                drawing.add(Line(x + TIMELINE_COLUMN_WIDTH / 2, to_y(top + period_height), x + TIMELINE_COLUMN_WIDTH / 2, to_y(last),
+                                 strokeColor=stroke, strokeWidth=0.8, strokeDashArray=[2, 2]))
+            for lines in event_lines[index]:
+                event_height = len(lines) * line_height + 2 * NODE_PADDING[1]
+                drawing.add(_box(x, to_y(event_top + event_height), TIMELINE_COLUMN_WIDTH, event_height, "rounded", white, stroke, 0.8))
+                drawing.add(_text_block(lines, x + TIMELINE_COLUMN_WIDTH / 2, to_y(event_top + NODE_PADDING[1]), FONT, FONT_SIZE, TEXT_COLOR))
+                event_top += event_height + TIMELINE_EVENT_GAP
+    return drawing
+
+# --- Entry Points ---
+
+def render_drawing(code):
+    """
+    Renders Mermaid mindmap or timeline code as a reportlab Drawing (a vector flowable for PDFs).
+
+    Raises:
+        MermaidRenderError: For other diagram types, malformed code or unsupported characters.
+    """
+    kind = diagram_type(code)
+    if kind == "mindmap":
+        return draw_mindmap(parse_mindmap(code))
+    if kind == "timeline":
+        return draw_timeline(parse_timeline(code))
+    raise MermaidRenderError(f"'{kind}' diagrams are not supported by the local renderer" if kind else "the diagram is empty")
+
+def can_render(code):
+    try:
+        kind = diagram_type(code)
+        (parse_mindmap if kind == "mindmap" else parse_timeline)(code)
+        return kind in ("mindmap", "timeline")
+    except MermaidRenderError:
+        return False
+
+def render_svg(code):
+    """Renders Mermaid mindmap or timeline code as an SVG document (str)."""
+    from reportlab.graphics import renderSVG
+    return renderSVG.drawToString(render_drawing(code))
+
+def render_png(code, dpi=144):
+    """Renders Mermaid mindmap or timeline code as PNG bytes (needs a reportlab renderPM backend, e.g. rlPyCairo)."""
+    drawing = render_drawing(code)
+    if not RENDER_PM_AVAILABLE:
+        raise MermaidRenderError("PNG output needs reportlab's renderPM backend (pip install rlPyCairo)")
+    try:
+        return renderPM.drawToString(drawing, fmt="PNG", dpi=dpi)
+    except renderPM.RenderPMError as e:
+        raise MermaidRenderError(f"PNG output needs reportlab's renderPM backend (pip install rlPyCairo): {e}") from e
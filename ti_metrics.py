@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Latency, token and cost instrumentation. Every outbound call (LLM, embedding, scrape, mermaid.ink,
+# GitHub) and every report component is recorded as a CallMetric. Records go to the active
+# MetricsRun (one analysis: the app starts one per analyzed source, ti_batch one per source) and to
+# process-wide aggregates that can be exported in the Prometheus text format.
+
+# --- Constants ---
+KIND_LLM = "llm"
+KIND_EMBEDDING = "embedding"
+KIND_SCRAPE = "scrape"
+KIND_MERMAID = "mermaid_ink"
+KIND_MERMAID_LOCAL = "mermaid_local" # Diagrams drawn in-process by ti_mermaid_render
+KIND_GITHUB = "github"
+KIND_COMPONENT = "component" # Wall time of a report component; the calls it makes are recorded separately
+
+# List prices in USD per 1M tokens: (input, output). Azure deployments are named by the user, so
+# they are priced only when set_model_price is called with the deployment name.
+MODEL_PRICES_PER_MILLION = {
+    "gpt-4o-2024-08-06": (2.50, 10.00),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "mistral-large-latest": (2.00, 6.00),
+    "text-embedding-ada-002": (0.10, 0.0),
+    "mistral-embed": (0.10, 0.0),
+}
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0) # Prometheus histogram buckets, seconds
+METRICS_JSONL_PATH = os.environ.get("TI_METRICS_JSONL") # If set, every record is appended to this file as it completes
+METRIC_PREFIX = "ti_mindmap"
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+def set_model_price(model, input_per_million, output_per_million):
+    """Sets the price used for cost estimates of a model or Azure deployment."""
+    MODEL_PRICES_PER_MILLION[model] = (float(input_per_million), float(output_per_million))
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Cost in USD, or None if the model has no known price."""
+    price = MODEL_PRICES_PER_MILLION.get(model)
+    if price is None or prompt_tokens is None:
+        return None
+    return (prompt_tokens * price[0] + (completion_tokens or 0) * price[1]) / 1_000_000
+
+# --- Records ---
+
+class CallMetric:
+    """
+    One instrumented call.
+
+    `wall_seconds` is the full duration, including `queue_seconds` spent waiting for the rate limiter
+    or a politeness delay. For streams, `first_chunk_seconds` is the time to the first chunk.
+    Token counts come from the provider's usage report; `tokens_estimated` is True when they were
+    counted locally (streams, embeddings).
+    """
+    def __init__(self, kind, name, provider=None, model=None, details=None):
+        self.kind = kind
+        self.name = name or kind
+        self.provider = provider
+        self.model = model
+        self.details = details or {}
+        self.started_at = time.time()
+        self.wall_seconds = 0.0
+        self.queue_seconds = 0.0
+        self.first_chunk_seconds = None
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.tokens_estimated = False
+        self.cached = False
+        self.retries = 0
+        self.status = STATUS_OK
+        self.error = None
+        self._started = time.perf_counter()
+
+    def set_usage(self, prompt_tokens, completion_tokens, estimated=False):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.tokens_estimated = estimated
+
+    def mark_first_chunk(self):
+        if self.first_chunk_seconds is None:
+            self.first_chunk_seconds = time.perf_counter() - self._started
+
+    @property
+    def cost_usd(self):
+        if self.cached:
+            return 0.0
+        return estimate_cost(self.model, self.prompt_tokens, self.completion_tokens)
+
+    @classmethod
+    def from_dict(cls, data):
+        metric = cls(data["kind"], data["name"], data.get("provider"), data.get("model"), data.get("details"))
+        for name in ("started_at", "wall_seconds", "queue_seconds", "first_chunk_seconds", "prompt_tokens", "completion_tokens",
+                     "tokens_estimated", "cached", "retries", "status", "error"):
+            if name in data:
+                setattr(metric, name, data[name])
+        return metric
+
+    def to_dict(self):
+        return {
+            "kind": self.kind, "name": self.name, "provider": self.provider, "model": self.model,
+            "started_at": self.started_at, "wall_seconds": round(self.wall_seconds, 4), "queue_seconds": round(self.queue_seconds, 4),
+            "first_chunk_seconds": None if self.first_chunk_seconds is None else round(self.first_chunk_seconds, 4),
+            "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens, "tokens_estimated": self.tokens_estimated,
+            "cached": self.cached, "retries": self.retries, "cost_usd": self.cost_usd,
+            "status": self.status, "error": self.error, "details": self.details,
+        }
+
+    def __repr__(self):
+        return f"CallMetric({self.kind!r}, {self.name!r}, {self.wall_seconds:.3f}s, status={self.status!r})"
+
+class MetricsRun:
+    """The records of one analysis run, with a per-(kind, name) rollup."""
+    def __init__(self, label=None):
+        self.label = label
+        self.started_at = time.time()
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, metric):
+        with self._lock:
+            self.records.append(metric)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.records)
+
+    def summary(self):
+        """One row per (kind, name), slowest total first."""
+        rows = {}
+        for metric in self.snapshot():
+            row = rows.setdefault((metric.kind, metric.name), {
+                "kind": metric.kind, "name": metric.name, "calls": 0, "errors": 0, "cache_hits": 0, "retries": 0,
+                "wall_seconds": 0.0, "max_seconds": 0.0, "queue_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+            })
+            row["calls"] += 1
+            row["errors"] += metric.status != STATUS_OK
+            row["cache_hits"] += metric.cached
+            row["retries"] += metric.retries
+            row["wall_seconds"] += metric.wall_seconds
+            row["max_seconds"] = max(row["max_seconds"], metric.wall_seconds)
+            row["queue_seconds"] += metric.queue_seconds
+            row["prompt_tokens"] += metric.prompt_tokens or 0
+            row["completion_tokens"] += metric.completion_tokens or 0
+            row["cost_usd"] += metric.cost_usd or 0.0
+        return sorted(rows.values(), key=lambda row: row["wall_seconds"], reverse=True)
+
+    def totals(self):
+        """Totals over the outbound calls (component records are excluded, as they contain the calls)."""
+        calls = [m for m in self.snapshot() if m.kind != KIND_COMPONENT]
+        llm = [m for m in calls if m.kind in (KIND_LLM, KIND_EMBEDDING)]
+        return {
+            "calls": len(calls),
+            "llm_calls": len(llm),
+            "errors": sum(m.status != STATUS_OK for m in calls),
+            "cache_hits": sum(m.cached for m in llm),
+            "retries": sum(m.retries for m in calls),
+            "prompt_tokens": sum(m.prompt_tokens or 0 for m in llm),
+            "completion_tokens": sum(m.completion_tokens or 0 for m in llm),
+            "cost_usd": sum(m.cost_usd or 0.0 for m in llm),
+            "unpriced_calls": sum(m.cost_usd is None for m in llm if m.prompt_tokens is not None), # Used tokens, but the model has no known price
+            "call_seconds": sum(m.wall_seconds for m in calls),
+            "queue_seconds": sum(m.queue_seconds for m in calls),
+        }
+
+    def to_jsonl(self):
+        return "".join(json.dumps(dict(m.to_dict(), run=self.label), default=str) + "\n" for m in self.snapshot())
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return f"MetricsRun({self.label!r}, {len(self.records)} records)"
+
+# --- Process-wide Aggregates (Prometheus) ---
+
+class MetricsRegistry:
+    """Counters and duration histograms per (kind, name, provider, model, status), for the whole process."""
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, metric):
+        labels = (metric.kind, metric.name, metric.provider or "", metric.model or "", metric.status)
+        with self._lock:
+            series = self._series.setdefault(labels, {
+                "count": 0, "seconds": 0.0, "queue_seconds": 0.0, "buckets": [0] * len(DURATION_BUCKETS),
+                "prompt_tokens": 0, "completion_tokens": 0, "cache_hits": 0, "retries": 0, "cost_usd": 0.0,
+            })
+            series["count"] += 1
+            series["seconds"] += metric.wall_seconds
+            series["queue_seconds"] += metric.queue_seconds
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if metric.wall_seconds <= bound:
+                    series["buckets"][i] += 1
+            series["prompt_tokens"] += metric.prompt_tokens or 0
+            series["completion_tokens"] += metric.completion_tokens or 0
+            series["cache_hits"] += metric.cached
+            series["retries"] += metric.retries
+            series["cost_usd"] += metric.cost_usd or 0.0
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def to_prometheus(self):
+        """The aggregates in the Prometheus text exposition format."""
+        with self._lock:
+            series = {labels: dict(values, buckets=list(values["buckets"])) for labels, values in self._series.items()}
+
+        def label_text(labels, extra=""):
+            names = ("kind", "name", "provider", "model", "status")
+            text = ",".join(f'{n}="{_escape_label(v)}"' for n, v in zip(names, labels))
+            return "{" + text + (("," + extra) if extra else "") + "}"
+
+        p = METRIC_PREFIX
+        lines = [f"# HELP {p}_call_duration_seconds Duration of instrumented calls and components.",
+                 f"# TYPE {p}_call_duration_seconds histogram"]
+        for labels, values in series.items():
+            for bound, count in list(zip(DURATION_BUCKETS, values["buckets"])) + [("+Inf", values["count"])]:
+                le = 'le="%s"' % bound
+                lines.append(f"{p}_call_duration_seconds_bucket{label_text(labels, le)} {count}")
+            lines.append(f"{p}_call_duration_seconds_sum{label_text(labels)} {values['seconds']:.6f}")
+            lines.append(f"{p}_call_duration_seconds_count{label_text(labels)} {values['count']}")
+        counters = (
+            ("queue_seconds_total", "queue_seconds", "Seconds spent waiting for rate limits or politeness delays."),
+            ("prompt_tokens_total", "prompt_tokens", "Prompt (input) tokens."),
+            ("completion_tokens_total", "completion_tokens", "Completion (output) tokens."),
+            ("cache_hits_total", "cache_hits", "Calls answered from the LLM cache."),
+            ("retries_total", "retries", "Retried requests."),
+            ("cost_usd_total", "cost_usd", "Estimated cost in USD (list prices)."),
+        )
+        for suffix, key, help_text in counters:
+            lines += [f"# HELP {p}_{suffix} {help_text}", f"# TYPE {p}_{suffix} counter"]
+            lines += [f"{p}_{suffix}{label_text(labels)} {values[key]:g}" for labels, values in series.items()]
+        return "\n".join(lines) + "\n"
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+_registry = MetricsRegistry()
+_current_run = contextvars.ContextVar("ti_metrics_run", default=None)
+_current_call = contextvars.ContextVar("ti_metrics_call", default=None)
+_jsonl_lock = threading.Lock()
+
+def get_registry():
+    return _registry
+
+def to_prometheus():
+    return _registry.to_prometheus()
+
+# --- Recording ---
+
+def set_run(run):
+    """Makes `run` the active run in the current context (thread or task); returns a token for reset_run."""
+    return _current_run.set(run)
+
+def reset_run(token):
+    _current_run.reset(token)
+
+def get_run():
+    return _current_run.get()
+
+@contextmanager
+def collect(label=None):
+    """Records the calls made inside the `with` block (in this context) into a new MetricsRun."""
+    run = MetricsRun(label)
+    token = set_run(run)
+    try:
+        yield run
+    finally:
+        reset_run(token)
+
+def _finish(metric):
+    run = _current_run.get()
+    if run is not None:
+        run.add(metric)
+    _registry.observe(metric)
+    if METRICS_JSONL_PATH:
+        line = json.dumps(dict(metric.to_dict(), run=run.label if run else None), default=str) + "\n"
+        with _jsonl_lock, open(METRICS_JSONL_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+
+@contextmanager
+def track(kind, name=None, provider=None, model=None, **details):
+    """
+    Times the `with` block as one call and records it. Yields the CallMetric so the caller can add
+    tokens, cache hits and details; an exception marks it as an error and is re-raised.
+    """
+    metric = CallMetric(kind, name, provider, model, details)
+    token = _current_call.set(metric)
+    try:
+        yield metric
+    except BaseException as e:
+        metric.status = STATUS_ERROR
+        metric.error = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        metric.wall_seconds = time.perf_counter() - metric._started
+        try:
+            _current_call.reset(token)
+        except ValueError:
+            pass # A generator closed from another context (e.g. an abandoned stream)
+        _finish(metric)
+
+def note_queue(seconds):
+    """Adds waiting time (rate limiter, politeness delay) to the call being tracked, if any."""
+    metric = _current_call.get()
+    if metric is not None and seconds:
+        metric.queue_seconds += seconds
+
+def note_retry():
+    metric = _current_call.get()
+    if metric is not None:
+        metric.retries += 1
+
+def write_jsonl(records, path):
+    """Appends CallMetric records (or a MetricsRun) to a JSON lines file."""
+    text = records.to_jsonl() if isinstance(records, MetricsRun) else "".join(json.dumps(r.to_dict(), default=str) + "\n" for r in records)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
@@ -1,11 +1,10 @@
 import os
 import json
 from uuid import uuid4
-from mistralai.models.chat_completion import ChatMessage
+from ti_llm import chat_completion
+from ti_ai import get_model_name
 from langsmith import traceable
 
-#OPENAI_MODEL = "gpt-4-1106-preview"
-OPENAI_MODEL = "gpt-4o-2024-08-06"
 
 prompt_table2 = """
 | Technique                                | Technique ID | Tactic           | Comment                                                                                                      |
@@ -137,7 +136,7 @@ Creates an ATT&CK Matrix for Enterprise layer in JSON format based on the provid
 Args:  
     input_text (str): The input text to be used for creating the ATT&CK Matrix.  
     ttptable (str): The TTP table that will be used as input for creating the ATT&CK Matrix.  
-    client (object): An instance of the client to be used for making the API calls. Can be either an OpenAI client, Azure OpenAI client, or MistralAI client.  
+    client (object): The ti_llm provider to be used for making the API calls (see ti_llm.get_provider). Can be an OpenAI, Azure OpenAI, or MistralAI provider.  
     service_selection (str): The AI service to be used for processing the text. Can be either "OpenAI", "Azure OpenAI", or "MistralAI".  
     deployment_name (str, optional): The name of the Azure Machine Learning deployment that contains the text embedding model. Required if using "Azure OpenAI".  
 
@@ -162,37 +161,16 @@ Raises:
       f"{prompt_response2}"   
   )
   try:
-      if service_selection == "OpenAI" or service_selection == "Azure OpenAI":
-          # Determine the model based on the service provider
-          model = OPENAI_MODEL if service_selection == "OpenAI" else deployment_name
+      model = get_model_name(service_selection, deployment_name)
 
-          # Prepare the messages for the API call
-          messages=[
-              {"role": "system", "content": system_prompt_attack_layer},
-              {"role": "user", "content": user_prompt_attack_layer},
-              {"role": "assistant", "content": assistant_prompt_attack_layer},
-		          {"role": "user", "content": input_text},
-              ]
-          # Make the API call
-          response = client.chat.completions.create(
-              model=model,
-              messages=messages,
-              )
-
-          # Return the response content
-          return response.choices[0].message.content
-      elif service_selection == "MistralAI":
-            # Make the API call
-            response = client.chat(
-                model="mistral-large-latest",
-                messages=[
-                    ChatMessage(role="system", content=system_prompt_attack_layer),
-                    ChatMessage(role="user", content=user_prompt_attack_layer),
-                    ChatMessage(role="assistant", content=assistant_prompt_attack_layer),
-                    ChatMessage(role="user", content=input_text),
-                ],
-            )
-            # Return the response content
-            return response.choices[0].message.content
+      # Prepare the messages for the API call
+      messages=[
+          {"role": "system", "content": system_prompt_attack_layer},
+          {"role": "user", "content": user_prompt_attack_layer},
+          {"role": "assistant", "content": assistant_prompt_attack_layer},
+          {"role": "user", "content": input_text},
+          ]
+      # Make the API call and return the response content
+      return chat_completion(client, service_selection, model, messages, budget_text=input_text, component="navigator_layer")
   except Exception as e:
       return f"Failed to extract TTPs: {e}"
\ No newline at end of file
@@ -1,3 +1,4 @@
+import os
 import requests
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageTemplate, Frame, Table, TableStyle, ListFlowable, ListItem
@@ -7,12 +8,21 @@ from reportlab.lib.colors import blue, grey, black, HexColor, beige, lightgrey,
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT, TA_JUSTIFY
 from io import BytesIO
 import base64
-import streamlit as st
+import ti_events # Diagnostics go to the host's event sink instead of Streamlit
+import ti_metrics
+import ti_mermaid_render
+from ti_secrets import get_secret
 from reportlab.lib.utils import ImageReader
 import datetime
 import pandas as pd
 import re # For Markdown table parsing
 
+# --- Constants ---
+MERMAID_INK_URL = os.environ.get("MERMAID_INK_URL", "https://mermaid.ink") # Renders Mermaid diagrams to PNG; a self-hosted instance works too
+# "auto": mindmaps and timelines are drawn in-process (ti_mermaid_render), other diagrams via mermaid.ink;
+# "local": never call mermaid.ink; "mermaid.ink": always use the service
+MERMAID_RENDERER = os.environ.get("TI_MERMAID_RENDERER", "auto").lower()
+
 # --- Helper Functions ---
 
 def image_from_mermaid(graph, context="Mind Map"):
@@ -20,29 +30,30 @@ def image_from_mermaid(graph, context="Mind Map"):
     Fetches an image representation of Mermaid code from the mermaid.ink service.
     """
     if not graph or not graph.strip():
-        st.warning(f"Mermaid graph data for {context} is empty. Cannot generate image.")
+        ti_events.warning(f"Mermaid graph data for {context} is empty. Cannot generate image.", source="ti_pdf")
         return None
         
     graphbytes = graph.encode("utf8")
     base64_bytes = base64.b64encode(graphbytes)
     base64_string = base64_bytes.decode("ascii")
-    mermaid_ink_url = f"https://mermaid.ink/img/{base64_string}"
+    mermaid_ink_url = f"{MERMAID_INK_URL}/img/{base64_string}"
     
     try:
-        response = requests.get(mermaid_ink_url, timeout=30)
-        response.raise_for_status()
+        with ti_metrics.track(ti_metrics.KIND_MERMAID, context, diagram_bytes=len(graphbytes)):
+            response = requests.get(mermaid_ink_url, timeout=30)
+            response.raise_for_status()
         return BytesIO(response.content)
     except requests.exceptions.Timeout:
-        st.error(f"Mermaid image generation for {context} timed out contacting mermaid.ink.")
+        ti_events.error(f"Mermaid image generation for {context} timed out contacting mermaid.ink.", source="ti_pdf")
         return None
     except requests.exceptions.HTTPError as e:
-        st.error(f"Mermaid image generation for {context} failed. HTTP status: {e.response.status_code}. URL: {mermaid_ink_url}")
+        ti_events.error(f"Mermaid image generation for {context} failed. HTTP status: {e.response.status_code}. URL: {mermaid_ink_url}", source="ti_pdf")
         return None
     except requests.exceptions.RequestException as e:
-        st.error(f"Mermaid image generation request for {context} failed: {e}")
+        ti_events.error(f"Mermaid image generation request for {context} failed: {e}", source="ti_pdf")
         return None
     except Exception as e:
-        st.error(f"An unexpected error occurred during Mermaid image generation for {context}: {e}")
+        ti_events.error(f"An unexpected error occurred during Mermaid image generation for {context}: {e}", source="ti_pdf")
         return None
 
 def remove_first_non_empty_line_if_mermaid(mermaid_code):
@@ -60,7 +71,7 @@ def fit_image_to_page(image_data_bytesio, page_width, page_height, margin=0.75*i
         image_data_bytesio.seek(0)
         img_reader = ImageReader(image_data_bytesio)
     except Exception as e:
-        st.error(f"Error reading image data for fitting: {e}.")
+        ti_events.error(f"Error reading image data for fitting: {e}.", source="ti_pdf")
         return None
     img_width, img_height = img_reader.getSize()
     if img_height == 0 or img_width == 0: return None
@@ -79,6 +90,40 @@ def fit_image_to_page(image_data_bytesio, page_width, page_height, margin=0.75*i
     image_data_bytesio.seek(0)
     return Image(image_data_bytesio, width=new_width, height=new_height)
 
+def fit_drawing_to_page(drawing, page_width, page_height, margin=0.75*inch):
+    """Scales a vector drawing down (never up) to fit the page, keeping its aspect ratio."""
+    available_width = page_width - (2 * margin)
+    available_height = page_height - (2 * margin)
+    if drawing.width <= 0 or drawing.height <= 0 or available_width <= 0 or available_height <= 0: return None
+    scale = min(available_width / drawing.width, available_height / drawing.height, 1.0)
+    if scale < 1.0:
+        drawing.scale(scale, scale)
+        drawing.width, drawing.height = drawing.width * scale, drawing.height * scale
+    drawing.hAlign = "CENTER"
+    return drawing
+
+def diagram_flowable(graph, context, page_width, page_height):
+    """
+    Flowable for Mermaid code fitted to the page: a vector drawing for the mindmaps and timelines
+    ti_mermaid_render supports, otherwise (depending on MERMAID_RENDERER) the mermaid.ink image.
+    Raises ValueError when the diagram cannot be produced.
+    """
+    if MERMAID_RENDERER != "mermaid.ink":
+        try:
+            with ti_metrics.track(ti_metrics.KIND_MERMAID_LOCAL, context, diagram_bytes=len(graph.encode("utf8"))):
+                drawing = ti_mermaid_render.render_drawing(graph)
+            fitted = fit_drawing_to_page(drawing, page_width, page_height)
+            if fitted is None: raise ValueError(f"{context} drawing fitting failed.")
+            return fitted
+        except ti_mermaid_render.MermaidRenderError as e:
+            if MERMAID_RENDERER == "local": raise ValueError(f"{context} could not be drawn locally: {e}.")
+            ti_events.info(f"{context} is drawn by mermaid.ink: {e}.", source="ti_pdf")
+    image_data = image_from_mermaid(graph, context=context)
+    if not image_data: raise ValueError(f"{context} image data could not be fetched (see the mermaid.ink error reported before).")
+    img_fitted = fit_image_to_page(image_data, page_width, page_height)
+    if not img_fitted: raise ValueError(f"{context} image fitting failed.")
+    return img_fitted
+
 def parse_markdown_table(markdown_string):
     """
     Parses a simple Markdown table string into a list of lists (rows and cells).
@@ -136,6 +181,17 @@ def parse_markdown_table(markdown_string):
 # --- PDF Structure Elements ---
 REPORT_GENERATION_DATE = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
+def table_rows(table_data):
+    """
+    Returns (rows, text) for a TTP / 5 Whats component.
+
+    Typed results from ti_schemas already carry their rows; Markdown strings are parsed with
+    parse_markdown_table. `text` is the Markdown used for the plain-text fallback.
+    """
+    if hasattr(table_data, "to_rows"):
+        return table_data.to_rows(), table_data.to_markdown()
+    return parse_markdown_table(table_data), table_data or ""
+
 def footer_canvas(canvas, doc):
     canvas.saveState()
     canvas.setFont('Helvetica', 9)
@@ -203,7 +259,7 @@ def create_pdf_bytes(url, summary_content, mindmap_mermaid_code,
 
     flowables.append(Paragraph("WEBSITE SCREENSHOT", section_header_style))
     try:
-        api_key_thumbnail = st.secrets.get("api_keys", {}).get("thumbnail")
+        api_key_thumbnail = get_secret("thumbnail", "THUMBNAIL_API_KEY")
         if not api_key_thumbnail: raise ValueError("Thumbnail API key missing.")
         screenshot_response = requests.get(f"https://api.thumbnail.ws/api/{api_key_thumbnail}/thumbnail/get?url={url}&width=1280&delay=2500", timeout=35)
         screenshot_response.raise_for_status()
@@ -211,7 +267,7 @@ def create_pdf_bytes(url, summary_content, mindmap_mermaid_code,
         if img_fitted: flowables.append(img_fitted)
         else: flowables.append(Paragraph("Could not process screenshot image.", error_text_style))
     except Exception as e:
-        st.warning(f"Screenshot generation/processing failed: {e}")
+        ti_events.warning(f"Screenshot generation/processing failed: {e}", source="ti_pdf")
         flowables.append(Paragraph(f"Screenshot could not be generated or processed: {e}", error_text_style))
     flowables.append(Spacer(1, 0.1 * inch))
 
@@ -228,14 +284,9 @@ def create_pdf_bytes(url, summary_content, mindmap_mermaid_code,
             try:
                 processed_mm_code = remove_first_non_empty_line_if_mermaid(mindmap_mermaid_code)
                 if not processed_mm_code.strip(): raise ValueError("Main mind map code is empty after processing.")
-                mindmap_img_data = image_from_mermaid(processed_mm_code, context="Main Mind Map")
-                if mindmap_img_data:
-                    img_fitted = fit_image_to_page(mindmap_img_data, current_pagesize[0], current_pagesize[1])
-                    if img_fitted: flowables.append(img_fitted)
-                    else: raise ValueError("Main mind map image fitting failed.")
-                else: raise ValueError("Main mind map image data could not be fetched (check Streamlit logs for details from mermaid.ink).")
+                flowables.append(diagram_flowable(processed_mm_code, "Main Mind Map", current_pagesize[0], current_pagesize[1]))
             except Exception as e:
-                st.warning(f"Main Mind Map image generation/processing failed in PDF: {e}")
+                ti_events.warning(f"Main Mind Map image generation/processing failed in PDF: {e}", source="ti_pdf")
                 flowables.append(Paragraph(f"Could not generate main mind map image: {e}", error_text_style))
                 flowables.append(Paragraph("<b>Mermaid Code Used (Main Mind Map):</b>", body_text_style))
                 for line in mindmap_mermaid_code.splitlines(): flowables.append(Paragraph(line if line.strip() else " ", code_style))
@@ -274,17 +325,17 @@ def create_pdf_bytes(url, summary_content, mindmap_mermaid_code,
             elif not (isinstance(iocs_data, pd.DataFrame) and not iocs_data.empty): 
                  flowables.append(Paragraph("No IOCs data available or data is empty.", body_text_style))
         except Exception as e:
-            st.warning(f"Error processing IOCs for PDF: {e}")
+            ti_events.warning(f"Error processing IOCs for PDF: {e}", source="ti_pdf")
             flowables.append(Paragraph(f"Could not display IOCs: {e}", error_text_style))
         flowables.append(Spacer(1, 0.2 * inch))
 
     # TTPs Sections
+    parsed_ttp_table_data, ttps_overview_data = table_rows(ttps_overview_data)
     if ttps_overview_data or attack_path_data or mermaid_timeline_code:
         flowables.append(Paragraph("TACTICS, TECHNIQUES, AND PROCEDURES (TTPs)", section_header_style))
         
         if ttps_overview_data and ttps_overview_data.strip():
             flowables.append(Paragraph("TTPs Overview", sub_section_header_style))
-            parsed_ttp_table_data = parse_markdown_table(ttps_overview_data)
             if parsed_ttp_table_data and len(parsed_ttp_table_data) > 0:
                 styled_ttp_table_data = []
                 try:
@@ -320,7 +371,7 @@ def create_pdf_bytes(url, summary_content, mindmap_mermaid_code,
                     else: # Should not happen if parsed_ttp_table_data is valid and non-empty
                         flowables.append(Paragraph("Could not prepare TTPs overview table data for styling.", error_text_style))
                 except Exception as e_table_render:
-                    st.warning(f"Error rendering TTPs overview table: {e_table_render}")
+                    ti_events.warning(f"Error rendering TTPs overview table: {e_table_render}", source="ti_pdf")
                     flowables.append(Paragraph(f"Error rendering TTPs table: {e_table_render}. Displaying as text:", error_text_style))
                     for line in ttps_overview_data.splitlines(): flowables.append(Paragraph(line, body_text_style))
             else: 
@@ -349,23 +400,18 @@ def create_pdf_bytes(url, summary_content, mindmap_mermaid_code,
                 try:
                     processed_ttp_timeline_code = remove_first_non_empty_line_if_mermaid(mermaid_timeline_code)
                     if not processed_ttp_timeline_code.strip(): raise ValueError("TTP timeline code is empty after processing.")
-                    ttp_timeline_img_data = image_from_mermaid(processed_ttp_timeline_code, context="TTP Timeline")
-                    if ttp_timeline_img_data:
-                        img_fitted = fit_image_to_page(ttp_timeline_img_data, current_pagesize[0], current_pagesize[1])
-                        if img_fitted: flowables.append(img_fitted)
-                        else: raise ValueError("TTP timeline image fitting failed.")
-                    else: raise ValueError("TTP timeline image data could not be fetched (check Streamlit logs for details from mermaid.ink).")
+                    flowables.append(diagram_flowable(processed_ttp_timeline_code, "TTP Timeline", current_pagesize[0], current_pagesize[1]))
                 except Exception as e:
-                    st.warning(f"TTP Timeline image generation/processing failed in PDF: {e}")
+                    ti_events.warning(f"TTP Timeline image generation/processing failed in PDF: {e}", source="ti_pdf")
                     flowables.append(Paragraph(f"Could not generate TTP timeline image: {e}", error_text_style))
                     flowables.append(Paragraph("<b>Mermaid Code Used (TTP Timeline):</b>", body_text_style))
                     for line in mermaid_timeline_code.splitlines(): flowables.append(Paragraph(line if line.strip() else " ", code_style))
         flowables.append(Spacer(1, 0.2 * inch))
 
     # Threat Scope Report (5 Whats) Section - Corrected to use parse_markdown_table
+    parsed_5w_table_data, five_whats_data = table_rows(five_whats_data) # Typed report rows, or the parsed Markdown table
     if five_whats_data and five_whats_data.strip():
         flowables.append(Paragraph("THREAT SCOPE REPORT (THE 5 WHATS)", section_header_style))
-        parsed_5w_table_data = parse_markdown_table(five_whats_data) # Use the markdown table parser
 
         if parsed_5w_table_data and len(parsed_5w_table_data) > 0:
             styled_5w_table_data = []
@@ -411,7 +457,7 @@ def create_pdf_bytes(url, summary_content, mindmap_mermaid_code,
                 else:
                     flowables.append(Paragraph("Could not parse '5 Whats' report table data.", error_text_style))
             except Exception as e_5w_table_render:
-                st.warning(f"Error rendering '5 Whats' report table: {e_5w_table_render}")
+                ti_events.warning(f"Error rendering '5 Whats' report table: {e_5w_table_render}", source="ti_pdf")
                 flowables.append(Paragraph(f"Error rendering '5 Whats' table: {e_5w_table_render}. Displaying as text:", error_text_style))
                 for line in five_whats_data.splitlines(): 
                     if line.strip(): flowables.append(Paragraph(line, body_text_style))
@@ -427,19 +473,14 @@ def create_pdf_bytes(url, summary_content, mindmap_mermaid_code,
         pdf_bytes_io.close()
         return pdf_bytes
     except Exception as e:
-        st.error(f"CRITICAL: Failed to build PDF document: {e}")
+        ti_events.error(f"CRITICAL: Failed to build PDF document: {e}", source="ti_pdf")
         pdf_bytes_io.close()
         return None
 
 # --- Example usage (for testing) ---
 if __name__ == '__main__':
-    class MockSecrets(dict):
-        def get(self, key, default=None): return super().get(key, default if default is not None else {})
-
-    if not hasattr(st, 'secrets'):
-        st.secrets = MockSecrets(api_keys={"thumbnail": "YOUR_THUMBNAIL_API_KEY_HERE_OR_MOCK"})
-        def mock_st_method(message): print(f"ST_MOCK: {message}")
-        st.error = mock_st_method; st.warning = mock_st_method; st.info = mock_st_method; st.json = mock_st_method
+    import logging
+    logging.basicConfig(level=logging.INFO) # Diagnostics from the default sink are printed to the console
 
     dummy_url = "https://www.examplethreatreport.com/report123"
     dummy_summary = "This is a detailed AI-generated summary..."
@@ -0,0 +1,249 @@
+import os
+import mmap
+import time
+import bisect
+import shutil
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from ti_cache import CACHE_DIR, DiskCache
+
+# PDF text extraction for ingestion. The document is spooled to a temporary file once and read
+# through a read-only memory map, so neither the parent nor the workers hold extra copies of it.
+# Large documents are split into page ranges extracted by a process pool (PyPDF2's text
+# extraction is pure Python and CPU-bound); the ranges are consumed in order, so extraction stops
+# as soon as the character or token budget is reached. Page texts are joined once at the end.
+# Results are cached on disk by the SHA-256 of the document, with the character offset of every
+# page, so a repeat upload of the same report skips parsing (and chunking can cite pages).
+
+# --- Constants ---
+PDF_TEXT_MAX_CHARS = int(os.environ.get("TI_PDF_MAX_CHARS", 2_000_000)) # ~500k tokens; later pages are not extracted
+PARALLEL_MIN_PAGES = 24   # Smaller documents are extracted in-process (starting a pool costs more than it saves)
+PAGES_PER_TASK = 8
+MAX_WORKERS = min(os.cpu_count() or 1, 8)
+TASKS_IN_FLIGHT_PER_WORKER = 2 # Bounds the work done past the budget when stopping early
+HASH_CHUNK_SIZE = 1024 * 1024
+
+PDF_TEXT_CACHE_PATH = os.path.join(CACHE_DIR, "pdf_text.sqlite")
+PDF_TEXT_CACHE_MAX_BYTES = 512 * 1024 * 1024 # Least recently used documents are evicted above this size
+PDF_TEXT_CACHE_TTL_SECONDS = 0               # Extracted text does not go stale
+
+class PdfExtraction:
+    """Text of a PDF and how it was obtained."""
+    def __init__(self, text, pages, pages_extracted, truncated, workers, seconds, page_offsets=None, digest=None, cached=False):
+        self.text = text
+        self.pages = pages                     # Pages in the document
+        self.pages_extracted = pages_extracted # Pages read before the budget was reached
+        self.truncated = truncated             # The budget cut the text short
+        self.workers = workers                 # 1 when extracted in-process (0 when served from the cache)
+        self.seconds = seconds
+        self.page_offsets = page_offsets or [] # Offset in `text` where each extracted page starts
+        self.digest = digest                   # SHA-256 of the document
+        self.cached = cached
+
+    def page_at(self, position):
+        """1-based page number of a character offset in `text`."""
+        return page_at(self.page_offsets, position)
+
+    def __repr__(self):
+        return (f"PdfExtraction({len(self.text):,} chars, {self.pages_extracted}/{self.pages} pages, "
+                f"truncated={self.truncated}, workers={self.workers}, cached={self.cached}, {self.seconds:.2f}s)")
+
+def page_at(page_offsets, position):
+    """1-based page number of a character offset, given the page start offsets of a text."""
+    return max(1, bisect.bisect_right(page_offsets, position))
+
+# --- Readers ---
+
+def _open_reader(path):
+    import PyPDF2 # Only needed for PDF ingestion
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # Stays valid after the file is closed
+    return PyPDF2.PdfReader(mapped)
+
+def _page_text(reader, index):
+    try:
+        return reader.pages[index].extract_text() or ""
+    except Exception: # One malformed page should not lose the rest of the document
+        return ""
+
+# The reader of a worker process, opened once per process by _init_worker
+_worker_reader = None
+
+def _init_worker(path):
+    global _worker_reader
+    _worker_reader = _open_reader(path)
+
+def _extract_range(start, end):
+    return [_page_text(_worker_reader, index) for index in range(start, end)]
+
+def document_digest(source):
+    """SHA-256 of a PDF given as a path, bytes or a binary file object (read from the start)."""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    elif hasattr(source, "getbuffer"): # BytesIO, e.g. a Streamlit upload: hashed without a copy
+        digest.update(source.getbuffer())
+    else:
+        handle = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+        try:
+            handle.seek(0)
+            for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        finally:
+            if handle is not source:
+                handle.close()
+    return digest.hexdigest()
+
+_text_cache = None
+_text_cache_lock = threading.Lock()
+
+def get_text_cache():
+    """Returns the process-wide extracted-text cache, creating it on first use."""
+    global _text_cache
+    if _text_cache is None:
+        with _text_cache_lock:
+            if _text_cache is None:
+                _text_cache = DiskCache(PDF_TEXT_CACHE_PATH, PDF_TEXT_CACHE_MAX_BYTES, PDF_TEXT_CACHE_TTL_SECONDS)
+    return _text_cache
+
+def _spool(source):
+    """Returns (path, is_temporary) for a path, bytes or a binary file object."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source), False
+    with tempfile.NamedTemporaryFile(prefix="ti-pdf-", suffix=".pdf", delete=False) as f:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            f.write(source)
+        else:
+            source.seek(0)
+            shutil.copyfileobj(source, f, 1024 * 1024)
+    return f.name, True
+
+# --- Extraction ---
+
+class _Budget:
+    """Accumulates page texts until the character or token budget is reached."""
+    def __init__(self, max_chars, max_tokens, model):
+        self.max_chars = max_chars
+        self.max_tokens = max_tokens
+        self.model = model
+        self.texts = []
+        self.chars = 0
+        self.tokens = 0
+        self.cut = False # The text of the last page was shortened to fit
+
+    def add(self, text):
+        """Adds a page; returns True once the budget is reached."""
+        self.texts.append(text)
+        if text:
+            self.chars += len(text) + 1
+            if self.max_tokens:
+                import ti_tokens
+                self.tokens += ti_tokens.count_tokens(text, self.model)
+        return self.exhausted
+
+    @property
+    def exhausted(self):
+        return bool((self.max_chars and self.chars >= self.max_chars) or (self.max_tokens and self.tokens >= self.max_tokens))
+
+    def page_offsets(self):
+        offsets, position = [], 0
+        for page in self.texts:
+            offsets.append(position)
+            if page:
+                position += len(page) + 1
+        return offsets
+
+    def result(self):
+        text = "".join(page + "\n" for page in self.texts if page) # One join instead of repeated concatenation
+        if self.max_chars and len(text) > self.max_chars:
+            text = text[:self.max_chars]
+            self.cut = True
+        if self.max_tokens and self.tokens > self.max_tokens:
+            import ti_tokens
+            text = ti_tokens.truncate_to_tokens(text, self.max_tokens, self.model)
+            self.cut = True
+        return text
+
+def _extract_parallel(path, pages, budget, workers):
+    ranges = [(start, min(start + PAGES_PER_TASK, pages)) for start in range(0, pages, PAGES_PER_TASK)]
+    # Spawned workers: forking the multi-threaded Streamlit server is not safe
+    context = multiprocessing.get_context("spawn")
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(path,))
+    try:
+        pending = []
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < workers * TASKS_IN_FLIGHT_PER_WORKER:
+                pending.append(executor.submit(_extract_range, *ranges[next_range]))
+                next_range += 1
+            for text in pending.pop(0).result(): # In page order
+                if budget.add(text):
+                    return
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def extract_pdf_text(source, max_chars=PDF_TEXT_MAX_CHARS, max_tokens=None, model=None, workers=None, use_cache=True):
+    """
+    Extracts the text of a PDF, page by page, until the budget is reached.
+
+    Args:
+        source (str | bytes | file): A path, the document's bytes, or a binary file object (e.g. a
+            Streamlit upload); bytes and file objects are spooled to a temporary file.
+        max_chars (int, optional): Stop once this many characters are extracted (None: no limit).
+        max_tokens (int, optional): Stop once this many tokens of `model` are extracted.
+        workers (int, optional): Worker processes (default MAX_WORKERS); documents shorter than
+            PARALLEL_MIN_PAGES are always extracted in-process.
+        use_cache (bool): Serve and store the result in the extracted-text cache, keyed by the
+            document's SHA-256 and the budget.
+
+    Returns:
+        PdfExtraction: The text (page texts joined by newlines) and extraction details.
+
+    Raises:
+        Exception: PyPDF2 errors for unreadable or encrypted documents.
+    """
+    started = time.perf_counter()
+    digest = document_digest(source)
+    cache = get_text_cache() if use_cache else None
+    key = f"{digest}:{max_chars}:{max_tokens}:{model if max_tokens else ''}"
+    entry = cache.get(key) if cache else None
+    if entry is not None:
+        return PdfExtraction(entry["text"], entry["pages"], entry["pages_extracted"], entry["truncated"], 0,
+                             time.perf_counter() - started, entry["page_offsets"], digest, cached=True)
+
+    path, is_temporary = _spool(source)
+    try:
+        reader = _open_reader(path)
+        pages = len(reader.pages)
+        budget = _Budget(max_chars, max_tokens, model)
+        workers = max(1, min(workers or MAX_WORKERS, -(-pages // PAGES_PER_TASK)))
+        if workers > 1 and pages >= PARALLEL_MIN_PAGES:
+            try:
+                _extract_parallel(path, pages, budget, workers)
+            except (BrokenProcessPool, OSError): # Workers could not start (or died); extract in-process instead
+                budget = _Budget(max_chars, max_tokens, model)
+                workers = 1
+        else:
+            workers = 1
+        if workers == 1:
+            for index in range(pages):
+                if budget.add(_page_text(reader, index)):
+                    break
+        text = budget.result()
+        truncated = len(budget.texts) < pages or budget.cut
+        extraction = PdfExtraction(text, pages, len(budget.texts), truncated, workers, time.perf_counter() - started,
+                                   budget.page_offsets(), digest)
+        if cache is not None:
+            cache.set(key, {"text": text, "pages": pages, "pages_extracted": extraction.pages_extracted,
+                            "truncated": truncated, "page_offsets": extraction.page_offsets})
+        return extraction
+    finally:
+        if is_temporary:
+            try:
+                os.remove(path)
+            except OSError: # Windows keeps mapped files locked; the temporary directory is cleaned eventually
+                pass
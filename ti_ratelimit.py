@@ -0,0 +1,298 @@
+import time
+import random
+import asyncio
+import threading
+import email.utils
+import httpx
+import ti_tokens
+import ti_metrics
+
+# --- Constants ---
+# Requests and tokens per minute per (provider, model/deployment) when none are configured. These are
+# deliberately modest account-tier quotas; raise them in the sidebar to match your own quota.
+DEFAULT_RATE_LIMITS = {
+    "OpenAI": (500, 450000),
+    "Azure OpenAI": (180, 30000), # Azure quotas are per deployment; 6 RPM per 1,000 TPM
+    "MistralAI": (300, 500000),
+}
+FALLBACK_RATE_LIMITS = (60, 60000)
+DEFAULT_COMPLETION_TOKENS = 1000 # Completion size assumed when a request sets no max_tokens; corrected from usage
+
+MAX_RETRIES = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+MAX_RETRY_AFTER_SECONDS = 120.0  # A server asking for more than this is treated as an outage
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Per-(provider, model) limits set by the user: {(provider, model): (rpm, tpm)}; model None applies to the whole provider
+RATE_LIMIT_OVERRIDES = {}
+
+# --- Token Buckets ---
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at `per_minute / 60` per second, holding up to `capacity`.
+
+    `reserve` takes the amount immediately, even if that drives the level negative, and returns how
+    long the caller must wait before sending. Callers are therefore served in the order they
+    reserved, and a request larger than the capacity still goes through once the debt is repaid.
+    """
+    def __init__(self, per_minute, capacity=None):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now=None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate) if self.rate > 0 else 0.0
+
+    def refund(self, amount, now=None):
+        """Returns (or, with a negative amount, takes) tokens after the real cost of a request is known."""
+        self._refill(time.monotonic() if now is None else now)
+        self.level = min(self.capacity, self.level + amount)
+
+class RateLimiter:
+    """
+    Request and token budgets for one provider and model (or Azure deployment), shared by every
+    component and session in the process.
+    """
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.throttled_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens):
+        """Reserves one request and `tokens` tokens; returns the seconds to wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now), self.paused_until - now, 0.0)
+            self.calls += 1
+            self.throttled_seconds += wait
+            return wait
+
+    def settle(self, reserved_tokens, used_tokens):
+        """Corrects the token bucket once the real usage of a request is known."""
+        with self._lock:
+            self.tokens.refund(reserved_tokens - used_tokens)
+
+    def note_retry(self, pause_seconds=None):
+        """Counts a retry; with `pause_seconds` (the provider said it is over quota), holds every caller back."""
+        with self._lock:
+            self.retries += 1
+            if pause_seconds is not None:
+                self.rate_limited += 1
+                self.paused_until = max(self.paused_until, time.monotonic() + pause_seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests_per_minute": self.requests.per_minute,
+                "tokens_per_minute": self.tokens.per_minute,
+                "calls": self.calls,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "throttled_seconds": round(self.throttled_seconds, 1),
+            }
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def rate_limits_for(ai_service_provider, model):
+    """Returns (requests per minute, tokens per minute) for a provider and model."""
+    for key in ((ai_service_provider, model), (ai_service_provider, None)):
+        if key in RATE_LIMIT_OVERRIDES:
+            return RATE_LIMIT_OVERRIDES[key]
+    return DEFAULT_RATE_LIMITS.get(ai_service_provider, FALLBACK_RATE_LIMITS)
+
+def get_limiter(ai_service_provider, model):
+    """Returns the shared limiter for a provider and model, (re)creating it when its limits changed."""
+    limits = rate_limits_for(ai_service_provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get((ai_service_provider, model))
+        if limiter is None or (limiter.requests.per_minute, limiter.tokens.per_minute) != tuple(limits):
+            limiter = RateLimiter(*limits)
+            _limiters[(ai_service_provider, model)] = limiter
+        return limiter
+
+def set_rate_limits(ai_service_provider, requests_per_minute, tokens_per_minute, model=None):
+    """Sets the quota for a provider (or one of its models/deployments); takes effect on the next request."""
+    RATE_LIMIT_OVERRIDES[(ai_service_provider, model)] = (int(requests_per_minute), int(tokens_per_minute))
+
+def get_rate_limit_stats():
+    """Returns {"provider / model": stats} for every limiter used so far."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {f"{provider} / {model}": limiter.stats() for (provider, model), limiter in limiters.items()}
+
+# --- Retry Policy ---
+
+def _status_code(error):
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+def retry_after_seconds(error):
+    """Reads Retry-After (seconds or HTTP date) or retry-after-ms from the error's response, or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def is_retryable(error):
+    """Rate limits, timeouts, server errors and dropped connections are retried; other errors are not."""
+    if _status_code(error) in RETRYABLE_STATUS_CODES:
+        return True
+    if isinstance(error, httpx.TransportError):
+        return True
+    # The OpenAI SDK wraps transport failures in its own classes, which carry no status code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+def backoff_seconds(attempt, error=None):
+    """Exponential backoff with full jitter, or the server's Retry-After when it sent one."""
+    retry_after = retry_after_seconds(error) if error is not None else None
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_AFTER_SECONDS) + random.uniform(0, BACKOFF_BASE_SECONDS)
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+def estimate_request_tokens(messages, model, max_tokens=None):
+    """Tokens a request is expected to use: the prompt plus its completion budget."""
+    return ti_tokens.count_message_tokens(messages, model) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+def _used_tokens(completion, estimated):
+    prompt_tokens = getattr(completion, "prompt_tokens", None)
+    completion_tokens = getattr(completion, "completion_tokens", None)
+    if prompt_tokens is None or completion_tokens is None:
+        return estimated
+    return prompt_tokens + completion_tokens
+
+def _on_failure(limiter, error, attempt, reserved_tokens):
+    """Returns the delay before the next attempt, or None if the error must be raised."""
+    limiter.settle(reserved_tokens, 0) # A rejected request does not use the token quota
+    if attempt >= MAX_RETRIES or not is_retryable(error):
+        return None
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None and retry_after > MAX_RETRY_AFTER_SECONDS:
+        return None
+    delay = backoff_seconds(attempt, error)
+    # On a 429 everyone waits, instead of each caller discovering the limit with its own request
+    limiter.note_retry(pause_seconds=delay if _status_code(error) == 429 else None)
+    return delay
+
+# --- Entry Points ---
+
+def call_with_rate_limit(ai_service_provider, model, messages, max_tokens, send):
+    """
+    Calls `send()` (one provider request) within the rate limits, retrying transient failures.
+
+    Args:
+        ai_service_provider (str): "OpenAI", "Azure OpenAI" or "MistralAI".
+        model (str): Model name, or deployment name for Azure OpenAI.
+        messages (list[dict]): The messages being sent, used to estimate the token cost.
+        max_tokens (int, optional): The request's completion budget.
+        send (callable): Performs the request and returns a ti_llm.Completion.
+
+    Returns:
+        The value returned by `send`.
+    """
+    limiter = get_limiter(ai_service_provider, model)
+    estimated = estimate_request_tokens(messages, model, max_tokens)
+    attempt = 0
+    while True:
+        wait = limiter.reserve(estimated)
+        if wait:
+            ti_metrics.note_queue(wait)
+            time.sleep(wait)
+        try:
+            completion = send()
+        except Exception as e:
+            delay = _on_failure(limiter, e, attempt, estimated)
+            if delay is None:
+                raise
+            ti_metrics.note_retry()
+            ti_metrics.note_queue(delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        limiter.settle(estimated, _used_tokens(completion, estimated))
+        return completion
+
+async def acall_with_rate_limit(ai_service_provider, model, messages, max_tokens, send):
+    """Async variant of call_with_rate_limit; `send()` returns an awaitable."""
+    limiter = get_limiter(ai_service_provider, model)
+    estimated = estimate_request_tokens(messages, model, max_tokens)
+    attempt = 0
+    while True:
+        wait = limiter.reserve(estimated)
+        if wait:
+            ti_metrics.note_queue(wait)
+            await asyncio.sleep(wait)
+        try:
+            completion = await send()
+        except Exception as e:
+            delay = _on_failure(limiter, e, attempt, estimated)
+            if delay is None:
+                raise
+            ti_metrics.note_retry()
+            ti_metrics.note_queue(delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        limiter.settle(estimated, _used_tokens(completion, estimated))
+        return completion
+
+def stream_with_rate_limit(ai_service_provider, model, messages, max_tokens, open_stream):
+    """
+    Streaming variant: yields the chunks of `open_stream()`. Failures are retried only until the
+    first chunk has been yielded, so a caller never sees text twice.
+    """
+    limiter = get_limiter(ai_service_provider, model)
+    estimated = estimate_request_tokens(messages, model, max_tokens)
+    attempt = 0
+    while True:
+        wait = limiter.reserve(estimated)
+        if wait:
+            ti_metrics.note_queue(wait)
+            time.sleep(wait)
+        parts = []
+        try:
+            for chunk in open_stream():
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            delay = None if parts else _on_failure(limiter, e, attempt, estimated)
+            if delay is None:
+                raise
+            ti_metrics.note_retry()
+            ti_metrics.note_queue(delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        used = ti_tokens.count_message_tokens(messages, model) + ti_tokens.count_tokens("".join(parts), model)
+        limiter.settle(estimated, used)
+        return
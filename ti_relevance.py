@@ -0,0 +1,138 @@
+import re
+import math
+from ti_ai import ai_check_content_relevance
+
+# --- Constants ---
+RELEVANT_THRESHOLD = 0.90     # Local probability at or above which the text is accepted without an LLM call
+NOT_RELEVANT_THRESHOLD = 0.05 # Local probability at or below which the text is rejected without an LLM call
+MIN_WORDS_FOR_LOCAL_DECISION = 80 # Shorter texts carry too little signal; they go to the LLM unless clear-cut
+SHORT_TEXT_RELEVANT_THRESHOLD = 0.99
+
+# Logistic model weights (hand-tuned on typical vendor reports, security news and off-topic articles)
+WEIGHT_BIAS = -4.0
+WEIGHT_DENSITY = 1.2   # log1p(weighted term hits per 1,000 words)
+WEIGHT_DISTINCT = 0.45 # distinct terms, capped at MAX_DISTINCT_TERMS
+WEIGHT_INDICATORS = 0.8 # log1p(CVE IDs, ATT&CK IDs, hashes, defanged indicators)
+MAX_DISTINCT_TERMS = 15
+MAX_HITS_PER_TERM = 10 # One repeated word (e.g. "security") must not make a text look like a report
+
+# Terms that almost only appear in threat intelligence (weight 2) and general security terms (weight 1)
+STRONG_TERMS = (
+    "malware", "ransomware", "threat actor", "apt", "backdoor", "trojan", "botnet", "phishing", "spear-phishing",
+    "spearphishing", "exploit", "exploited", "zero-day", "0-day", "command and control", "c2", "c&c", "ioc", "iocs",
+    "indicators of compromise", "mitre", "att&ck", "ttp", "ttps", "lateral movement", "persistence", "exfiltration",
+    "privilege escalation", "payload", "loader", "dropper", "stealer", "infostealer", "rat", "webshell", "web shell",
+    "cobalt strike", "beacon", "credential dumping", "initial access", "threat intelligence", "intrusion set",
+    "campaign", "implant", "wiper", "cryptominer", "obfuscation", "obfuscated", "sandbox", "yara", "sigma",
+)
+TERMS = (
+    "vulnerability", "vulnerabilities", "attack", "attacker", "attackers", "hacker", "hackers", "breach", "compromise",
+    "compromised", "security", "cybersecurity", "cyber", "threat", "threats", "patch", "patched", "cve", "incident",
+    "adversary", "espionage", "victim", "victims", "infection", "infected", "encryption", "encrypted", "ddos",
+    "domain", "domains", "ip address", "hash", "sha256", "md5", "powershell", "registry", "scheduled task",
+    "execution", "evasion", "detection", "edr", "siem", "soc", "firewall", "vpn", "credential", "credentials",
+)
+
+_TERM_WEIGHTS = {term: 2 for term in STRONG_TERMS}
+_TERM_WEIGHTS.update({term: 1 for term in TERMS if term not in _TERM_WEIGHTS})
+_TERM_PATTERN = re.compile(
+    r"(?<![a-z0-9])(" + "|".join(re.escape(t) for t in sorted(_TERM_WEIGHTS, key=len, reverse=True)) + r")(?![a-z0-9])"
+)
+_WORD_PATTERN = re.compile(r"\w+")
+_INDICATOR_PATTERNS = (
+    re.compile(r"\bCVE-\d{4}-\d{4,}\b", re.IGNORECASE),
+    re.compile(r"\bT1\d{3}(?:\.\d{3})?\b"),                     # ATT&CK technique IDs
+    re.compile(r"\bTA00\d{2}\b"),                               # ATT&CK tactic IDs
+    re.compile(r"\b[a-f0-9]{32}\b|\b[a-f0-9]{40}\b|\b[a-f0-9]{64}\b", re.IGNORECASE), # MD5 / SHA1 / SHA256
+    re.compile(r"\[\.\]|\[:\]|\bhxxps?\b|\[at\]", re.IGNORECASE), # Defanged indicators
+)
+
+class RelevanceDecision:
+    """
+    Outcome of the relevance check.
+
+    `label` is "relevant", "not_relevant" or "ambiguous"; `confidence` is the probability of the
+    chosen label; `source` is "local" or "llm". `features` holds the classifier inputs so the
+    thresholds above can be tuned.
+    """
+    def __init__(self, label, confidence, probability, features, source="local", llm_response=None):
+        self.label = label
+        self.confidence = confidence
+        self.probability = probability
+        self.features = features
+        self.source = source
+        self.llm_response = llm_response
+
+    @property
+    def is_relevant(self):
+        return self.label != "not_relevant"
+
+    def describe(self):
+        if self.source == "llm":
+            return f"AI check: {self.llm_response}"
+        return f"local classifier, confidence {self.confidence:.2f}"
+
+    def __repr__(self):
+        return f"RelevanceDecision({self.label!r}, confidence={self.confidence:.3f}, source={self.source!r})"
+
+def relevance_features(text):
+    """Extracts the classifier features: term density, distinct terms and hard indicators."""
+    words = len(_WORD_PATTERN.findall(text or ""))
+    counts = {}
+    for match in _TERM_PATTERN.finditer((text or "").lower()):
+        term = match.group(1)
+        counts[term] = counts.get(term, 0) + 1
+    weighted_hits = sum(_TERM_WEIGHTS[term] * min(count, MAX_HITS_PER_TERM) for term, count in counts.items())
+    indicators = sum(len(pattern.findall(text or "")) for pattern in _INDICATOR_PATTERNS)
+    return {
+        "words": words,
+        "weighted_hits": weighted_hits,
+        "density_per_1k_words": (weighted_hits * 1000.0 / words) if words else 0.0,
+        "distinct_terms": len(counts),
+        "indicators": indicators,
+    }
+
+def classify_relevance(text):
+    """
+    Scores how likely `text` is cybersecurity / threat intelligence content, without any network call.
+
+    Returns:
+        RelevanceDecision: "relevant" or "not_relevant" for clear-cut texts, "ambiguous" otherwise.
+    """
+    features = relevance_features(text)
+    logit = (WEIGHT_BIAS
+             + WEIGHT_DENSITY * math.log1p(features["density_per_1k_words"])
+             + WEIGHT_DISTINCT * min(features["distinct_terms"], MAX_DISTINCT_TERMS)
+             + WEIGHT_INDICATORS * math.log1p(features["indicators"]))
+    probability = 1.0 / (1.0 + math.exp(-logit))
+
+    relevant_threshold = RELEVANT_THRESHOLD
+    if features["words"] < MIN_WORDS_FOR_LOCAL_DECISION:
+        relevant_threshold = SHORT_TEXT_RELEVANT_THRESHOLD
+    if probability >= relevant_threshold:
+        return RelevanceDecision("relevant", probability, probability, features)
+    if probability <= NOT_RELEVANT_THRESHOLD and features["words"] >= MIN_WORDS_FOR_LOCAL_DECISION:
+        return RelevanceDecision("not_relevant", 1.0 - probability, probability, features)
+    return RelevanceDecision("ambiguous", max(probability, 1.0 - probability), probability, features)
+
+def check_content_relevance(input_text, client, ai_service_provider, deployment_name=None):
+    """
+    Decides whether the text is cybersecurity content, asking the LLM only for ambiguous texts.
+
+    Returns:
+        RelevanceDecision: The local decision, or the LLM's answer (source="llm") when the local
+        classifier was not confident enough.
+    """
+    decision = classify_relevance(input_text)
+    if decision.label != "ambiguous":
+        return decision
+
+    response = ai_check_content_relevance(input_text, client, ai_service_provider, deployment_name)
+    answer = (response or "").strip().lower()
+    if answer.startswith("no"):
+        label = "not_relevant"
+    elif answer.startswith("error"):
+        label = "ambiguous" # Could not decide either way; do not block generation
+    else:
+        label = "relevant"
+    return RelevanceDecision(label, decision.confidence, decision.probability, decision.features, source="llm", llm_response=response)
@@ -0,0 +1,182 @@
+import time
+import ti_events
+import ti_metrics
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# --- Constants ---
+DEFAULT_MAX_CONCURRENCY = 4 # Parallel LLM round trips allowed by default
+POLL_INTERVAL_SECONDS = 0.2 # How often progress is reported while components run
+
+# Component states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+class Component:
+    """
+    A unit of report generation (e.g. summary, IOCs, TTP table).
+
+    `func` is called with a dict holding the results of the components listed in
+    `depends_on`, and its return value becomes `result`. With `stream=True`, `func` may return
+    an iterable of text chunks instead; they are collected into `partial` as they arrive (so
+    progress callbacks can render them) and joined into `result` at the end.
+    """
+    def __init__(self, name, label, func, depends_on=(), stream=False):
+        self.name = name
+        self.label = label
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.stream = stream
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.partial = []
+        self.started_at = None
+        self.first_chunk_at = None
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        """Seconds spent running so far (or in total once finished)."""
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def partial_text(self):
+        """Text streamed so far (empty for non-streaming components)."""
+        return "".join(list(self.partial))
+
+    @property
+    def time_to_first_chunk(self):
+        """Seconds between start and the first streamed chunk, or None."""
+        if self.started_at is None or self.first_chunk_at is None:
+            return None
+        return self.first_chunk_at - self.started_at
+
+    def __repr__(self):
+        return f"Component({self.name!r}, status={self.status!r})"
+
+def _validate(components):
+    """Checks for duplicate names, unknown dependencies and dependency cycles."""
+    by_name = {}
+    for component in components:
+        if component.name in by_name:
+            raise ValueError(f"Duplicate component name: {component.name}")
+        by_name[component.name] = component
+
+    for component in components:
+        for dep in component.depends_on:
+            if dep not in by_name:
+                raise ValueError(f"Component '{component.name}' depends on unknown component '{dep}'.")
+
+    visiting, visited = set(), set()
+    def visit(name):
+        if name in visited: return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle detected at component '{name}'.")
+        visiting.add(name)
+        for dep in by_name[name].depends_on:
+            visit(dep)
+        visiting.discard(name)
+        visited.add(name)
+
+    for name in by_name:
+        visit(name)
+    return by_name
+
+def _run_one(component, dependency_results):
+    component.started_at = time.monotonic()
+    try:
+        with ti_metrics.track(ti_metrics.KIND_COMPONENT, component.name, label=component.label) as metric:
+            result = component.func(dependency_results)
+            if component.stream and result is not None and not isinstance(result, str):
+                for chunk in result:
+                    if component.first_chunk_at is None:
+                        component.first_chunk_at = time.monotonic()
+                        metric.mark_first_chunk()
+                    component.partial.append(chunk) # list.append is atomic; the UI thread only reads
+                result = "".join(component.partial)
+            return result
+    finally:
+        component.finished_at = time.monotonic()
+
+def run_components(components, max_concurrency=DEFAULT_MAX_CONCURRENCY, on_progress=None, poll_interval=POLL_INTERVAL_SECONDS):
+    """
+    Runs components concurrently, starting each one as soon as its dependencies are done.
+
+    Args:
+        components (list[Component]): The components to run.
+        max_concurrency (int): Maximum number of components running at the same time.
+        on_progress (callable, optional): Called with the component list whenever a state changes
+            and at every poll interval. It always runs in the calling thread, so it is safe to
+            update Streamlit elements from it.
+        poll_interval (float): Seconds between progress callbacks while components are running.
+
+    Returns:
+        dict: Component name -> Component, with `status`, `result` and `error` filled in.
+    """
+    by_name = _validate(components)
+    max_concurrency = max(1, int(max_concurrency or 1))
+
+    def notify():
+        if on_progress:
+            on_progress(components)
+
+    def ready(component):
+        return component.status == PENDING and all(by_name[d].status == DONE for d in component.depends_on)
+
+    def blocked(component):
+        return component.status == PENDING and any(by_name[d].status in (FAILED, SKIPPED) for d in component.depends_on)
+
+    running = {} # future -> component
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="ti-component") as executor:
+        while True:
+            # Skip anything whose dependencies failed, then launch what is ready (in declaration order)
+            changed = True
+            while changed:
+                changed = False
+                for component in components:
+                    if blocked(component):
+                        failed_deps = [d for d in component.depends_on if by_name[d].status != DONE]
+                        component.status = SKIPPED
+                        component.error = f"Skipped because {', '.join(failed_deps)} did not complete."
+                        changed = True
+            for component in components:
+                if len(running) >= max_concurrency:
+                    break
+                if ready(component):
+                    dependency_results = {d: by_name[d].result for d in component.depends_on}
+                    component.status = RUNNING
+                    # In the caller's context, so events from the component reach the caller's ti_events sink
+                    running[ti_events.submit_in_context(executor, _run_one, component, dependency_results)] = component
+            notify()
+
+            if not running:
+                break
+
+            finished, _ = wait(list(running), timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in finished:
+                component = running.pop(future)
+                try:
+                    component.result = future.result()
+                    component.status = DONE
+                except Exception as e:
+                    component.error = f"{type(e).__name__}: {e}"
+                    component.status = FAILED
+
+    return by_name
+
+def critical_path_seconds(components):
+    """Returns the elapsed time of the slowest dependency chain (a lower bound on wall-clock time)."""
+    by_name = {c.name: c for c in components}
+    memo = {}
+    def chain(name):
+        if name not in memo:
+            component = by_name[name]
+            memo[name] = component.elapsed + max((chain(d) for d in component.depends_on), default=0.0)
+        return memo[name]
+    return max((chain(c.name) for c in components), default=0.0)
@@ -0,0 +1,239 @@
+import json
+
+# --- Constants ---
+TTP_TABLE_HEADERS = ["Technique", "Technique ID", "Tactic", "Comment"]
+FIVE_WHATS_HEADERS = ["Question", "Summary"]
+FIVE_WHATS_QUESTIONS = ("What?", "When?", "Where?", "Who?", "How?", "Why?", "So what?", "What is next?", "References")
+NOT_APPLICABLE = "NON APPLICABLE"
+
+# --- JSON Schemas ---
+# Written for OpenAI strict structured outputs: every property is required and no extra keys are
+# allowed. Providers without schema support get the same schema in the prompt (see ti_llm).
+
+IOC_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "iocs": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "indicator": {"type": "string", "description": "The indicator, refanged (no [.] or hxxp)."},
+                    "type": {"type": "string", "enum": [
+                        "IPv4", "IPv6", "Domain", "URL", "File Hash (MD5)", "File Hash (SHA1)", "File Hash (SHA256)",
+                        "Email Address", "CVE", "File Path", "Registry Key",
+                    ]},
+                    "description": {"type": "string", "description": "What the indicator is used for, according to the text."},
+                },
+                "required": ["indicator", "type", "description"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["iocs"],
+    "additionalProperties": False,
+}
+
+TTP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "ttps": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "technique": {"type": "string", "description": "ATT&CK technique (or sub-technique) name."},
+                    "technique_id": {"type": "string", "description": "ATT&CK ID, e.g. T1059.001."},
+                    "tactic": {"type": "string", "description": "ATT&CK Enterprise tactic name."},
+                    "comment": {"type": "string", "description": "How the technique is used, according to the text."},
+                },
+                "required": ["technique", "technique_id", "tactic", "comment"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["ttps"],
+    "additionalProperties": False,
+}
+
+FIVE_WHATS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answers": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string", "enum": list(FIVE_WHATS_QUESTIONS)},
+                    "summary": {"type": "string", "description": f"The answer, or '{NOT_APPLICABLE}' if the text does not say."},
+                },
+                "required": ["question", "summary"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["answers"],
+    "additionalProperties": False,
+}
+
+RELEVANCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "is_cybersecurity": {"type": "boolean", "description": "True if the text is primarily about cybersecurity or threat intelligence."},
+        "main_topic": {"type": "string", "description": "The main topic of the text, in a few words."},
+    },
+    "required": ["is_cybersecurity", "main_topic"],
+    "additionalProperties": False,
+}
+
+# Artifacts of a fused extraction: session_state key -> (JSON property, property schema)
+FUSED_ARTIFACT_PROPERTIES = {
+    "relevance": ("relevance", RELEVANCE_SCHEMA),
+    "summary": ("summary", {"type": "string", "description": "Markdown summary of the report."}),
+    "iocs_df": ("iocs", IOC_SCHEMA["properties"]["iocs"]),
+    "ttptable": ("ttps", TTP_SCHEMA["properties"]["ttps"]),
+    "5whats": ("five_whats", FIVE_WHATS_SCHEMA["properties"]["answers"]),
+}
+
+def fused_schema(artifacts):
+    """JSON schema of a fused extraction returning the given artifacts (keys of FUSED_ARTIFACT_PROPERTIES)."""
+    properties = {FUSED_ARTIFACT_PROPERTIES[name][0]: FUSED_ARTIFACT_PROPERTIES[name][1] for name in artifacts}
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+def _markdown_cell(value):
+    """Escapes a value for a Markdown table cell (pipes and line breaks would split the row)."""
+    return " ".join(str(value or "").split()).replace("|", "\\|")
+
+def _markdown_table(headers, rows):
+    lines = ["| " + " | ".join(headers) + " |", "|" + "|".join("---" for _ in headers) + "|"]
+    lines += ["| " + " | ".join(_markdown_cell(cell) for cell in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+# --- Typed Results ---
+
+class TTPEntry:
+    """One row of the TTPs overview table."""
+    def __init__(self, technique, technique_id, tactic, comment=""):
+        self.technique = technique
+        self.technique_id = technique_id
+        self.tactic = tactic
+        self.comment = comment
+
+    def to_row(self):
+        return [self.technique, self.technique_id, self.tactic, self.comment]
+
+    def __repr__(self):
+        return f"TTPEntry({self.technique_id!r}, {self.technique!r}, tactic={self.tactic!r})"
+
+class TTPTable:
+    """
+    The TTPs overview table as typed rows.
+
+    str() returns the Markdown table, so prompts that embed the table (TTP list, Navigator layer)
+    and code written for the Markdown version keep working unchanged.
+    """
+    headers = TTP_TABLE_HEADERS
+
+    def __init__(self, entries=None):
+        self.entries = list(entries or [])
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds the table from a TTP_SCHEMA object; rows without a technique name or ID are skipped."""
+        entries = []
+        for item in (data or {}).get("ttps") or []:
+            technique = str(item.get("technique") or "").strip()
+            technique_id = str(item.get("technique_id") or "").strip().upper()
+            if not (technique or technique_id):
+                continue
+            entries.append(TTPEntry(technique, technique_id, str(item.get("tactic") or "").strip(), str(item.get("comment") or "").strip()))
+        return cls(entries)
+
+    def to_dict(self):
+        """The table as a TTP_SCHEMA object (the inverse of from_dict)."""
+        return {"ttps": [{"technique": e.technique, "technique_id": e.technique_id, "tactic": e.tactic, "comment": e.comment}
+                         for e in self.entries]}
+
+    def technique_ids(self):
+        return [entry.technique_id for entry in self.entries if entry.technique_id]
+
+    def to_rows(self):
+        """Header row followed by one row per technique, as ti_pdf.parse_markdown_table would return."""
+        return [list(self.headers)] + [entry.to_row() for entry in self.entries]
+
+    def to_markdown(self):
+        return _markdown_table(self.headers, [entry.to_row() for entry in self.entries])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return self.to_markdown()
+
+    def __repr__(self):
+        return f"TTPTable({len(self.entries)} techniques)"
+
+class FiveWhatsAnswer:
+    """One question of the 5 Whats threat scope report and its answer."""
+    def __init__(self, question, summary):
+        self.question = question
+        self.summary = summary
+
+    @property
+    def is_applicable(self):
+        return bool(self.summary) and self.summary.strip().upper() != NOT_APPLICABLE
+
+    def to_row(self):
+        return [self.question, self.summary]
+
+    def __repr__(self):
+        return f"FiveWhatsAnswer({self.question!r})"
+
+class FiveWhatsReport:
+    """The 5 Whats threat scope report, in FIVE_WHATS_QUESTIONS order. str() returns the Markdown table."""
+    headers = FIVE_WHATS_HEADERS
+
+    def __init__(self, answers=None):
+        self.answers = list(answers or [])
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds the report from a FIVE_WHATS_SCHEMA object; missing questions are marked not applicable."""
+        by_question = {}
+        for item in (data or {}).get("answers") or []:
+            question = str(item.get("question") or "").strip()
+            if question and question not in by_question:
+                by_question[question] = str(item.get("summary") or "").strip() or NOT_APPLICABLE
+        answers = [FiveWhatsAnswer(question, by_question.pop(question, NOT_APPLICABLE)) for question in FIVE_WHATS_QUESTIONS]
+        answers += [FiveWhatsAnswer(question, summary) for question, summary in by_question.items()]
+        return cls(answers)
+
+    def to_dict(self):
+        """The report as a FIVE_WHATS_SCHEMA object (the inverse of from_dict)."""
+        return {"answers": [{"question": a.question, "summary": a.summary} for a in self.answers]}
+
+    def get(self, question):
+        for answer in self.answers:
+            if answer.question == question:
+                return answer.summary
+        return None
+
+    def to_rows(self):
+        return [list(self.headers)] + [answer.to_row() for answer in self.answers]
+
+    def to_markdown(self):
+        return _markdown_table(self.headers, [answer.to_row() for answer in self.answers])
+
+    def __len__(self):
+        return len(self.answers)
+
+    def __str__(self):
+        return self.to_markdown()
+
+    def __repr__(self):
+        return f"FiveWhatsReport({sum(a.is_applicable for a in self.answers)}/{len(self.answers)} answered)"
+
+def schema_instructions(schema):
+    """Prompt text describing the expected JSON, for providers that only offer a generic JSON mode."""
+    return ("Respond with a single JSON object and nothing else (no Markdown, no code fences). "
+            f"It must match this JSON schema: {json.dumps(schema)}")
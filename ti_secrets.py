@@ -0,0 +1,25 @@
+import os
+import sys
+
+# API keys and settings for the library modules, without importing Streamlit: when the Streamlit app
+# is the host (streamlit is already imported), values come from st.secrets["api_keys"]; otherwise,
+# and for keys missing there, from environment variables.
+
+def _streamlit_secrets():
+    streamlit = sys.modules.get("streamlit")
+    if streamlit is None:
+        return {}
+    try:
+        return streamlit.secrets.get("api_keys", {})
+    except Exception: # No secrets.toml
+        return {}
+
+def get_secret(name, env_var=None, default=None):
+    """
+    Returns the secret `name`: api_keys.<name> from the app's secrets.toml, else the environment
+    variable `env_var` (default: `name` upper-cased), else `default`.
+    """
+    value = _streamlit_secrets().get(name)
+    if value:
+        return value
+    return os.environ.get(env_var or name.upper(), default)
@@ -1,16 +1,16 @@
 import uuid
 import json
-from stix2 import parse, exceptions, Bundle
 from langsmith import traceable
 from datetime import datetime
-from github import Github
-import streamlit as st
 from uuid import uuid4
+from ti_llm import chat_completion
+from ti_ai import get_model_name
+import ti_events
+import ti_metrics
+from ti_secrets import get_secret
 
-# Model configuration
-OPENAI_MODEL = "gpt-4o-2024-08-06"
 # GitHub credentials
-GITHUB_TOKEN = st.secrets["api_keys"]["github_accesstoken"]
+GITHUB_TOKEN = get_secret("github_accesstoken", "GITHUB_ACCESSTOKEN") # None when not configured; uploads are then unavailable
 REPO_NAME = "format81/ti-mindmap-storage"
 
 # Add UUIDs to 'id' fields in STIX objects, ensuring each object has a unique identifier.
@@ -29,6 +29,7 @@ def validate_stix_objects(stix_objects):
     """
     Validate STIX objects against the STIX 2.1 standard.
     """
+    from stix2 import parse, exceptions # Imported on first use: stix2 is slow to import and only needed here
     all_valid = True
     invalid_objects = []
     for obj in stix_objects:
@@ -73,40 +74,26 @@ def sdo_stix(input_text, client, ai_service_provider, deployment_name=None):
         return "Invalid input parameters."
     
     try:
-        if ai_service_provider == "OpenAI" or ai_service_provider == "Azure OpenAI":
-            # Determine the model based on the service provider
-            model = OPENAI_MODEL if ai_service_provider == "OpenAI" else deployment_name
-        
-            # Make the API call
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt_sdo},
-                    {"role": "user", "content": user_prompt_stix}
-                ],
-            )
-        
-            return response.choices[0].message.content
+        model = get_model_name(ai_service_provider, deployment_name)
+        messages = [
+            {"role": "system", "content": system_prompt_sdo},
+            {"role": "user", "content": user_prompt_stix}
+        ]
+        return chat_completion(client, ai_service_provider, model, messages, budget_text=input_text, component="stix_sdo")
     except Exception as e:
         return f"An error occurred: {e}"
 
 @traceable
-def correct_invalid_stix(input_text, invalid_objects, original_stix):
+def correct_invalid_stix(input_text, invalid_objects, original_stix, client, ai_service_provider, deployment_name=None):
     """
     Ask the LLM to correct invalid STIX output based on the original text and invalid objects.
     """
     try:
-        if ai_service_provider == "OpenAI" or ai_service_provider == "Azure OpenAI":
-            # Determine the model based on the service provider
-            model = OPENAI_MODEL if ai_service_provider == "OpenAI" else deployment_name
-        
-            # Make the API call
-            invalid_output = json.dumps(invalid_objects, indent=4)
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt_sdo},
-                    {
+        model = get_model_name(ai_service_provider, deployment_name)
+        invalid_output = json.dumps(invalid_objects, indent=4)
+        messages = [
+            {"role": "system", "content": system_prompt_sdo},
+            {
                 "role": "user",
                 "content": f"""
 Correct the following invalid STIX objects based on the original text and ensure consistency with the overall STIX data:
@@ -121,10 +108,8 @@ Existing valid STIX data:
 {original_stix}
 """
             }
-                ],
-            )
-        
-            return response.choices[0].message.content
+        ]
+        return chat_completion(client, ai_service_provider, model, messages, budget_text=input_text, component="stix_correction")
     except Exception as e:
         return f"An error occurred: {e}"
 
@@ -156,20 +141,12 @@ def sco_stix(input_text, client, ai_service_provider, deployment_name=None):
         return "Invalid input parameters."
     
     try:
-        if ai_service_provider == "OpenAI" or ai_service_provider == "Azure OpenAI":
-            # Determine the model based on the service provider
-            model = OPENAI_MODEL if ai_service_provider == "OpenAI" else deployment_name
-        
-            # Make the API call
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt_sco},
-                    {"role": "user", "content": user_prompt_stix}
-                ],
-            )
-        
-            return response.choices[0].message.content
+        model = get_model_name(ai_service_provider, deployment_name)
+        messages = [
+            {"role": "system", "content": system_prompt_sco},
+            {"role": "user", "content": user_prompt_stix}
+        ]
+        return chat_completion(client, ai_service_provider, model, messages, budget_text=input_text, component="stix_sco")
     except Exception as e:
         return f"An error occurred: {e}"
     
@@ -199,17 +176,11 @@ def sro_stix(input_text, stix_sdo, stix_sco,client, ai_service_provider, deploym
         return "Invalid input parameters."
     
     try:
-        if ai_service_provider == "OpenAI" or ai_service_provider == "Azure OpenAI":
-            # Determine the model based on the service provider
-            model = OPENAI_MODEL if ai_service_provider == "OpenAI" else deployment_name
-        
-            # Make the API call
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt_sro},
-                    {"role": "user",
-                "content": f"""
+        model = get_model_name(ai_service_provider, deployment_name)
+        messages = [
+            {"role": "system", "content": system_prompt_sro},
+            {"role": "user",
+            "content": f"""
 Generate STIX 2.1 relationship objects (SROs) based on the following:
 
 Input text:
@@ -221,14 +192,122 @@ SDO:
 SCO:
 {stix_sco}
 """
-            }
-        ],
-    )
-        
-            return response.choices[0].message.content
+        }
+        ]
+        return chat_completion(client, ai_service_provider, model, messages, budget_text=input_text, component="stix_sro")
     except Exception as e:
         return f"An error occurred: {e}"
     
+# --- STIX objects from typed results (no LLM call) ---
+
+_IOC_TYPE_TO_SCO = {
+    "IPv4": ("ipv4-addr", "value"),
+    "IPv6": ("ipv6-addr", "value"),
+    "Domain": ("domain-name", "value"),
+    "URL": ("url", "value"),
+    "Email Address": ("email-addr", "value"),
+    "Registry Key": ("windows-registry-key", "key"),
+}
+_IOC_HASH_ALGORITHMS = {"File Hash (MD5)": "MD5", "File Hash (SHA1)": "SHA-1", "File Hash (SHA256)": "SHA-256"}
+
+def _stix_timestamp():
+    return datetime.utcnow().isoformat(timespec="milliseconds") + "Z"
+
+def ttp_table_to_stix(ttp_table):
+    """
+    Builds attack-pattern SDOs from a ti_schemas.TTPTable, referencing MITRE ATT&CK by technique ID.
+    """
+    now = _stix_timestamp()
+    objects = []
+    for entry in ttp_table.entries:
+        attack_pattern = {
+            "type": "attack-pattern",
+            "spec_version": "2.1",
+            "id": f"attack-pattern--{uuid4()}",
+            "created": now,
+            "modified": now,
+            "name": entry.technique or entry.technique_id,
+        }
+        if entry.comment:
+            attack_pattern["description"] = entry.comment
+        if entry.technique_id:
+            attack_pattern["external_references"] = [{
+                "source_name": "mitre-attack",
+                "external_id": entry.technique_id,
+                "url": f"https://attack.mitre.org/techniques/{entry.technique_id.replace('.', '/')}/",
+            }]
+        if entry.tactic:
+            attack_pattern["kill_chain_phases"] = [{"kill_chain_name": "mitre-attack", "phase_name": "-".join(entry.tactic.lower().split())}]
+        objects.append(attack_pattern)
+    return objects
+
+def ioc_dataframe_to_stix(ioc_dataframe):
+    """
+    Builds STIX objects from an IOC table (see ti_ioc): SCOs for network, file and registry
+    indicators and vulnerability SDOs for CVEs. Unknown types are skipped.
+
+    Returns:
+        tuple: (list of SDOs, list of SCOs)
+    """
+    now = _stix_timestamp()
+    sdos, scos = [], []
+    for indicator, ioc_type in zip(ioc_dataframe["Indicator"], ioc_dataframe["Type"]):
+        if not indicator:
+            continue
+        if ioc_type in _IOC_TYPE_TO_SCO:
+            object_type, property_name = _IOC_TYPE_TO_SCO[ioc_type]
+            scos.append({"type": object_type, "spec_version": "2.1", "id": f"{object_type}--{uuid4()}", property_name: indicator})
+        elif ioc_type in _IOC_HASH_ALGORITHMS:
+            scos.append({"type": "file", "spec_version": "2.1", "id": f"file--{uuid4()}",
+                         "hashes": {_IOC_HASH_ALGORITHMS[ioc_type]: indicator}})
+        elif ioc_type == "File Path":
+            scos.append({"type": "file", "spec_version": "2.1", "id": f"file--{uuid4()}",
+                         "name": indicator.replace("\\", "/").rstrip("/").rsplit("/", 1)[-1]})
+        elif ioc_type == "CVE":
+            sdos.append({"type": "vulnerability", "spec_version": "2.1", "id": f"vulnerability--{uuid4()}",
+                         "created": now, "modified": now, "name": indicator,
+                         "external_references": [{"source_name": "cve", "external_id": indicator}]})
+    return sdos, scos
+
+def merge_stix_objects(generated_objects, typed_objects):
+    """Replaces the generated objects of every type present in `typed_objects` with the typed ones."""
+    replaced_types = {obj["type"] for obj in typed_objects}
+    return [obj for obj in generated_objects if obj.get("type") not in replaced_types] + list(typed_objects)
+
+def generate_stix_bundle(input_text, client, ai_service_provider, deployment_name=None, ttp_table=None, ioc_dataframe=None):
+    """
+    Generates a STIX 2.1 bundle without the UI: SDOs, SCOs and SROs as in the STIX tab.
+
+    Objects that can be built from typed results (attack patterns from a TTPTable, SCOs and
+    vulnerabilities from an IOC DataFrame) are built directly instead of being generated.
+
+    Returns:
+        str: The bundle JSON.
+
+    Raises:
+        ValueError: If the generated SDOs, SCOs or SROs are not valid JSON.
+    """
+    typed_sdos, typed_scos = [], []
+    if ttp_table is not None and hasattr(ttp_table, "entries"):
+        typed_sdos += ttp_table_to_stix(ttp_table)
+    if ioc_dataframe is not None and not ioc_dataframe.empty:
+        ioc_sdos, typed_scos = ioc_dataframe_to_stix(ioc_dataframe)
+        typed_sdos += ioc_sdos
+
+    def generated(label, json_str):
+        try:
+            return add_uuid_to_ids(json.loads(json_str))
+        except (TypeError, json.JSONDecodeError) as e:
+            raise ValueError(f"Generated {label} are not valid JSON: {e}. Raw: {str(json_str)[:200]}") from e
+
+    sdo_list = merge_stix_objects(generated("SDOs", sdo_stix(input_text, client, ai_service_provider, deployment_name)), typed_sdos)
+    sco_list = typed_scos or generated("SCOs", sco_stix(input_text, client, ai_service_provider, deployment_name))
+    sro_list = []
+    if sdo_list and sco_list:
+        sro_list = generated("SROs", sro_stix(input_text, json.dumps(sdo_list, indent=4), json.dumps(sco_list, indent=4),
+                                             client, ai_service_provider, deployment_name))
+    return create_stix_bundle(sdo_list, sco_list, sro_list)
+
 def remove_brackets(text):
     """
     Remove leading '[' and trailing ']' and format inner objects into a valid JSON array.
@@ -280,8 +359,7 @@ def upload_to_github_stix(stix_bundle):
     Returns:
     str: The raw URL of the uploaded JSON file.
     """
-    g = Github(GITHUB_TOKEN)
-    repo = g.get_repo(REPO_NAME)
+    from github import Github
     commit_message = "Updated via Streamlit app"
 
     # Generate a unique file name with the current date
@@ -292,20 +370,22 @@ def upload_to_github_stix(stix_bundle):
     # Convert JSON to string
     json_str = json.dumps(stix_bundle, indent=4)
 
-    try:
-        # Get the file contents from GitHub
-        contents = repo.get_contents(file_path_stix)
-        sha = contents.sha
-        # Update the file
-        repo.update_file(contents.path, commit_message, json_str, sha)
-        st.success("File updated successfully.")
-    except:
-        # If file does not exist, create it
-        repo.create_file(file_path_stix, commit_message, json_str)
-        st.success("File created successfully.")
+    with ti_metrics.track(ti_metrics.KIND_GITHUB, "upload_stix_bundle", bytes=len(json_str)):
+        g = Github(GITHUB_TOKEN)
+        repo = g.get_repo(REPO_NAME)
+        try:
+            # Get the file contents from GitHub
+            contents = repo.get_contents(file_path_stix)
+            sha = contents.sha
+            # Update the file
+            repo.update_file(contents.path, commit_message, json_str, sha)
+            ti_events.success("File updated successfully.", source="ti_stix")
+        except:
+            # If file does not exist, create it
+            repo.create_file(file_path_stix, commit_message, json_str)
+            ti_events.success("File created successfully.", source="ti_stix")
 
     # Return the raw URL of the uploaded JSON file
     raw_url = f"https://raw.githubusercontent.com/{REPO_NAME}/main/{file_path_stix}"
-    st.write("URL to STIX 2.1 bundle json file:")
-    st.write(raw_url)
+    ti_events.info(f"URL to STIX 2.1 bundle json file: {raw_url}", source="ti_stix", url=raw_url)
     return raw_url
\ No newline at end of file
@@ -0,0 +1,226 @@
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# --- Constants ---
+# Context windows (prompt + completion) in tokens, matched by longest model-name prefix.
+MODEL_CONTEXT_LIMITS = {
+    "gpt-4.1": 1047576,
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-35-turbo-16k": 16384, # Azure naming
+    "gpt-35-turbo": 4096,      # Azure naming
+    "gpt-3.5-turbo": 16385,
+    "o1": 200000,
+    "o3": 200000,
+    "o4-mini": 200000,
+    "mistral-large": 128000,
+    "mistral-medium": 128000,
+    "mistral-small": 128000,
+    "open-mistral-nemo": 128000,
+    "open-mixtral-8x22b": 64000,
+    "open-mixtral-8x7b": 32000,
+    "open-mistral-7b": 32000,
+    "ministral": 128000,
+    "codestral": 256000,
+}
+DEFAULT_CONTEXT_LIMIT = 32768   # Unknown models and Azure deployments without an override
+DEFAULT_OUTPUT_RESERVE = 4096   # Tokens kept free for the completion when max_tokens is not set
+CHARS_PER_TOKEN_ESTIMATE = 3.0  # Conservative fallback when no tokenizer is available
+MISTRAL_TOKEN_FACTOR = 1.2      # Mistral tokenizers produce more tokens than OpenAI's for the same text
+TOKENS_PER_MESSAGE = 3          # Chat format overhead per message (role + separators)
+TOKENS_PER_REPLY = 3            # Every reply is primed with <|start|>assistant<|message|>
+
+# --- Tokenizers ---
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+def _encoding_for(model):
+    """Returns a tiktoken encoding for the model, or None if tiktoken or its BPE files are unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    name = None
+    try:
+        name = tiktoken.encoding_name_for_model(model or "")
+    except KeyError:
+        name = "o200k_base" if (model or "").startswith(("gpt-4o", "gpt-4.1", "o1", "o3", "o4")) else "cl100k_base"
+    with _encodings_lock:
+        if name not in _encodings:
+            try:
+                _encodings[name] = tiktoken.get_encoding(name)
+            except Exception:
+                _encodings[name] = None # e.g. offline host that cannot download the BPE file
+        return _encodings[name]
+
+def is_mistral_model(model):
+    return any(part in (model or "").lower() for part in ("mistral", "mixtral", "codestral", "ministral", "pixtral"))
+
+def count_tokens(text, model=None):
+    """
+    Counts the tokens in `text` for the given model.
+
+    OpenAI models are counted exactly with tiktoken. Mistral models are estimated from the
+    OpenAI count with a safety factor. Without tiktoken, a conservative characters-per-token
+    estimate is used.
+    """
+    if not text:
+        return 0
+    encoding = _encoding_for(model)
+    if encoding is None:
+        count = int(len(text) / CHARS_PER_TOKEN_ESTIMATE) + 1
+    else:
+        count = len(encoding.encode(text, disallowed_special=()))
+    if is_mistral_model(model):
+        count = int(count * MISTRAL_TOKEN_FACTOR) + 1
+    return count
+
+def is_exact(model):
+    """True if count_tokens is exact for this model rather than an estimate."""
+    return _encoding_for(model) is not None and not is_mistral_model(model)
+
+def count_message_tokens(messages, model=None):
+    """Counts the prompt tokens of a chat message list, including the chat format overhead."""
+    total = TOKENS_PER_REPLY
+    for message in messages:
+        total += TOKENS_PER_MESSAGE + count_tokens(message["role"], model) + count_tokens(message["content"], model)
+    return total
+
+def context_limit(model, override=None):
+    """
+    Returns the context window for a model or deployment name. `override` is a window set by the
+    user (Azure deployment names say nothing about the model); it wins when given.
+    """
+    if override:
+        return int(override)
+    name = (model or "").lower()
+    best = None
+    for prefix in MODEL_CONTEXT_LIMITS:
+        if name.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return MODEL_CONTEXT_LIMITS[best] if best else DEFAULT_CONTEXT_LIMIT
+
+def truncate_to_tokens(text, max_tokens, model=None):
+    """Returns the longest prefix of `text` that fits in `max_tokens` tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding_for(model)
+    if encoding is not None:
+        limit = max_tokens
+        if is_mistral_model(model):
+            limit = int(max_tokens / MISTRAL_TOKEN_FACTOR)
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= limit:
+            return text
+        return encoding.decode(tokens[:limit])
+    max_chars = int(max_tokens * CHARS_PER_TOKEN_ESTIMATE)
+    if is_mistral_model(model):
+        max_chars = int(max_chars / MISTRAL_TOKEN_FACTOR)
+    return text[:max_chars]
+
+# --- Budgeting ---
+
+class BudgetReports:
+    """The budget reports of one analysis run, the latest per component."""
+    def __init__(self):
+        self._reports = {}
+        self._lock = threading.Lock()
+
+    def add(self, report):
+        with self._lock:
+            self._reports[report["component"]] = report
+
+    def get(self, components=None):
+        with self._lock:
+            if components is None:
+                return dict(self._reports)
+            return {name: self._reports[name] for name in components if name in self._reports}
+
+    def __repr__(self):
+        return f"BudgetReports({len(self._reports)} components)"
+
+_current_reports = contextvars.ContextVar("ti_tokens_budget_reports", default=None)
+
+def set_budget_reports(reports):
+    """Makes `reports` receive the budget reports made in the current context (thread or task); returns a token for reset_budget_reports."""
+    return _current_reports.set(reports)
+
+def reset_budget_reports(token):
+    _current_reports.reset(token)
+
+@contextmanager
+def collect_budget_reports():
+    """Records the budget reports made inside the `with` block (in this context) into a new BudgetReports."""
+    reports = BudgetReports()
+    token = set_budget_reports(reports)
+    try:
+        yield reports
+    finally:
+        reset_budget_reports(token)
+
+def fit_messages(messages, model, text, max_output_tokens=None, component=None, context_window=None):
+    """
+    Trims `text` inside `messages` so the whole request fits the model's context window.
+
+    `text` is the (long) source text embedded in one or more of the messages; the rest of the
+    prompt (system prompt, few-shot examples, other inputs) is kept intact.
+
+    Args:
+        messages (list[dict]): The exact message list the caller is about to send.
+        model (str): Model or deployment name, used for the tokenizer and the context limit.
+        text (str): The part of the prompt that may be shortened.
+        max_output_tokens (int, optional): Completion tokens to reserve (defaults to DEFAULT_OUTPUT_RESERVE).
+        component (str, optional): Name under which the budget report is recorded in the active
+            BudgetReports of this context (see set_budget_reports).
+        context_window (int, optional): The user's context window for the deployment (see context_limit).
+
+    Returns:
+        tuple: (messages to send, budget report dict)
+    """
+    limit = context_limit(model, context_window)
+    reserve = min(max_output_tokens or DEFAULT_OUTPUT_RESERVE, limit // 4)
+    occurrences = sum(m["content"].count(text) for m in messages) if text else 0
+
+    text_tokens = count_tokens(text, model) if occurrences else 0
+    if occurrences:
+        without_text = [{"role": m["role"], "content": m["content"].replace(text, "")} for m in messages]
+        overhead = count_message_tokens(without_text, model)
+    else:
+        overhead = count_message_tokens(messages, model)
+    prompt_tokens = overhead + occurrences * text_tokens
+
+    kept_text_tokens = text_tokens
+    fitted = messages
+    if occurrences and prompt_tokens + reserve > limit:
+        allowed = max(0, (limit - reserve - overhead) // occurrences)
+        trimmed_text = truncate_to_tokens(text, allowed, model)
+        fitted = [{"role": m["role"], "content": m["content"].replace(text, trimmed_text)} for m in messages]
+        kept_text_tokens = count_tokens(trimmed_text, model)
+        prompt_tokens = overhead + occurrences * kept_text_tokens
+
+    report = {
+        "component": component,
+        "model": model,
+        "context_limit": limit,
+        "prompt_tokens": prompt_tokens,
+        "reserved_output_tokens": reserve,
+        "input_tokens": text_tokens,
+        "kept_input_tokens": kept_text_tokens,
+        "trimmed": kept_text_tokens < text_tokens,
+        "exact": is_exact(model),
+    }
+    reports = _current_reports.get()
+    if component and reports is not None:
+        reports.add(report)
+    return fitted, report
+
+def get_budget_reports(components=None):
+    """Returns the latest budget report per component of this context's run (optionally only for the given names)."""
+    reports = _current_reports.get()
+    return reports.get(components) if reports is not None else {}
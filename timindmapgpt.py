@@ -1,6 +1,4 @@
 import requests
-from bs4 import BeautifulSoup
-from openai import OpenAI, AzureOpenAI # Combined imports
 import streamlit as st
 from streamlit.components.v1 import html as st_html # Alias to avoid conflict
 import pandas as pd
@@ -10,31 +8,41 @@ import json
 from uuid import uuid4
 import datetime # For PDF filename timestamp
 import time
-
-# --- NEW IMPORTS for PDF and text input ---
-import PyPDF2 # For PDF text extraction
-import io      # For handling uploaded file bytes
-# --- END NEW IMPORTS ---
+import itertools
 
 # Custom module imports
 from ti_mermaid import mermaid_timeline_graph, mermaid_chart_png # Assuming markmap_to_html_with_png is used if selected
 from ti_mermaid_live import genPakoLink
 from ti_ai import (
-    ai_check_content_relevance, ai_extract_iocs, ai_get_response,
+    ai_get_response,
     ai_process_text, ai_run_models_tweet, ai_summarise,
     ai_summarise_tweet, ai_run_models, ai_run_models_markmap,
-    ai_ttp, ai_ttp_graph_timeline, ai_ttp_list
+    ai_ttp, ai_ttp_graph_timeline, ai_ttp_list, get_model_name,
+    ai_fused_extraction
 )
-import ti_pdf
+# ti_pdf (reportlab), PyGithub and streamlit_markmap are imported where they are first used, so a
+# session only loads them when it builds a PDF, uploads to GitHub or shows a Markmap.
+# See benchmarks/bench_import_time.py.
 # import ti_mermaid # Already imported specific functions
 import ti_navigator
 import ti_5whats
 import ti_stix
-from mistralai.client import MistralClient
-from github import Github
-from markdownify import markdownify as md_markdownify # Alias to avoid conflict if any
+import ti_scheduler
+import ti_cache
+import ti_llm
+import ti_tokens
+import ti_ratelimit
+import ti_longdoc
+import ti_relevance
+import ti_ioc
+import ti_schemas
+import ti_events
+import ti_metrics
+import ti_feeds
+import ti_dedup
+from ti_ingest import scrape_text, extract_pdf # Source ingestion, shared with ti_batch
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-from streamlit_markmap import markmap # For Markmap visualization
 # import streamlit.components.v1 as components # Already imported st_html for components.v1.html
 
 # --- Constants and Configuration ---
@@ -46,75 +54,55 @@ STATIC_DIR = './static'
 if not os.path.exists(STATIC_DIR):
     os.makedirs(STATIC_DIR)
 
-# --- Helper Functions ---
-def scrape_text(url):
-    """Scrapes text from a URL and converts to Markdown."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9,it;q=0.8",
-        "Accept-Encoding": "gzip, deflate, br",
-        "DNT": "1",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-        "Sec-Fetch-Dest": "document",
-        "Sec-Fetch-Mode": "navigate",
-        "Sec-Fetch-Site": "none",
-        "Sec-Fetch-User": "?1",
-        "Cache-Control": "max-age=0",
-    }
-    
-    try:
-        time.sleep(1)
-        
-        response = requests.get(url, headers=headers, timeout=20, allow_redirects=True)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, "html.parser")
-        main_content = soup.find('main') or soup.body
-        if main_content:
-            # Convert to Markdown
-            text = md_markdownify(str(main_content), heading_style='atx', bullets='-', 
-                                code_language_callback=lambda el: el.get('class', [None])[0])
-            return text
-        return "Could not extract main content from the page."
-        
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 403:
-            return f"Access denied (403): The website blocked the request. Try a different URL or contact the site administrator."
-        return f"HTTP Error {e.response.status_code}: {e}"
-    except requests.exceptions.Timeout:
-        return f"Failed to scrape the website: Request timed out for URL {url}"
-    except requests.exceptions.RequestException as e:
-        return f"Failed to scrape the website: {e}"
-
-def extract_text_from_pdf(uploaded_file_bytes):
-    """Extracts text from an uploaded PDF file's bytes."""
-    try:
-        pdf_file_object = io.BytesIO(uploaded_file_bytes)
-        pdf_reader = PyPDF2.PdfReader(pdf_file_object)
-        text = ""
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            page_text = page.extract_text()
-            if page_text: # Ensure text was actually extracted
-                text += page_text + "\n" # Add a newline after each page's text
-        
-        if not text.strip():
-            return "Could not extract any text from the PDF. The PDF might be image-based (requiring OCR, which is not implemented) or protected.", None
-        # We return raw text. If Markdown conversion is needed, it can be done selectively later.
-        return text, None # Return raw text and no error
-    except Exception as e:
-        return None, f"Failed to process PDF: {str(e)}"
+# --- Library Events ---
+class StreamlitSink(ti_events.EventSink):
+    """
+    Shows diagnostics from the ti_* modules with st.error/st.warning/st.success/st.info.
 
-def add_mermaid_theme(mermaid_code, selected_theme_name):
-    """Adds a Mermaid theme to the given Mermaid code."""
+    Streamlit elements can only be written from the script thread, so events emitted by component
+    worker threads are queued and shown by flush() once the components have finished.
+    """
+    def __init__(self):
+        self.pending = ti_events.CollectingSink()
+
+    def handle(self, event):
+        if get_script_run_ctx() is None:
+            self.pending.handle(event)
+        else:
+            render_event(event)
+
+    def flush(self):
+        for event in self.pending.drain():
+            render_event(event)
+
+def render_event(event):
+    render = {ti_events.ERROR: st.error, ti_events.WARNING: st.warning, ti_events.SUCCESS: st.success, ti_events.INFO: st.info}.get(event.level)
+    if render:
+        render(event.message)
+
+# One sink per script run (each session runs in its own thread, and the sink is set for this thread only)
+ui_events = StreamlitSink()
+ti_events.set_sink(ui_events)
+
+# --- Helper Functions ---
+def mermaid_theme_directive(selected_theme_name):
+    """Returns the Mermaid init directive line for the selected theme."""
     theme_map = {
         'Default': 'default', 'Neutral': 'neutral', 'Dark': 'dark',
         'Forest': 'forest', 'Custom': 'base' # 'base' for custom, can be expanded
     }
     theme = theme_map.get(selected_theme_name, 'default')
-    return f"%%{{ init: {{'theme': '{theme}'}}}}%%\n{mermaid_code}"
+    return f"%%{{ init: {{'theme': '{theme}'}}}}%%\n"
+
+def add_mermaid_theme(mermaid_code, selected_theme_name):
+    """Adds a Mermaid theme to the given Mermaid code."""
+    return f"{mermaid_theme_directive(selected_theme_name)}{mermaid_code}"
+
+def with_mermaid_theme(mindmap_output, selected_theme_name):
+    """Adds the theme to a generated mindmap, whether it is a complete string or a stream of chunks."""
+    if isinstance(mindmap_output, str):
+        return add_mermaid_theme(mindmap_output, selected_theme_name)
+    return itertools.chain([mermaid_theme_directive(selected_theme_name)], mindmap_output)
 
 def upload_to_github(json_content_dict, file_prefix="mitre-navigator"):
     """Uploads JSON content to GitHub and returns the raw URL."""
@@ -122,20 +110,22 @@ def upload_to_github(json_content_dict, file_prefix="mitre-navigator"):
         st.error("GitHub token not configured in secrets. Cannot upload.")
         return None
     try:
-        g = Github(GITHUB_TOKEN)
-        repo = g.get_repo(REPO_NAME)
+        from github import Github
         commit_message = "Updated via TI-Mindmap-GPT Streamlit app"
         unique_id = str(uuid4())
         file_path = f"{file_prefix}/{unique_id}.json"
         json_str = json.dumps(json_content_dict, indent=4)
 
-        try:
-            contents = repo.get_contents(file_path)
-            repo.update_file(contents.path, commit_message, json_str, contents.sha)
-            st.success(f"GitHub: File '{file_path}' updated successfully.")
-        except Exception: # Broad exception for file not found or other issues
-            repo.create_file(file_path, commit_message, json_str)
-            st.success(f"GitHub: File '{file_path}' created successfully.")
+        with ti_metrics.track(ti_metrics.KIND_GITHUB, f"upload_{file_prefix}", bytes=len(json_str)):
+            g = Github(GITHUB_TOKEN)
+            repo = g.get_repo(REPO_NAME)
+            try:
+                contents = repo.get_contents(file_path)
+                repo.update_file(contents.path, commit_message, json_str, contents.sha)
+                st.success(f"GitHub: File '{file_path}' updated successfully.")
+            except Exception: # Broad exception for file not found or other issues
+                repo.create_file(file_path, commit_message, json_str)
+                st.success(f"GitHub: File '{file_path}' created successfully.")
         
         raw_url = f"https://raw.githubusercontent.com/{REPO_NAME}/main/{file_path}"
         st.info(f"URL to JSON file on GitHub: {raw_url}")
@@ -144,11 +134,107 @@ def upload_to_github(json_content_dict, file_prefix="mitre-navigator"):
         st.error(f"Failed to upload to GitHub: {e}")
         return None
 
+COMPONENT_STATUS_ICONS = {
+    ti_scheduler.PENDING: "⏳", ti_scheduler.RUNNING: "🔄", ti_scheduler.DONE: "✅",
+    ti_scheduler.FAILED: "❌", ti_scheduler.SKIPPED: "⏭️",
+}
+
+def render_component_progress(placeholder, components):
+    """Renders one status line per report component into a Streamlit placeholder."""
+    lines = []
+    for component in components:
+        icon = COMPONENT_STATUS_ICONS.get(component.status, "")
+        timing = f" ({component.elapsed:.1f}s)" if component.started_at is not None else ""
+        if component.time_to_first_chunk is not None:
+            timing += f", first tokens after {component.time_to_first_chunk:.1f}s"
+        lines.append(f"{icon} **{component.label}** — {component.status}{timing}")
+    placeholder.markdown("  \n".join(lines))
+
+def render_streamed_output(placeholders, components):
+    """Shows the text streamed so far for each running streaming component."""
+    for component in components:
+        placeholder = placeholders.get(component.name)
+        if placeholder is None:
+            continue
+        if component.status != ti_scheduler.RUNNING:
+            placeholder.empty() # Final output is rendered in the report section below
+        elif component.partial:
+            with placeholder.container():
+                st.markdown(f"**{component.label}** _(streaming...)_")
+                if component.name == "mindmap_code":
+                    st.code(component.partial_text, language='mermaid' if st.session_state.selected_mindmap_option == "Mermaid" else 'markdown')
+                else:
+                    st.markdown(component.partial_text)
+
+def fused_or_fallback(results, name, fallback):
+    """Returns artifact `name` of the fused extraction, or runs `fallback` (the separate call) if it is missing."""
+    fused = results.get("fused_artifacts")
+    if isinstance(fused, dict) and name in fused:
+        return fused[name]
+    return fallback()
+
+def render_token_budgets(budgets):
+    """Shows how much of each component's context window the last generation used."""
+    if not budgets:
+        return
+    trimmed = [name for name, report in budgets.items() if report["trimmed"]]
+    with st.expander(f"Token budget per component ({len(trimmed)} trimmed)" if trimmed else "Token budget per component", expanded=bool(trimmed)):
+        rows = [{
+            "Component": name,
+            "Model": report["model"],
+            "Prompt tokens": report["prompt_tokens"],
+            "Reserved for output": report["reserved_output_tokens"],
+            "Context window": report["context_limit"],
+            "Input kept": f"{report['kept_input_tokens']:,} / {report['input_tokens']:,}",
+            "Counting": "exact" if report["exact"] else "estimated",
+        } for name, report in budgets.items()]
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+
+@st.cache_resource
+def get_feed_store():
+    """The feed queue, opened once per server process (FeedStore shares one locked connection between threads)."""
+    return ti_feeds.FeedStore()
+
+def start_metrics_run(label):
+    """Starts a new ti_metrics run for the analysis of `label`; the panel in the sidebar shows the current run."""
+    st.session_state.metrics_run = ti_metrics.MetricsRun(label)
+    ti_metrics.set_run(st.session_state.metrics_run)
+
+def render_metrics_panel(run):
+    """Shows the latency, token and cost rollup of a ti_metrics run, with JSON lines and Prometheus exports."""
+    with st.expander("⏱️ Run metrics", expanded=False):
+        if not len(run):
+            st.caption("No calls recorded yet for this analysis.")
+            return
+        totals = run.totals()
+        st.caption(f"**{run.label}**: {totals['llm_calls']} AI calls ({totals['cache_hits']} from cache, {totals['retries']} retries, "
+                   f"{totals['errors']} errors), {totals['prompt_tokens']:,} prompt + {totals['completion_tokens']:,} completion tokens, "
+                   f"~${totals['cost_usd']:.4f}" + (f" ({totals['unpriced_calls']} calls without a known price)" if totals['unpriced_calls'] else "")
+                   + f". {totals['call_seconds']:.1f}s in calls, {totals['queue_seconds']:.1f}s waiting on rate limits.")
+        rows = [{
+            "Kind": row["kind"],
+            "Name": row["name"],
+            "Calls": row["calls"],
+            "Cached": row["cache_hits"],
+            "Errors": row["errors"],
+            "Retries": row["retries"],
+            "Total (s)": round(row["wall_seconds"], 2),
+            "Max (s)": round(row["max_seconds"], 2),
+            "Queued (s)": round(row["queue_seconds"], 2),
+            "Tokens in": row["prompt_tokens"],
+            "Tokens out": row["completion_tokens"],
+            "Cost ($)": round(row["cost_usd"], 5),
+        } for row in run.summary()]
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        st.download_button("📥 Metrics (JSON lines)", data=run.to_jsonl(), file_name="ti_mindmap_metrics.jsonl", mime="application/jsonl")
+        st.download_button("📥 Metrics (Prometheus)", data=ti_metrics.to_prometheus(), file_name="ti_mindmap_metrics.prom", mime="text/plain",
+                           help="Totals of every analysis served by this app instance since it started.")
+
 # --- Session State Initialization ---
 def initialize_session_state():
     defaults = {
         'show_tabs': False,
-        'text': "", # This will hold the (potentially truncated) text for AI processing
+        'text': "", # This will hold the text for AI processing (trimmed per call to the model's context window)
         'full_original_text': "", # This will hold the original full text from any source
         'url4': "", # Stores the source identifier (URL, PDF name, "Pasted Text")
         'chat_history': [],
@@ -157,10 +243,10 @@ def initialize_session_state():
         'summary_tweet': "",
         'mindmap_code': "",
         'tweet_mindmap_code': "", # Initialized for tweet mindmap feature
-        'ttptable': "", # For TTPs overview table (Markdown string)
+        'ttptable': "", # For TTPs overview table (Markdown string, or ti_schemas.TTPTable in structured mode)
         'attackpath': "", # For TTPs ordered by execution time (string)
         'iocs_df': None, # For IOCs DataFrame
-        '5whats': "", # For 5 Whats report string
+        '5whats': "", # For 5 Whats report string (or ti_schemas.FiveWhatsReport in structured mode)
         'stix_sdo': "", 'stix_sco': "", 'stix_sro': "", 'stix_bundle': "", # For STIX data
         'mermaid_timeline': "", # For TTP timeline Mermaid code
         'mitre_layer_json_str': "", # For MITRE layer JSON string
@@ -173,12 +259,28 @@ def initialize_session_state():
         'knowledge_base': None, # For AI Chat
         'knowledge_base_source_text': "", # To track if knowledge base needs update
         'input_source_type': 'URL', # Default input type ('URL', 'PDF', 'Text')
+        'max_concurrency': ti_scheduler.DEFAULT_MAX_CONCURRENCY, # Parallel AI requests in Tab 1
+        'stream_output': True, # Stream summary, mindmap and 5 Whats tokens as they arrive
+        'token_budgets': {}, # Latest ti_tokens budget report per AI call
+        'relevance_decision': None, # ti_relevance.RelevanceDecision of the last Tab 1 run
+        'ioc_extraction_mode': ti_ioc.MODE_LOCAL, # See ti_ioc.EXTRACTION_MODES
+        'llm_cache_enabled': True, # Serve identical AI requests of this session from the shared on-disk cache
+        'structured_output': True, # IOCs, TTP table and 5 Whats as JSON-schema results (ti_schemas) instead of parsed text
+        'fused_extraction': False, # Summary, IOCs, TTP table and 5 Whats from one AI call
+        'long_document_threshold': ti_longdoc.DEFAULT_LONG_DOCUMENT_THRESHOLD, # Tokens above which summary/mindmap use map-reduce
+        'source_page_offsets': None, # Page start offsets of a PDF source's text (section notes cite pages)
+        'long_document_notes': "", # Section notes the summary and mindmap were built from (long documents only)
+        'dedup_document_id': None, # ti_dedup index id of the analyzed text; Tab 1 results are attached to it
+        'duplicate_match': None, # ti_dedup.DuplicateMatch (as a dict) of an earlier analysis of (almost) the same text
+        'metrics_run': ti_metrics.MetricsRun("Session"), # ti_metrics records of the current analysis; each 'Analyze' starts a new run
     }
     for key, value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = value
 
 initialize_session_state()
+# Like the event sink, the metrics run is set for this script run's thread; components inherit it
+ti_metrics.set_run(st.session_state.metrics_run)
 
 # --- Streamlit UI Configuration ---
 st.set_page_config(
@@ -193,6 +295,7 @@ GITHUB_TOKEN = st.secrets.get("api_keys", {}).get(GITHUB_TOKEN_SECRET, "")
 client = None # AI client
 # These will be populated in the sidebar logic
 azure_api_key, azure_endpoint, deployment_name, embedding_deployment_name = "", "", "", ""
+deployment_context_window = None # Context window set for an Azure deployment (None: looked up by name)
 openai_api_key, mistral_api_key, mistral_model_name_input = "", "", ""
 
 
@@ -256,6 +359,12 @@ with st.sidebar:
         embedding_deployment_name_input = st.text_input("Text Embedding Azure deployment name (optional):", key="azure_embedding_input_sidebar")
         deployment_name = deployment_name_input 
         embedding_deployment_name = embedding_deployment_name_input
+        deployment_context_window_input = st.number_input(
+            "Deployment context window (tokens, 0 = detect from name):", min_value=0, value=0, step=1024,
+            key="azure_context_window_input_sidebar",
+            help="Azure deployment names may not reveal the underlying model. Set its context window so long inputs are trimmed correctly."
+        )
+        deployment_context_window = int(deployment_context_window_input) or None # Passed to the provider, per session
         st.caption("Tested with gpt-4, gpt-4-32k, gpt-35-turbo.")
     elif st.session_state.service_selection == "OpenAI":
         openai_api_key = st.text_input("OpenAI API key:", type="password", key="openai_key_input_sidebar")
@@ -267,6 +376,70 @@ with st.sidebar:
         deployment_name = mistral_model_name_input
         st.caption(f"Using MistralAI model: {deployment_name if deployment_name else 'Not specified'}")
 
+    st.session_state.max_concurrency = st.slider(
+        "Max parallel AI requests:", min_value=1, max_value=8,
+        value=st.session_state.max_concurrency,
+        key='max_concurrency_slider_sidebar',
+        help="Independent report components run concurrently up to this limit. Lower it if you hit rate limits."
+    )
+    st.session_state.stream_output = st.checkbox(
+        "Stream AI output as it is generated", value=st.session_state.stream_output,
+        key='stream_output_checkbox_sidebar',
+        help="Summary, mindmap and 5 Whats text appears token by token instead of after the full response."
+    )
+    st.session_state.structured_output = st.checkbox(
+        "Structured AI output (JSON schema)", value=st.session_state.structured_output,
+        key='structured_output_checkbox_sidebar',
+        help="IOCs, the TTP table and the 5 Whats report are returned as JSON and used as-is by the report, PDF and STIX tabs. "
+             "The 5 Whats report is then not streamed."
+    )
+    st.session_state.fused_extraction = st.checkbox(
+        "Fused extraction (one AI call)", value=st.session_state.fused_extraction,
+        key='fused_extraction_checkbox_sidebar',
+        help="Summary, IOCs, TTP table and 5 Whats come from a single structured AI call, so the article is sent once "
+             "instead of once per component. These components are then not streamed."
+    )
+    st.session_state.long_document_threshold = st.number_input(
+        "Long-document mode above (tokens):", min_value=2000, step=1000,
+        value=st.session_state.long_document_threshold,
+        key='long_document_threshold_input_sidebar',
+        help="Longer inputs are split into sections that are summarized in parallel; the summary and mindmap are built from the section notes."
+    )
+    st.session_state.ioc_extraction_mode = st.selectbox(
+        "IOC extraction:", ti_ioc.EXTRACTION_MODES,
+        index=ti_ioc.EXTRACTION_MODES.index(st.session_state.ioc_extraction_mode),
+        key='ioc_extraction_mode_select_sidebar',
+        help="Local: deterministic pattern matching (instant, handles defanged indicators). "
+             "Local + AI: adds indicators and descriptions found by the AI. AI only: the AI builds the table."
+    )
+    st.session_state.llm_cache_enabled = st.checkbox(
+        "Reuse cached AI responses", value=st.session_state.llm_cache_enabled, key='llm_cache_checkbox_sidebar',
+        help="Identical requests (same provider, model and prompt) are answered from a local on-disk cache."
+    )
+    # Per session: the cache is shared by all sessions, so only this script run's context is changed
+    ti_llm.set_cache_enabled(st.session_state.llm_cache_enabled)
+    cache_stats = ti_cache.get_llm_cache().stats()
+    st.caption(f"Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+               f"{cache_stats['entries']} entries ({cache_stats['bytes'] / (1024 * 1024):.1f} MB)")
+    # Quotas are per provider, and per deployment on Azure; all sessions of this server share them
+    rate_limit_model = deployment_name if st.session_state.service_selection == "Azure OpenAI" else None
+    default_rpm, default_tpm = ti_ratelimit.rate_limits_for(st.session_state.service_selection, rate_limit_model)
+    with st.expander("Rate limits", expanded=False):
+        rate_limit_rpm = st.number_input(
+            "Requests per minute:", min_value=1, value=int(default_rpm), step=10,
+            key=f'rate_limit_rpm_input_{st.session_state.service_selection}_sidebar'
+        )
+        rate_limit_tpm = st.number_input(
+            "Tokens per minute:", min_value=1000, value=int(default_tpm), step=10000,
+            key=f'rate_limit_tpm_input_{st.session_state.service_selection}_sidebar',
+            help="Requests are paced to stay under these quotas; 429 and 5xx responses are retried with backoff, honoring Retry-After."
+        )
+        ti_ratelimit.set_rate_limits(st.session_state.service_selection, rate_limit_rpm, rate_limit_tpm, model=rate_limit_model)
+        for limiter_name, limiter_stats in ti_ratelimit.get_rate_limit_stats().items():
+            st.caption(f"{limiter_name}: {limiter_stats['calls']} requests, {limiter_stats['retries']} retries "
+                       f"({limiter_stats['rate_limited']} rate limited), {limiter_stats['throttled_seconds']}s paced")
+    metrics_panel = st.empty() # Filled at the end of the script run, once this run's calls are recorded
+
     st.markdown("---")
     st.header("About")
     st.markdown("This project is a proof of concept... AI-generated content may be incorrect.")
@@ -277,19 +450,22 @@ with st.sidebar:
 
 
 # --- Initialize AI Client ---
+# Providers are long-lived and shared across reruns (see ti_llm.get_provider), so their
+# connection pools stay warm between components and analyses.
 if st.session_state.service_selection == "OpenAI" and openai_api_key:
     try:
-        client = OpenAI(api_key=openai_api_key)
+        client = ti_llm.get_provider("OpenAI", openai_api_key)
     except Exception as e:
         st.sidebar.error(f"OpenAI Client Error: {e}")
         client = None
 elif st.session_state.service_selection == "Azure OpenAI":
     if azure_api_key and azure_endpoint and deployment_name:
         try:
-            client = AzureOpenAI(
-                api_key=azure_api_key,
-                azure_endpoint=azure_endpoint,
-                api_version="2023-05-15" # Use a relevant API version
+            client = ti_llm.get_provider(
+                "Azure OpenAI", azure_api_key,
+                endpoint=azure_endpoint,
+                api_version="2023-05-15", # Use a relevant API version
+                context_window=deployment_context_window
             )
         except Exception as e:
             st.sidebar.error(f"Azure Client Error: {e}")
@@ -297,7 +473,7 @@ elif st.session_state.service_selection == "Azure OpenAI":
 elif st.session_state.service_selection == "MistralAI":
     if mistral_api_key and deployment_name:
         try:
-            client = MistralClient(api_key=mistral_api_key)
+            client = ti_llm.get_provider("MistralAI", mistral_api_key)
         except Exception as e:
             st.sidebar.error(f"MistralAI Client Error: {e}")
             client = None
@@ -315,8 +491,8 @@ if input_source_type_key not in st.session_state: # Initialize if not present
 
 input_source_type_selection = st.radio(
     "Select Input Source:",
-    options=["URL", "PDF Upload", "Text Input"],
-    index=["URL", "PDF Upload", "Text Input"].index(st.session_state[input_source_type_key]),
+    options=["URL", "PDF Upload", "Text Input", "Feed Queue"],
+    index=["URL", "PDF Upload", "Text Input", "Feed Queue"].index(st.session_state[input_source_type_key]),
     key=input_source_type_key, # Use the defined key
     horizontal=True
 )
@@ -324,6 +500,8 @@ st.session_state.input_source_type = input_source_type_selection # Persist selec
 
 source_text_content = "" 
 source_identifier = ""   
+source_page_offsets = None # Page start offsets in the text, for PDF sources
+feed_article_url = None    # Queued feed article, taken off the queue once its analysis starts
 trigger_analysis = False 
 
 if st.session_state.input_source_type == "URL":
@@ -343,6 +521,7 @@ if st.session_state.input_source_type == "URL":
                 st.warning("Please enter a URL to scrape.")
             else:
                 source_identifier = url_input
+                start_metrics_run(source_identifier)
                 with st.spinner(f"Scraping text from {url_input}..."):
                     scraped_data = scrape_text(url_input)
                     if "Failed to scrape" in scraped_data or "Could not extract main content" in scraped_data or not scraped_data.strip():
@@ -367,15 +546,21 @@ elif st.session_state.input_source_type == "PDF Upload":
                 st.warning("Please upload a PDF file.")
             else:
                 source_identifier = f"PDF: {uploaded_pdf_file.name}"
+                start_metrics_run(source_identifier)
                 with st.spinner(f"Extracting text from {uploaded_pdf_file.name}..."):
-                    pdf_bytes = uploaded_pdf_file.getvalue()
-                    extracted_data, error_msg = extract_text_from_pdf(pdf_bytes)
+                    # Cached by the file's SHA-256, so a repeat upload is not parsed again (see ti_pdftext)
+                    extraction, error_msg = extract_pdf(uploaded_pdf_file)
                     if error_msg:
                         st.error(error_msg)
                         source_text_content = ""
+                    elif not extraction.text.strip():
+                        st.error("Could not extract any text from the PDF. The PDF might be image-based (requiring OCR, which is not implemented) or protected.")
+                        source_text_content = ""
                     else:
-                        source_text_content = extracted_data
-                        st.success(f"Successfully extracted text from {uploaded_pdf_file.name}.")
+                        source_text_content = extraction.text
+                        source_page_offsets = extraction.page_offsets
+                        reused_note = " (cached extraction)" if extraction.cached else ""
+                        st.success(f"Successfully extracted text from {uploaded_pdf_file.name}: {extraction.pages_extracted} pages{reused_note}.")
                         with st.expander("Preview Extracted PDF Text (first 2000 characters)", expanded=False):
                             st.text((source_text_content[:2000] + "...") if len(source_text_content) > 2000 else source_text_content)
                         trigger_analysis = True
@@ -398,10 +583,34 @@ elif st.session_state.input_source_type == "Text Input":
                 st.warning("Please paste some text to analyze.")
             else:
                 source_identifier = "Pasted Text Input"
+                start_metrics_run(source_identifier)
                 source_text_content = pasted_text_input
                 st.success("Text input received and ready for analysis.")
                 trigger_analysis = True
 
+elif st.session_state.input_source_type == "Feed Queue":
+    # Articles scraped by the feed crawler (python ti_feeds.py --list feeds.txt), waiting for analysis
+    queued_articles = get_feed_store().queued(limit=200)
+    if not queued_articles:
+        st.info("The feed queue is empty. Run `python ti_feeds.py --list feeds.txt` to fetch new articles from RSS/Atom feeds.")
+    else:
+        with st.form("form_feed_queue_main", clear_on_submit=False):
+            selected_article = st.selectbox(
+                f"Queued articles ({len(queued_articles)}):",
+                options=queued_articles,
+                format_func=lambda article: f"{(article['published'] or '')[:10]} {article['title'] or article['url']}".strip(),
+                key="feed_queue_widget_main"
+            )
+            analyze_feed_button = st.form_submit_button(":newspaper: :orange[**Analyze Article**]")
+            st.caption("*Clicking 'Analyze' clears previous session data and starts a new working session. The article is taken off the queue.*")
+            if analyze_feed_button and selected_article:
+                source_identifier = selected_article['url']
+                start_metrics_run(source_identifier)
+                source_text_content = selected_article['markdown']
+                feed_article_url = selected_article['url']
+                st.success(f"Article from {selected_article['url']} is ready for analysis.")
+                trigger_analysis = True
+
 # --- Central Analysis Trigger ---
 if trigger_analysis and source_text_content:
     if not client:
@@ -410,24 +619,33 @@ if trigger_analysis and source_text_content:
     else:
         st.session_state['full_original_text'] = source_text_content
         st.session_state['url4'] = source_identifier
+        st.session_state['source_page_offsets'] = source_page_offsets
+        if feed_article_url:
+            get_feed_store().mark_analyzed(feed_article_url)
+        # Syndicated copies of an analyzed report are detected here, so Tab 1 can offer the earlier results
+        document_id, duplicate = ti_dedup.check(source_text_content, source_identifier)
+        st.session_state['dedup_document_id'] = document_id
+        st.session_state['duplicate_match'] = duplicate.to_dict() if duplicate is not None and duplicate.has_artifacts else None
 
-        MAX_TEXT_LENGTH_FOR_AI = 250000 
-        if len(source_text_content) > MAX_TEXT_LENGTH_FOR_AI:
+        # No fixed character cut: each AI call trims the text to what fits the model's context window
+        # (see ti_tokens.fit_messages), and the token budget per component is shown in Tab 1.
+        st.session_state['text'] = source_text_content
+        input_tokens = ti_tokens.count_tokens(source_text_content, deployment_name)
+        input_limit = ti_tokens.context_limit(deployment_name, deployment_context_window)
+        if input_tokens > input_limit - ti_tokens.DEFAULT_OUTPUT_RESERVE:
             st.warning(
-                f"The input text is very long ({len(source_text_content):,} characters). "
-                f"To manage processing demands, the analysis will be performed on the first {MAX_TEXT_LENGTH_FOR_AI:,} characters. "
+                f"The input text is very long (~{input_tokens:,} tokens) and exceeds the context window of "
+                f"{deployment_name or 'the selected model'} ({input_limit:,} tokens). Each component will be generated "
+                "from the part of the text that fits its prompt. "
                 "The full original content is available in the 'Original Input Content' tab."
             )
-            st.session_state['text'] = source_text_content[:MAX_TEXT_LENGTH_FOR_AI]
-        else:
-            st.session_state['text'] = source_text_content
         
         toggle_tabs_visibility()
         keys_to_reset = ['summary', 'summary_tweet', 'mindmap_code', 'tweet_mindmap_code',
                          'ttptable', 'attackpath', 'iocs_df', '5whats', 'stix_sdo', 'stix_sco',
                          'stix_sro', 'stix_bundle', 'mermaid_timeline',
                          'mitre_layer_json_str', 'mitre_navigator_raw_url', 'chat_history',
-                         'knowledge_base', 'knowledge_base_source_text']
+                         'knowledge_base', 'knowledge_base_source_text', 'long_document_notes']
         for key in keys_to_reset:
             if key == 'iocs_df':
                 st.session_state[key] = pd.DataFrame()
@@ -458,6 +676,21 @@ if st.session_state.show_tabs:
         if not st.session_state.get('text', "").strip():
             st.info("Please provide content using an input source and click 'Analyze' on the main page.")
         else:
+            duplicate = st.session_state.get('duplicate_match')
+            if duplicate:
+                likeness = "identical to" if duplicate['exact'] else f"{duplicate['similarity']:.0%} similar to"
+                first_seen = datetime.datetime.fromtimestamp(duplicate['created_at']).strftime('%Y-%m-%d')
+                st.info(f"♻️ This content is {likeness} a report analyzed before: {duplicate['source']} (first seen {first_seen}). "
+                        "Its components can be reused instead of generated again.")
+                if st.button("♻️ Reuse earlier analysis", key="reuse_duplicate_analysis_tab1"):
+                    artifacts = ti_dedup.get_index().artifacts(duplicate['document_id'])
+                    for name, value in artifacts.items():
+                        if name in ti_dedup.ARTIFACT_KEYS:
+                            st.session_state[name] = ti_dedup.deserialize_artifact(value)
+                    if st.session_state.dedup_document_id != duplicate['document_id']:
+                        ti_dedup.get_index().attach_artifacts(st.session_state.dedup_document_id, artifacts)
+                    st.session_state.duplicate_match = None
+                    st.rerun()
             with st.form("form_generate_reports_tab1"):
                 st.markdown("Select components to generate based on the processed text:")
                 cols_checkbox = st.columns(2)
@@ -480,68 +713,168 @@ if st.session_state.show_tabs:
                 service_sel = st.session_state.service_selection
                 # global `deployment_name` is used by AI functions
                 
-                with st.spinner("Checking content relevance..."):
-                    relevance_check = ai_check_content_relevance(text_content, client, service_sel, deployment_name)
-                
-                if "not related to cybersecurity" in relevance_check.lower() and "not cti" in relevance_check.lower():
-                    st.warning(f"Content might not be related to cybersecurity. AI classified it as: {relevance_check}")
-                else:
-                    st.success(f"Content appears relevant: {relevance_check}")
-                    mindmap_prompt_prefix = f"Generate a {st.session_state.selected_mindmap_option} MindMap only using the text below:\n"
-                    input_text_for_mindmap = mindmap_prompt_prefix + text_content
+                # Token budgets of this run only: reports are collected per context, not shared between sessions
+                with ti_tokens.collect_budget_reports() as budget_reports:
+                    fused_mode = st.session_state.fused_extraction
+                    # Clear-cut texts are classified locally; only ambiguous ones cost an LLM round trip.
+                    # This also holds in fused mode: the answer must gate the components before any is scheduled.
+                    with st.spinner("Checking content relevance..."):
+                        relevance = ti_relevance.check_content_relevance(text_content, client, service_sel, deployment_name)
+                    st.session_state.relevance_decision = relevance
+                    with st.expander("Relevance check details", expanded=False):
+                        st.json({"label": relevance.label, "source": relevance.source, "confidence": round(relevance.confidence, 3),
+                                 "local_probability": round(relevance.probability, 3), "features": relevance.features})
 
-                    if cb_summary:
-                        with st.spinner("Generating Summary & Main MindMap..."):
-                            st.session_state.summary = ai_summarise(text_content, client, service_sel, selected_lang, deployment_name)
+                    if not relevance.is_relevant:
+                        st.warning(f"Content might not be related to cybersecurity ({relevance.describe()}).")
+                    else:
+                        st.success(f"Content appears relevant ({relevance.describe()}).")
+                        mindmap_prompt_prefix = f"Generate a {st.session_state.selected_mindmap_option} MindMap only using the text below:\n"
+                        input_text_for_mindmap = mindmap_prompt_prefix + text_content
+                        selected_theme = st.session_state.selected_theme_option
+                        existing_ttptable = st.session_state.get('ttptable', "") # Used when the TTP table is not regenerated
+                        stream_output = st.session_state.stream_output
+                        structured_output = st.session_state.structured_output
+                        ioc_mode = st.session_state.ioc_extraction_mode
+                        ai_model = get_model_name(service_sel, deployment_name)
+                        long_document = cb_summary and ti_longdoc.is_long_document(text_content, ai_model, st.session_state.long_document_threshold,
+                                                                                      deployment_context_window)
+
+                        # Fused mode: one structured call produces these artifacts; each component below then
+                        # reads its part (or makes its own call if the fused call failed)
+                        fused_artifacts = []
+                        if fused_mode:
+                            if cb_summary and not long_document: fused_artifacts.append("summary") # Long documents summarize the section notes
+                            if cb_ioc and ioc_mode != ti_ioc.MODE_LOCAL: fused_artifacts.append("iocs_df")
+                            if cb_ttps: fused_artifacts.append("ttptable")
+                            if cb_5whats: fused_artifacts.append("5whats")
+                        fused_dependency = ["fused_artifacts"] if fused_artifacts else []
+
+                        # Component names match the session_state keys their results are stored in.
+                        # `attackpath` and `mitre_layer_json_str` depend on the TTP table; for long documents,
+                        # summary and mindmap depend on the section notes (map-reduce, see ti_longdoc).
+                        Component = ti_scheduler.Component
+                        components = []
+                        if fused_artifacts:
+                            components.append(Component("fused_artifacts", "Fused extraction (" + ", ".join(fused_artifacts) + ")",
+                                lambda r: ai_fused_extraction(text_content, client, service_sel, selected_lang, fused_artifacts, deployment_name)))
+                        if cb_summary:
+                            notes_dependency = []
+                            if long_document:
+                                long_document_threshold = st.session_state.long_document_threshold
+                                section_concurrency = st.session_state.max_concurrency
+                                page_offsets = st.session_state.source_page_offsets
+                                components.append(Component("long_document_notes", "Section notes (long document)",
+                                    lambda r: ti_longdoc.condense_long_document(text_content, client, service_sel, deployment_name,
+                                                                                long_document_threshold, section_concurrency, page_offsets)))
+                                notes_dependency = ["long_document_notes"]
+                            if "summary" in fused_artifacts:
+                                components.append(Component("summary", "Summary",
+                                    lambda r: fused_or_fallback(r, "summary", lambda: ai_summarise(text_content, client, service_sel, selected_lang, deployment_name)),
+                                    depends_on=fused_dependency))
+                            else:
+                                components.append(Component("summary", "Summary",
+                                    lambda r: ai_summarise(r.get("long_document_notes", text_content), client, service_sel, selected_lang, deployment_name, stream=stream_output),
+                                    depends_on=notes_dependency, stream=stream_output))
                             if st.session_state.selected_mindmap_option == "Mermaid":
-                                mm_code = ai_run_models(input_text_for_mindmap, client, selected_lang, service_sel, deployment_name)
-                                st.session_state.mindmap_code = add_mermaid_theme(mm_code, st.session_state.selected_theme_option)
-                            else: 
-                                st.session_state.mindmap_code = ai_run_models_markmap(input_text_for_mindmap, client, selected_lang, service_sel, deployment_name)
-                    
-                    if cb_tweet:
-                        with st.spinner("Generating Tweet & Tweet MindMap..."):
-                            st.session_state.summary_tweet = ai_summarise_tweet(text_content, client, service_sel, selected_lang, deployment_name)
-                            tweet_mm_code = ai_run_models_tweet(input_text_for_mindmap, client, selected_lang, service_sel, deployment_name) 
-                            st.session_state.tweet_mindmap_code = add_mermaid_theme(tweet_mm_code, st.session_state.selected_theme_option)
-
-                    if cb_ioc:
-                        with st.spinner("Extracting IOCs..."):
-                            st.session_state.iocs_df = ai_extract_iocs(text_content, client, service_sel, deployment_name)
-                    
-                    if cb_ttps:
-                        with st.spinner("Extracting TTPs Overview Table..."):
-                            st.session_state.ttptable = ai_ttp(text_content, client, service_sel, deployment_name)
-                    
-                    if cb_ttps_by_time:
-                        with st.spinner("Ordering TTPs by Execution Time..."):
-                            current_ttps_table = st.session_state.get('ttptable', "") 
-                            st.session_state.attackpath = ai_ttp_list(text_content, current_ttps_table, client, service_sel, deployment_name)
-                    
-                    if cb_ttps_timeline:
-                        with st.spinner("Generating TTPs Graphic Timeline..."):
-                            st.session_state.mermaid_timeline = ai_ttp_graph_timeline(text_content, client, service_sel, deployment_name)
-                    
-                    if cb_5whats:
-                        with st.spinner("Generating 5 Whats Report..."):
-                            st.session_state['5whats'] = ti_5whats.ai_fivewhats(text_content, client, service_sel, deployment_name)
-
-                    if cb_navigator:
-                        with st.spinner("Generating MITRE Navigator Layer..."):
-                            current_ttps_table_for_nav = st.session_state.get('ttptable', "")
-                            mitre_json_str = ti_navigator.attack_layer(text_content, current_ttps_table_for_nav, client, service_sel, deployment_name)
-                            st.session_state.mitre_layer_json_str = mitre_json_str
-                            if mitre_json_str and GITHUB_TOKEN: 
-                                try:
-                                    mitre_json_dict = json.loads(mitre_json_str)
-                                    raw_url_nav = upload_to_github(mitre_json_dict, "mitre-navigator")
-                                    st.session_state.mitre_navigator_raw_url = raw_url_nav
-                                except json.JSONDecodeError:
-                                    st.error("Generated MITRE layer is not valid JSON. Cannot upload.")
-                st.success("Selected components generated!")
-                st.markdown("> **Want this automated?** [TI Mindmap Hub](https://ti-mindmap-hub.com/landingpage) generates these reports continuously from 50+ OSINT sources — no manual work required.")
+                                components.append(Component("mindmap_code", "Main MindMap",
+                                    lambda r: with_mermaid_theme(ai_run_models(mindmap_prompt_prefix + r.get("long_document_notes", text_content), client, selected_lang, service_sel, deployment_name, stream=stream_output), selected_theme),
+                                    depends_on=notes_dependency, stream=stream_output))
+                            else:
+                                components.append(Component("mindmap_code", "Main MindMap",
+                                    lambda r: ai_run_models_markmap(mindmap_prompt_prefix + r.get("long_document_notes", text_content), client, selected_lang, service_sel, deployment_name, stream=stream_output),
+                                    depends_on=notes_dependency, stream=stream_output))
+                        if cb_tweet:
+                            components.append(Component("summary_tweet", "Tweet",
+                                lambda r: ai_summarise_tweet(text_content, client, service_sel, selected_lang, deployment_name)))
+                            components.append(Component("tweet_mindmap_code", "Tweet MindMap",
+                                lambda r: add_mermaid_theme(ai_run_models_tweet(input_text_for_mindmap, client, selected_lang, service_sel, deployment_name), selected_theme)))
+                        if cb_ioc and "iocs_df" in fused_artifacts:
+                            components.append(Component("iocs_df", "IOCs",
+                                lambda r: ti_ioc.extract_iocs(text_content, ioc_mode, client, service_sel, deployment_name, structured=True,
+                                                              ai_result=fused_or_fallback(r, "iocs_df", lambda: None)),
+                                depends_on=fused_dependency))
+                        elif cb_ioc:
+                            components.append(Component("iocs_df", "IOCs",
+                                lambda r: ti_ioc.extract_iocs(text_content, ioc_mode, client, service_sel, deployment_name, structured=structured_output)))
+                        if cb_ttps and "ttptable" in fused_artifacts:
+                            components.append(Component("ttptable", "TTPs Overview Table",
+                                lambda r: fused_or_fallback(r, "ttptable", lambda: ai_ttp(text_content, client, service_sel, deployment_name, structured=True)),
+                                depends_on=fused_dependency))
+                        elif cb_ttps:
+                            components.append(Component("ttptable", "TTPs Overview Table",
+                                lambda r: ai_ttp(text_content, client, service_sel, deployment_name, structured=structured_output)))
+                        ttp_dependency = ["ttptable"] if cb_ttps else []
+                        if cb_ttps_by_time:
+                            components.append(Component("attackpath", "TTPs by Execution Time",
+                                lambda r: ai_ttp_list(text_content, r.get("ttptable", existing_ttptable), client, service_sel, deployment_name),
+                                depends_on=ttp_dependency))
+                        if cb_ttps_timeline:
+                            components.append(Component("mermaid_timeline", "TTPs Graphic Timeline",
+                                lambda r: ai_ttp_graph_timeline(text_content, client, service_sel, deployment_name)))
+                        if cb_5whats and "5whats" in fused_artifacts:
+                            components.append(Component("5whats", "5 Whats Report",
+                                lambda r: fused_or_fallback(r, "5whats", lambda: ti_5whats.ai_fivewhats(text_content, client, service_sel, deployment_name, structured=True)),
+                                depends_on=fused_dependency))
+                        elif cb_5whats:
+                            stream_5whats = stream_output and not structured_output
+                            components.append(Component("5whats", "5 Whats Report",
+                                lambda r: ti_5whats.ai_fivewhats(text_content, client, service_sel, deployment_name, stream=stream_5whats, structured=structured_output),
+                                stream=stream_5whats))
+                        if cb_navigator:
+                            components.append(Component("mitre_layer_json_str", "MITRE Navigator Layer",
+                                lambda r: ti_navigator.attack_layer(text_content, r.get("ttptable", existing_ttptable), client, service_sel, deployment_name),
+                                depends_on=ttp_dependency))
+
+                        with st.status(f"Generating {len(components)} components...", expanded=True) as status_box:
+                            progress_placeholder = st.empty()
+                            stream_placeholders = {c.name: st.empty() for c in components if c.stream}
+                            def show_progress(comps):
+                                render_component_progress(progress_placeholder, comps)
+                                render_streamed_output(stream_placeholders, comps)
+                            run_started = time.monotonic()
+                            results = ti_scheduler.run_components(
+                                components,
+                                max_concurrency=st.session_state.max_concurrency,
+                                on_progress=show_progress
+                            )
+                            wall_time = time.monotonic() - run_started
+                            status_box.update(
+                                label=f"Generated {len(components)} components in {wall_time:.1f}s "
+                                      f"(slowest dependency chain: {ti_scheduler.critical_path_seconds(components):.1f}s)",
+                                state="complete", expanded=False
+                            )
+                        ui_events.flush()
+
+                        for name, component in results.items():
+                            if name == "fused_artifacts":
+                                continue # Split into the components above
+                            if component.status == ti_scheduler.DONE:
+                                st.session_state[name] = component.result
+                            else:
+                                st.error(f"{component.label} was not generated: {component.error}")
+                        fused_result = results["fused_artifacts"].result if "fused_artifacts" in results else None
+                        if isinstance(fused_result, str):
+                            st.warning(f"{fused_result}. The components were generated with separate calls instead.")
+                        st.session_state.token_budgets = budget_reports.get()
+                        if st.session_state.get('dedup_document_id') is not None:
+                            ti_dedup.get_index().attach_artifacts(st.session_state.dedup_document_id, {
+                                name: ti_dedup.serialize_artifact(component.result) for name, component in results.items()
+                                if name in ti_dedup.ARTIFACT_KEYS and component.status == ti_scheduler.DONE})
+
+                        mitre_json_str = st.session_state.get('mitre_layer_json_str', "")
+                        if cb_navigator and mitre_json_str and GITHUB_TOKEN:
+                            try:
+                                mitre_json_dict = json.loads(mitre_json_str)
+                                raw_url_nav = upload_to_github(mitre_json_dict, "mitre-navigator")
+                                st.session_state.mitre_navigator_raw_url = raw_url_nav
+                            except json.JSONDecodeError:
+                                st.error("Generated MITRE layer is not valid JSON. Cannot upload.")
+                    st.success("Selected components generated!")
+                    st.markdown("> **Want this automated?** [TI Mindmap Hub](https://ti-mindmap-hub.com/landingpage) generates these reports continuously from 50+ OSINT sources — no manual work required.")
 
             st.markdown("---")
+            render_token_budgets(st.session_state.get('token_budgets', {}))
             st.subheader("Generated Report Components:")
             # Display full original text if it was a URL source (markdown formatted)
             if st.session_state.get('input_source_type') == 'URL' and st.session_state.get('full_original_text'):
@@ -551,6 +884,10 @@ if st.session_state.show_tabs:
             if st.session_state.get('summary'):
                 st.markdown("### 🗺️ AI-Generated Summary")
                 st.markdown(st.session_state.summary)
+                if st.session_state.get('long_document_notes'):
+                    with st.expander("Section notes (long document mode)", expanded=False):
+                        st.caption("The document was too long for one prompt. Summary and mindmap were built from these section notes.")
+                        st.markdown(st.session_state.long_document_notes)
             
             if st.session_state.get('mindmap_code'):
                 st.markdown(f"### 🧠 {st.session_state.selected_mindmap_option} MindMap Visualization")
@@ -558,6 +895,7 @@ if st.session_state.show_tabs:
                     st_html(mermaid_chart_png(st.session_state.mindmap_code), width=1500, height=1500, scrolling=True)
                     st.link_button("Open Main MindMap in Mermaid.live", genPakoLink(st.session_state.mindmap_code))
                 else: 
+                    from streamlit_markmap import markmap # For Markmap visualization
                     markmap(st.session_state.mindmap_code, height=700)
                 with st.expander(f"View {st.session_state.selected_mindmap_option} Code"):
                     st.code(st.session_state.mindmap_code, language='mermaid' if st.session_state.selected_mindmap_option == "Mermaid" else 'markdown')
@@ -592,7 +930,7 @@ if st.session_state.show_tabs:
             
             if st.session_state.get('ttptable'):
                 st.markdown("### 📊 TTPs Overview Table")
-                st.markdown(st.session_state.ttptable) 
+                st.markdown(str(st.session_state.ttptable)) # TTPTable renders as the same Markdown table
             
             if st.session_state.get('attackpath'):
                 st.markdown("### 🕰️ TTPs Ordered by Execution Time")
@@ -607,7 +945,7 @@ if st.session_state.show_tabs:
             
             if st.session_state.get('5whats'):
                 st.markdown("### ❓ Threat Scope Report (5 Whats)")
-                st.markdown(st.session_state['5whats'])
+                st.markdown(str(st.session_state['5whats']))
             
             if st.session_state.get('mitre_layer_json_str'):
                 st.markdown("### 🗺️ MITRE ATT&CK® Navigator Layer")
@@ -713,15 +1051,16 @@ if st.session_state.show_tabs:
                         pdf_data_args["mindmap_mermaid_code"].strip(),
                         # pdf_data_args["mindmap_markmap_code"].strip(), # if you add markmap to PDF
                         isinstance(pdf_data_args["iocs_data"], pd.DataFrame) and not pdf_data_args["iocs_data"].empty or bool(pdf_data_args["iocs_data"]),
-                        pdf_data_args["ttps_overview_data"].strip(),
+                        str(pdf_data_args["ttps_overview_data"]).strip(), # Markdown string or ti_schemas.TTPTable
                         pdf_data_args["attack_path_data"].strip(),
                         pdf_data_args["mermaid_timeline_code"].strip(),
-                        pdf_data_args["five_whats_data"].strip()
+                        str(pdf_data_args["five_whats_data"]).strip()
                     ])
                     if not has_reportable_content:
                         st.warning("No significant content generated in 'Main Report Generation' tab to include in the PDF.")
                     else:
                         with st.spinner("Generating PDF report... This may take a moment."):
+                            import ti_pdf
                             pdf_bytes = ti_pdf.create_pdf_bytes(**pdf_data_args) # Ensure ti_pdf can handle these args
                         if pdf_bytes:
                             current_time_str = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -777,12 +1116,22 @@ if st.session_state.show_tabs:
             if submit_button_stix:
                 service_sel_stix = st.session_state.service_selection
                 # Global `deployment_name` is used by ti_stix functions
+
+                # Typed results from Tab 1 become STIX objects directly instead of being regenerated from the text
+                typed_sdos, typed_scos = [], []
+                if isinstance(st.session_state.get('ttptable'), ti_schemas.TTPTable):
+                    typed_sdos += ti_stix.ttp_table_to_stix(st.session_state.ttptable)
+                stix_iocs_df = st.session_state.get('iocs_df')
+                if isinstance(stix_iocs_df, pd.DataFrame) and not stix_iocs_df.empty:
+                    ioc_sdos, typed_scos = ti_stix.ioc_dataframe_to_stix(stix_iocs_df)
+                    typed_sdos += ioc_sdos
                 
                 with st.spinner("Generating STIX Domain Objects (SDOs)..."):
                     stix_sdo_json_str = ti_stix.sdo_stix(stix_text_source, client, service_sel_stix, deployment_name)
                     try:
                         stix_sdo_list = json.loads(stix_sdo_json_str)
                         stix_sdo_list = ti_stix.add_uuid_to_ids(stix_sdo_list) 
+                        stix_sdo_list = ti_stix.merge_stix_objects(stix_sdo_list, typed_sdos)
                         st.session_state.stix_sdo = json.dumps(stix_sdo_list, indent=4)
                     except Exception as e:
                         st.error(f"Error processing SDOs: {e}. Raw SDO JSON: {stix_sdo_json_str}")
@@ -790,15 +1139,19 @@ if st.session_state.show_tabs:
                 if st.session_state.get('stix_sdo'):
                     with st.expander("View Generated SDOs (JSON)"): st.json(st.session_state.stix_sdo)
 
-                with st.spinner("Generating STIX Cyber-observable Objects (SCOs)..."):
-                    stix_sco_json_str = ti_stix.sco_stix(stix_text_source, client, service_sel_stix, deployment_name)
-                    try:
-                        stix_sco_list = json.loads(stix_sco_json_str)
-                        stix_sco_list = ti_stix.add_uuid_to_ids(stix_sco_list)
-                        st.session_state.stix_sco = json.dumps(stix_sco_list, indent=4)
-                    except Exception as e:
-                        st.error(f"Error processing SCOs: {e}. Raw SCO JSON: {stix_sco_json_str}")
-                        st.session_state.stix_sco = stix_sco_json_str
+                if typed_scos:
+                    st.caption(f"SCOs built from the {len(stix_iocs_df)} extracted IOCs.")
+                    st.session_state.stix_sco = json.dumps(typed_scos, indent=4)
+                else:
+                    with st.spinner("Generating STIX Cyber-observable Objects (SCOs)..."):
+                        stix_sco_json_str = ti_stix.sco_stix(stix_text_source, client, service_sel_stix, deployment_name)
+                        try:
+                            stix_sco_list = json.loads(stix_sco_json_str)
+                            stix_sco_list = ti_stix.add_uuid_to_ids(stix_sco_list)
+                            st.session_state.stix_sco = json.dumps(stix_sco_list, indent=4)
+                        except Exception as e:
+                            st.error(f"Error processing SCOs: {e}. Raw SCO JSON: {stix_sco_json_str}")
+                            st.session_state.stix_sco = stix_sco_json_str
                 if st.session_state.get('stix_sco'):
                     with st.expander("View Generated SCOs (JSON)"): st.json(st.session_state.stix_sco)
                 
@@ -863,8 +1216,8 @@ if st.session_state.show_tabs:
         if original_content.strip():
             st.markdown(f"Below is the full original content from **{source_name}**.")
             
-            if len(original_content) > len(st.session_state.get('text', '')):
-                st.caption(":information_source: _Note: For AI processing, a truncated version of this content may have been used due to length._")
+            if any(report["trimmed"] for report in st.session_state.get('token_budgets', {}).values()):
+                st.caption(":information_source: _Note: This content exceeded the model's context window; some AI components were generated from a trimmed version (see the token budget in the Generate Reports tab)._")
 
             # If original was from URL, it's already markdown. Otherwise, it's raw text.
             if st.session_state.get('input_source_type') == 'URL':
@@ -905,4 +1258,8 @@ else:
         - No API keys or setup needed
         - 24/7 automated OSINT processing
         - STIX 2.1 export, IOC search, weekly briefings
-        """)
\ No newline at end of file
+        """)
+
+# --- Run Metrics ---
+with metrics_panel.container():
+    render_metrics_panel(st.session_state.metrics_run)
\ No newline at end of file